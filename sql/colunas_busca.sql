@@ -0,0 +1,34 @@
+-- Colunas de busca normalizadas (minúsculas, sem acentos, sem pontuação, sem stopwords e no singular).
+-- A normalização fica só em src/services/texto.py: a API preenche as colunas em toda escrita e
+-- aplica a mesma normalização ao termo buscado. Depois de rodar este script (e sempre que a
+-- normalização mudar), preencha/regrave os registros existentes com:
+--     python -m src.scripts.preencher_colunas_busca
+-- Registros gravados fora da API ficam sem a coluna de busca; as buscas por nome caem na coluna
+-- original quando a normalizada não encontra nada.
+create extension if not exists pg_trgm;
+
+alter table public.baseconhecimento
+    add column if not exists conteudo_busca text,
+    add column if not exists categoria_busca text,
+    add column if not exists nome_arquivo_busca text,
+    add column if not exists palavra_chave_busca text;
+
+alter table public.disciplina add column if not exists nome_disciplina_busca text;
+alter table public.professor add column if not exists nome_professor_busca text;
+alter table public.coordenador add column if not exists nome_coordenador_busca text;
+
+-- Índices de trigramas: atendem 'ilike ''%termo%''' sem varrer a tabela
+create index if not exists baseconhecimento_conteudo_busca_trgm_idx
+    on public.baseconhecimento using gin (conteudo_busca gin_trgm_ops);
+create index if not exists baseconhecimento_categoria_busca_trgm_idx
+    on public.baseconhecimento using gin (categoria_busca gin_trgm_ops);
+create index if not exists baseconhecimento_nome_arquivo_busca_trgm_idx
+    on public.baseconhecimento using gin (nome_arquivo_busca gin_trgm_ops);
+create index if not exists baseconhecimento_palavra_chave_busca_trgm_idx
+    on public.baseconhecimento using gin (palavra_chave_busca gin_trgm_ops);
+create index if not exists disciplina_nome_disciplina_busca_trgm_idx
+    on public.disciplina using gin (nome_disciplina_busca gin_trgm_ops);
+create index if not exists professor_nome_professor_busca_trgm_idx
+    on public.professor using gin (nome_professor_busca gin_trgm_ops);
+create index if not exists coordenador_nome_coordenador_busca_trgm_idx
+    on public.coordenador using gin (nome_coordenador_busca gin_trgm_ops);
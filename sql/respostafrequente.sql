@@ -0,0 +1,58 @@
+-- Respostas pré-geradas para as dúvidas mais frequentes dos alunos.
+-- Preenchida em segundo plano (src/routers/ia_services.py) e consultada antes da busca no /ia/gerar-resposta.
+create table if not exists public.respostafrequente (
+    id_resposta_frequente uuid primary key default gen_random_uuid(),
+    pergunta text not null,
+    pergunta_normalizada text not null unique,  -- minúsculas, sem acentos e sem pontuação
+    topico text,
+    ocorrencias integer not null default 0,     -- tamanho do grupo no dashboard de dúvidas frequentes
+    resposta text not null,
+    contextos jsonb not null default '[]'::jsonb,   -- contextos da base usados no prompt
+    documentos jsonb not null default '[]'::jsonb,  -- documentos (nome e URL) citados como fonte
+    gerado_em timestamptz not null default now()
+);
+
+-- Reserva (lease) da geração das respostas: com vários workers da API, só quem obtém a reserva
+-- gera as respostas; os outros apenas leem a tabela. A reserva expira sozinha se o worker cair.
+create table if not exists public.reservatarefa (
+    tarefa text primary key,
+    dono text not null,          -- host:pid:id do worker que detém a reserva
+    expira_em timestamptz not null,
+    base_alterada_em timestamptz  -- última escrita na base de conhecimento (respostas mais antigas não valem)
+);
+alter table public.reservatarefa add column if not exists base_alterada_em timestamptz;
+
+-- Obtém (ou renova, se já for do mesmo dono) a reserva da tarefa; retorna false se outro worker a detém.
+create or replace function public.adquirir_reserva(p_tarefa text, p_dono text, p_segundos integer)
+returns boolean
+language sql
+as $$
+    with obtida as (
+        insert into public.reservatarefa as r (tarefa, dono, expira_em)
+        values (p_tarefa, p_dono, now() + make_interval(secs => p_segundos))
+        on conflict (tarefa) do update
+            set dono = excluded.dono, expira_em = excluded.expira_em
+            where r.expira_em < now() or r.dono = excluded.dono
+        returning 1
+    )
+    select exists (select 1 from obtida);
+$$;
+
+-- A linha é mantida (só expira), para não perder o base_alterada_em
+create or replace function public.liberar_reserva(p_tarefa text, p_dono text)
+returns void
+language sql
+as $$
+    update public.reservatarefa set expira_em = now() where tarefa = p_tarefa and dono = p_dono;
+$$;
+
+-- Registra uma escrita na base de conhecimento; vale a mais recente entre as informadas pelos workers.
+create or replace function public.registrar_alteracao_base(p_tarefa text, p_alterada_em timestamptz)
+returns void
+language sql
+as $$
+    insert into public.reservatarefa as r (tarefa, dono, expira_em, base_alterada_em)
+    values (p_tarefa, '', now(), p_alterada_em)
+    on conflict (tarefa) do update
+        set base_alterada_em = greatest(r.base_alterada_em, excluded.base_alterada_em);
+$$;
@@ -0,0 +1,15 @@
+-- Trechos do texto dos documentos da base de conhecimento.
+-- Preenchida no upload (src/routers/documento.py) e usada na busca por parágrafos do /ia/gerar-resposta.
+create table if not exists public.trechoconhecimento (
+    id_trecho uuid primary key default gen_random_uuid(),
+    id_conhecimento uuid not null references public.baseconhecimento (id_conhecimento) on delete cascade,
+    ordem integer not null,
+    inicio integer not null,  -- posição (em caracteres) do início do trecho no texto extraído
+    fim integer not null,     -- posição (em caracteres) do fim do trecho no texto extraído
+    conteudo text not null,
+    criado_em timestamptz not null default now(),
+    unique (id_conhecimento, ordem)
+);
+
+create index if not exists trechoconhecimento_id_conhecimento_idx
+    on public.trechoconhecimento (id_conhecimento);
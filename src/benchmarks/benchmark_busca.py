@@ -0,0 +1,227 @@
+"""
+Benchmark offline da busca de contexto do /ia/gerar-resposta: qualidade (recall@k e MRR) e
+latência por pergunta (p50/p95/p99) de cada estratégia de recuperação, sobre um corpus fixo
+de registros de 'baseconhecimento' e um conjunto de perguntas rotuladas com os
+'id_conhecimento' esperados. O Supabase é substituído por um cliente em memória e o LLM pelo
+backend fake, então nenhuma chamada de rede é feita.
+
+Uso (na raiz do projeto):
+    python -m src.benchmarks.benchmark_busca
+    python -m src.benchmarks.benchmark_busca --latencia-banco-ms 20 --repeticoes 5
+    python -m src.benchmarks.benchmark_busca --estrategias planejada bm25 --json resultado.json
+    python -m src.benchmarks.benchmark_busca --corpus meu_corpus.json --perguntas minhas_perguntas.json
+
+Estratégias:
+    planejada       _buscar_contextos_da_base com as configurações atuais + empacotamento do prompt
+    completa        idem, mas sem término antecipado (todas as etapas rodam)
+    escopo          planejada restrita à disciplina da pergunta, como para um aluno matriculado nela
+    palavras_chave  só o índice de palavras-chave
+    bm25            só o índice BM25
+    vetorial        só o índice vetorial
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+DIRETORIO_DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados")
+CORPUS_PADRAO = os.path.join(DIRETORIO_DADOS, "corpus_baseconhecimento.json")
+PERGUNTAS_PADRAO = os.path.join(DIRETORIO_DADOS, "perguntas_rotuladas.json")
+
+ESTRATEGIAS = ["planejada", "completa", "escopo", "palavras_chave", "bm25", "vetorial"]
+
+
+def _ler_argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark offline de qualidade e latência da busca de contexto")
+    parser.add_argument("--corpus", default=CORPUS_PADRAO, help="JSON com as linhas de 'baseconhecimento'")
+    parser.add_argument("--perguntas", default=PERGUNTAS_PADRAO, help="JSON com as perguntas rotuladas")
+    parser.add_argument("--estrategias", nargs="+", choices=ESTRATEGIAS, default=ESTRATEGIAS)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10], help="Cortes do recall@k")
+    parser.add_argument("--latencia-banco-ms", type=float, default=0.0, help="Latência simulada de cada consulta ao banco")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Execuções de cada pergunta para medir a latência")
+    parser.add_argument("--json", help="Também grava o relatório neste arquivo")
+    parser.add_argument("--verboso", action="store_true", help="Mostra os logs da busca")
+    return parser.parse_args()
+
+
+def _configurar_ambiente(diretorio_indices: str) -> None:
+    # Precisa acontecer antes de importar src.config (as configurações são lidas na importação)
+    for variavel in ("SUPABASE_URL", "SUPABASE_SERVICE_KEY", "SUPABASE_ANON_KEY", "GOOGLE_API_KEY"):
+        os.environ.setdefault(variavel, "benchmark-offline")
+    os.environ.setdefault("WATCHER_TARGET_FOLDER", diretorio_indices)
+    os.environ["IA_LLM_BACKEND"] = "fake"
+    # Índices e cache de documentos num diretório temporário, sem tocar nos arquivos reais
+    os.environ["IA_INDICE_PALAVRAS_CHAVE_PATH"] = os.path.join(diretorio_indices, "indice_palavras_chave.json")
+    os.environ["IA_INDICE_VETORIAL_PATH"] = os.path.join(diretorio_indices, "indice_vetorial.npz")
+    os.environ["IA_CACHE_DOCUMENTOS_DIR"] = os.path.join(diretorio_indices, "documentos")
+    # Sem prazo por requisição: o benchmark mede a busca, não o corte por tempo
+    os.environ["IA_PRAZO_RESPOSTA_SEGUNDOS"] = "0"
+
+
+def _ler_json(caminho: str) -> list[dict]:
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _ids_dos_contextos(contextos: list[str], id_por_conteudo: dict[str, str]) -> list[str]:
+    """Ids dos registros de origem dos contextos, na mesma ordem e sem repetição."""
+    ids: list[str] = []
+    for contexto in contextos:
+        id_reg = id_por_conteudo.get(contexto)
+        if id_reg is not None and id_reg not in ids:
+            ids.append(id_reg)
+    return ids
+
+
+def _ids_dos_registros(resultados: list[tuple[dict, float]]) -> list[str]:
+    ids: list[str] = []
+    for registro, _ in resultados:
+        id_reg = str(registro.get("id_conhecimento"))
+        if id_reg not in ids:
+            ids.append(id_reg)
+    return ids
+
+
+def _criar_estrategias(id_por_conteudo: dict[str, str]) -> dict:
+    """Cada estratégia recebe (pergunta, id_disciplina) e devolve os ids recuperados em ordem."""
+    from ..config import settings
+    from ..routers import ia_services
+    from ..services import indice_bm25, indice_palavras_chave, indice_vetorial
+
+    limite = max(10, settings.IA_BUSCA_CONTEXTOS_SUFICIENTES)
+
+    async def _planejada(pergunta: str, disciplinas: frozenset[str] | None = None) -> list[str]:
+        ranqueados, _ = await ia_services._buscar_contextos_da_base(pergunta, disciplinas)
+        selecionados = ia_services.empacotar_contextos(
+            pergunta, [item.texto for item in ranqueados], settings.IA_CONTEXTO_ORCAMENTO_TOKENS,
+            relevancias=[item.score for item in ranqueados], maximo=settings.IA_CONTEXTO_MAX_CONTEXTOS,
+        )
+        return _ids_dos_contextos(selecionados, id_por_conteudo)
+
+    async def _completa(pergunta: str, id_disciplina: str | None) -> list[str]:
+        suficientes, orcamento = settings.IA_BUSCA_CONTEXTOS_SUFICIENTES, settings.IA_BUSCA_ORCAMENTO_MS
+        settings.IA_BUSCA_CONTEXTOS_SUFICIENTES, settings.IA_BUSCA_ORCAMENTO_MS = 0, 0
+        try:
+            return await _planejada(pergunta)
+        finally:
+            settings.IA_BUSCA_CONTEXTOS_SUFICIENTES, settings.IA_BUSCA_ORCAMENTO_MS = suficientes, orcamento
+
+    async def _escopo(pergunta: str, id_disciplina: str | None) -> list[str]:
+        return await _planejada(pergunta, frozenset([id_disciplina]) if id_disciplina else None)
+
+    def _indice(modulo):
+        async def _buscar(pergunta: str, id_disciplina: str | None) -> list[str]:
+            return _ids_dos_registros(await asyncio.to_thread(modulo.buscar, pergunta, limite))
+        return _buscar
+
+    return {
+        "planejada": lambda pergunta, id_disciplina: _planejada(pergunta),
+        "completa": _completa,
+        "escopo": _escopo,
+        "palavras_chave": _indice(indice_palavras_chave),
+        "bm25": _indice(indice_bm25),
+        "vetorial": _indice(indice_vetorial),
+    }
+
+
+def _avaliar(recuperados: list[str], esperados: list[str], cortes: list[int]) -> dict:
+    esperados_set = set(esperados)
+    recall = {k: len(esperados_set & set(recuperados[:k])) / len(esperados_set) for k in cortes}
+    posicao = next((i for i, id_reg in enumerate(recuperados, 1) if id_reg in esperados_set), None)
+    return {"recall": recall, "rr": 1 / posicao if posicao else 0.0}
+
+
+async def _executar(args: argparse.Namespace, cliente) -> dict:
+    import numpy as np
+    from ..config import settings
+    from ..services import indice_bm25, indice_palavras_chave, indice_vetorial, trechos_documento
+
+    corpus = cliente.tabelas["baseconhecimento"]
+    id_por_conteudo = {r["conteudo_processado"]: str(r["id_conhecimento"]) for r in corpus if r.get("conteudo_processado")}
+    perguntas = [p for p in _ler_json(args.perguntas) if p.get("esperados")]
+    estrategias = _criar_estrategias(id_por_conteudo)
+
+    # Aquece os índices locais para não medir a construção inicial como latência de busca
+    for modulo in (indice_bm25, indice_palavras_chave, indice_vetorial, trechos_documento):
+        await asyncio.to_thread(modulo.garantir_indice)
+
+    relatorio = {
+        "corpus": len(corpus),
+        "perguntas": len(perguntas),
+        "latencia_banco_ms": args.latencia_banco_ms,
+        "configuracao": {
+            "IA_BUSCA_CONTEXTOS_SUFICIENTES": settings.IA_BUSCA_CONTEXTOS_SUFICIENTES,
+            "IA_BUSCA_RELEVANCIA_MINIMA": settings.IA_BUSCA_RELEVANCIA_MINIMA,
+            "IA_BUSCA_ORCAMENTO_MS": settings.IA_BUSCA_ORCAMENTO_MS,
+        },
+        "estrategias": {},
+    }
+    for nome in args.estrategias:
+        buscar = estrategias[nome]
+        recalls = {k: [] for k in args.k}
+        rrs, duracoes = [], []
+        consultas_antes = sum(cliente.consultas.values())
+        for item in perguntas:
+            for _ in range(max(1, args.repeticoes)):
+                inicio = time.perf_counter()
+                recuperados = await buscar(item["pergunta"], item.get("id_disciplina"))
+                duracoes.append((time.perf_counter() - inicio) * 1000)
+            avaliacao = _avaliar(recuperados, [str(e) for e in item["esperados"]], args.k)
+            for k in args.k:
+                recalls[k].append(avaliacao["recall"][k])
+            rrs.append(avaliacao["rr"])
+        execucoes = len(perguntas) * max(1, args.repeticoes)
+        p50, p95, p99 = np.percentile(duracoes, [50, 95, 99]) if duracoes else (0.0, 0.0, 0.0)
+        relatorio["estrategias"][nome] = {
+            "recall": {f"@{k}": round(float(np.mean(v)), 4) if v else 0.0 for k, v in recalls.items()},
+            "mrr": round(float(np.mean(rrs)), 4) if rrs else 0.0,
+            "latencia_ms": {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)},
+            "consultas_banco_por_pergunta": round((sum(cliente.consultas.values()) - consultas_antes) / execucoes, 2)
+            if execucoes else 0.0,
+        }
+    return relatorio
+
+
+def _imprimir_relatorio(relatorio: dict, cortes: list[int]) -> None:
+    print("\n================ RESULTADO ================")
+    print(f"Corpus: {relatorio['corpus']} registros | Perguntas rotuladas: {relatorio['perguntas']} "
+          f"| Latência simulada do banco: {relatorio['latencia_banco_ms']:.0f} ms")
+    colunas_recall = "".join(f"{f'R@{k}':>8}" for k in cortes)
+    print(f"{'estratégia':<16}{colunas_recall}{'MRR':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'banco':>8}  (ms | consultas/pergunta)")
+    for nome, resultado in relatorio["estrategias"].items():
+        recall = "".join(f"{resultado['recall'][f'@{k}']:>8.3f}" for k in cortes)
+        latencia = resultado["latencia_ms"]
+        print(f"{nome:<16}{recall}{resultado['mrr']:>8.3f}{latencia['p50']:>9.2f}{latencia['p95']:>9.2f}"
+              f"{latencia['p99']:>9.2f}{resultado['consultas_banco_por_pergunta']:>8.2f}")
+
+
+def main() -> None:
+    args = _ler_argumentos()
+    with tempfile.TemporaryDirectory(prefix="benchmark_busca_") as diretorio_indices:
+        _configurar_ambiente(diretorio_indices)
+        # O cliente em memória precisa estar instalado antes de importar os módulos que usam o Supabase
+        from .supabase_memoria import SupabaseMemoria, instalar
+
+        cliente = SupabaseMemoria(
+            {"baseconhecimento": _ler_json(args.corpus), "trechoconhecimento": [], "alunodisciplina": []},
+            latencia_ms=args.latencia_banco_ms,
+        )
+        instalar(cliente)
+        saida = contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())
+        with saida:
+            relatorio = asyncio.run(_executar(args, cliente))
+
+    _imprimir_relatorio(relatorio, args.k)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"\nRelatório gravado em {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
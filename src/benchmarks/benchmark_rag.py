@@ -0,0 +1,169 @@
+"""
+Benchmark de latência do pipeline RAG do /ia/gerar-resposta usando o backend fake do LLM
+(nenhuma chamada ao Gemini é feita; as consultas ao Supabase configurado no .env são reais).
+
+Uso (na raiz do projeto):
+    python -m src.benchmarks.benchmark_rag --requisicoes 100 --concorrencia 10 --latencia 0.8
+    python -m src.benchmarks.benchmark_rag --perguntas perguntas.txt --taxa-falha 0.05
+    python -m src.benchmarks.benchmark_rag --documento exemplo.pdf   # inclui o pipeline de upload
+
+Mostra a vazão e os percentis p50/p95/p99 de cada etapa.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict
+
+PERGUNTAS_PADRAO = [
+    "Quando é a prova NP1?",
+    "Qual o prazo de entrega do TCC?",
+    "Quantas horas complementares são obrigatórias?",
+    "Como funciona o estágio supervisionado?",
+    "O que é o modelo COCOMO?",
+    "Qual a nota mínima para aprovação?",
+    "Quais são as regras da APS?",
+    "Quando é a avaliação substitutiva?",
+]
+
+
+def _ler_argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline RAG com o backend fake do LLM")
+    parser.add_argument("--requisicoes", type=int, default=50, help="Total de perguntas enviadas")
+    parser.add_argument("--concorrencia", type=int, default=8, help="Perguntas processadas ao mesmo tempo")
+    parser.add_argument("--perguntas", help="Arquivo com uma pergunta por linha (padrão: lista interna)")
+    parser.add_argument("--latencia", type=float, default=1.0, help="Latência simulada do LLM, em segundos")
+    parser.add_argument("--taxa-falha", type=float, default=0.0, help="Probabilidade de erro 429/503 simulado")
+    parser.add_argument("--requisicoes-por-minuto", type=float, help="Sobrescreve a taxa máxima do gateway (IA_GEMINI_REQUISICOES_POR_MINUTO)")
+    parser.add_argument("--com-cache", action="store_true", help="Mantém o cache de respostas ligado")
+    parser.add_argument("--documento", help="Arquivo (PDF, DOCX ou TXT) para medir também o pipeline de upload")
+    return parser.parse_args()
+
+
+def _configurar_ambiente(args: argparse.Namespace) -> None:
+    # Precisa acontecer antes de importar src.config (as configurações são lidas na importação)
+    os.environ["IA_LLM_BACKEND"] = "fake"
+    os.environ["IA_LLM_FAKE_LATENCIA_SEGUNDOS"] = str(args.latencia)
+    os.environ["IA_LLM_FAKE_TAXA_FALHA"] = str(args.taxa_falha)
+    os.environ.setdefault("IA_LLM_FAKE_SEMENTE", "42")
+    if args.requisicoes_por_minuto:
+        os.environ["IA_GEMINI_REQUISICOES_POR_MINUTO"] = str(args.requisicoes_por_minuto)
+
+
+class Cronometro:
+    """Guarda a duração de cada chamada das funções instrumentadas, por etapa."""
+
+    def __init__(self):
+        self.duracoes: dict[str, list[float]] = defaultdict(list)
+        self.erros: dict[str, int] = defaultdict(int)
+
+    def instrumentar(self, modulo, nome_funcao: str, etapa: str) -> None:
+        original = getattr(modulo, nome_funcao)
+        cronometro = self
+
+        if asyncio.iscoroutinefunction(original):
+            async def instrumentada(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                except BaseException:
+                    cronometro.erros[etapa] += 1
+                    raise
+                finally:
+                    cronometro.duracoes[etapa].append(time.perf_counter() - inicio)
+        else:
+            def instrumentada(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                except BaseException:
+                    cronometro.erros[etapa] += 1
+                    raise
+                finally:
+                    cronometro.duracoes[etapa].append(time.perf_counter() - inicio)
+
+        setattr(modulo, nome_funcao, instrumentada)
+
+
+def _imprimir_relatorio(cronometro: Cronometro, tempo_total: float, requisicoes: int) -> None:
+    import numpy as np
+
+    print("\n================ RESULTADO ================")
+    print(f"Requisições: {requisicoes} em {tempo_total:.2f}s -> vazão de {requisicoes / tempo_total:.2f} req/s")
+    print(f"{'etapa':<16}{'n':>6}{'erros':>7}{'média':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for etapa, duracoes in cronometro.duracoes.items():
+        ms = np.array(duracoes) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        print(f"{etapa:<16}{len(ms):>6}{cronometro.erros[etapa]:>7}{ms.mean():>10.1f}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+
+
+async def _executar(args: argparse.Namespace) -> None:
+    from ..routers import documento, ia_services
+    from ..services import trechos_documento
+    from ..services.cache_respostas import cache_respostas
+    from ..services.gateway_llm import gateway_llm
+
+    if args.perguntas:
+        with open(args.perguntas, "r", encoding="utf-8") as f:
+            perguntas = [linha.strip() for linha in f if linha.strip()]
+    else:
+        perguntas = PERGUNTAS_PADRAO
+
+    if not args.com_cache:
+        cache_respostas.obter = lambda chave: None
+
+    cronometro = Cronometro()
+    cronometro.instrumentar(ia_services, "_buscar_contextos_da_base", "busca")
+    cronometro.instrumentar(ia_services, "empacotar_contextos", "empacotamento")
+    cronometro.instrumentar(ia_services, "_processar_documentos_em_paralelo", "documentos")
+    cronometro.instrumentar(gateway_llm, "gerar", "llm")
+    cronometro.instrumentar(ia_services, "_gerar_resposta", "total")
+    if args.documento:
+        cronometro.instrumentar(documento, "_processar_com_gemini", "upload_resumo")
+        cronometro.instrumentar(trechos_documento, "extrair_texto", "upload_texto")
+        cronometro.instrumentar(trechos_documento, "dividir_em_trechos", "upload_trechos")
+
+    # Aquece os índices locais para não medir a construção inicial como latência de busca
+    await ia_services._buscar_contextos_da_base(perguntas[0])
+    cronometro.duracoes.clear()
+
+    semaforo = asyncio.Semaphore(args.concorrencia)
+
+    async def _perguntar(i: int) -> None:
+        async with semaforo:
+            try:
+                await ia_services._gerar_resposta(perguntas[i % len(perguntas)], None)
+            except Exception as e:
+                print(f"   [Benchmark] Pergunta {i} falhou: {e}")
+
+    async def _enviar_documento() -> None:
+        async with semaforo:
+            content_type = {
+                ".pdf": "application/pdf",
+                ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                ".txt": "text/plain",
+            }.get(os.path.splitext(args.documento)[1].lower(), "application/pdf")
+            await documento._processar_com_gemini(args.documento, content_type)
+            texto = await asyncio.to_thread(trechos_documento.extrair_texto, args.documento, content_type)
+            trechos_documento.dividir_em_trechos(texto)
+
+    inicio = time.perf_counter()
+    tarefas = [_perguntar(i) for i in range(args.requisicoes)]
+    if args.documento:
+        tarefas += [_enviar_documento() for _ in range(max(1, args.requisicoes // 10))]
+    await asyncio.gather(*tarefas)
+    tempo_total = time.perf_counter() - inicio
+
+    _imprimir_relatorio(cronometro, tempo_total, args.requisicoes)
+    print(f"\nGateway: {gateway_llm.metricas()}")
+
+
+def main() -> None:
+    args = _ler_argumentos()
+    _configurar_ambiente(args)
+    asyncio.run(_executar(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Substituto em memória do cliente do Supabase para os benchmarks offline.
+
+Implementa o subconjunto da API do supabase-py usado na leitura da base de conhecimento
+(select, eq, neq, in_, is_, ilike, or_, order, limit, range e a RPC 'buscar_conteudo'),
+com uma latência fixa por consulta para simular a ida e volta ao banco. As colunas de busca
+normalizadas ('_busca') são preenchidas ao carregar as linhas, como a API faz na escrita.
+
+Uso: instalar(SupabaseMemoria(...)) antes de importar os módulos de src que usam o cliente.
+"""
+import re
+import sys
+import time
+import types
+from collections import Counter
+
+from ..services import texto
+
+
+class RespostaMemoria:
+    def __init__(self, data: list[dict]):
+        self.data = data
+        self.count = len(data)
+
+
+def _separar_nivel_superior(expressao: str) -> list[str]:
+    """Divide 'a,b(c,d),"e,f"' nas vírgulas que não estão entre parênteses nem entre aspas."""
+    partes, atual, profundidade, entre_aspas = [], [], 0, False
+    for caractere in expressao:
+        if caractere == '"':
+            entre_aspas = not entre_aspas
+        elif not entre_aspas and caractere == "(":
+            profundidade += 1
+        elif not entre_aspas and caractere == ")":
+            profundidade -= 1
+        elif caractere == "," and not profundidade and not entre_aspas:
+            partes.append("".join(atual))
+            atual = []
+            continue
+        atual.append(caractere)
+    partes.append("".join(atual))
+    return [parte.strip() for parte in partes if parte.strip()]
+
+
+def _padrao_para_regex(padrao: str) -> re.Pattern:
+    # No ilike o curinga é '%' (ou '*' dentro de um filtro 'or' do PostgREST)
+    regex = "".join(".*" if c in "%*" else re.escape(c) for c in padrao)
+    return re.compile(f"^{regex}$", re.IGNORECASE | re.DOTALL)
+
+
+def _condicao(coluna: str, operador: str, valor):
+    """Função linha -> bool equivalente ao filtro 'coluna=operador.valor' do PostgREST."""
+    if operador == "eq":
+        return lambda linha: str(linha.get(coluna)) == str(valor)
+    if operador == "neq":
+        return lambda linha: str(linha.get(coluna)) != str(valor)
+    if operador == "in":
+        valores = {str(v) for v in valor}
+        return lambda linha: str(linha.get(coluna)) in valores
+    if operador == "is":
+        esperado = {"null": None, "true": True, "false": False}[str(valor).lower()]
+        return lambda linha: linha.get(coluna) is esperado
+    if operador in ("ilike", "like"):
+        regex = _padrao_para_regex(str(valor))
+        if operador == "like":
+            regex = re.compile(regex.pattern, re.DOTALL)
+        return lambda linha: linha.get(coluna) is not None and bool(regex.match(str(linha.get(coluna))))
+    raise NotImplementedError(f"Operador '{operador}' não suportado pelo Supabase em memória")
+
+
+def _condicao_postgrest(filtro: str):
+    """Interpreta uma condição do filtro 'or' (ex.: 'coluna.ilike."*termo*"' ou 'coluna.in.(a,b)')."""
+    coluna, operador, valor = filtro.split(".", 2)
+    if operador == "in":
+        valor = [v.strip().strip('"') for v in valor.strip("()").split(",") if v.strip()]
+    else:
+        valor = valor.strip('"')
+    return _condicao(coluna, operador, valor)
+
+
+class ConsultaMemoria:
+    def __init__(self, cliente: "SupabaseMemoria", tabela: str):
+        self._cliente = cliente
+        self._tabela = tabela
+        self._colunas: list[str] | None = None
+        self._filtros: list = []
+        self._ordem: list[tuple[str, bool]] = []
+        self._limite: int | None = None
+        self._intervalo: tuple[int, int] | None = None
+
+    def select(self, colunas: str = "*", **kwargs) -> "ConsultaMemoria":
+        # Recursos embutidos ('tabela!inner(...)') não são suportados e ficam de fora da projeção
+        nomes = [c for c in _separar_nivel_superior(colunas) if "(" not in c]
+        self._colunas = None if "*" in nomes else nomes
+        return self
+
+    def eq(self, coluna: str, valor) -> "ConsultaMemoria":
+        self._filtros.append(_condicao(coluna, "eq", valor))
+        return self
+
+    def neq(self, coluna: str, valor) -> "ConsultaMemoria":
+        self._filtros.append(_condicao(coluna, "neq", valor))
+        return self
+
+    def in_(self, coluna: str, valores) -> "ConsultaMemoria":
+        self._filtros.append(_condicao(coluna, "in", valores))
+        return self
+
+    def is_(self, coluna: str, valor) -> "ConsultaMemoria":
+        self._filtros.append(_condicao(coluna, "is", "null" if valor is None else valor))
+        return self
+
+    def ilike(self, coluna: str, padrao: str) -> "ConsultaMemoria":
+        self._filtros.append(_condicao(coluna, "ilike", padrao))
+        return self
+
+    def like(self, coluna: str, padrao: str) -> "ConsultaMemoria":
+        self._filtros.append(_condicao(coluna, "like", padrao))
+        return self
+
+    def or_(self, filtros: str, **kwargs) -> "ConsultaMemoria":
+        condicoes = [_condicao_postgrest(f) for f in _separar_nivel_superior(filtros)]
+        self._filtros.append(lambda linha: any(condicao(linha) for condicao in condicoes))
+        return self
+
+    def order(self, coluna: str, desc: bool = False, **kwargs) -> "ConsultaMemoria":
+        self._ordem.append((coluna, desc))
+        return self
+
+    def limit(self, quantidade: int, **kwargs) -> "ConsultaMemoria":
+        self._limite = quantidade
+        return self
+
+    def range(self, inicio: int, fim: int, **kwargs) -> "ConsultaMemoria":
+        self._intervalo = (inicio, fim)
+        return self
+
+    def execute(self) -> RespostaMemoria:
+        self._cliente._registrar_consulta(self._tabela)
+        linhas = [l for l in self._cliente.tabelas.get(self._tabela, []) if all(f(l) for f in self._filtros)]
+        for coluna, desc in reversed(self._ordem):
+            linhas.sort(key=lambda l: (l.get(coluna) is None, l.get(coluna)), reverse=desc)
+        if self._intervalo:
+            linhas = linhas[self._intervalo[0]:self._intervalo[1] + 1]
+        if self._limite is not None:
+            linhas = linhas[:self._limite]
+        if self._colunas is not None:
+            linhas = [{c: l.get(c) for c in self._colunas} for l in linhas]
+        return RespostaMemoria([dict(l) for l in linhas])
+
+
+class RpcMemoria:
+    def __init__(self, cliente: "SupabaseMemoria", funcao: str, parametros: dict):
+        self._cliente = cliente
+        self._funcao = funcao
+        self._parametros = parametros
+
+    def execute(self) -> RespostaMemoria:
+        self._cliente._registrar_consulta(f"rpc:{self._funcao}")
+        if self._funcao != "buscar_conteudo":
+            raise NotImplementedError(f"RPC '{self._funcao}' não suportada pelo Supabase em memória")
+        return RespostaMemoria(self._cliente.buscar_conteudo(self._parametros.get("query", "")))
+
+
+class SupabaseMemoria:
+    """Cliente do Supabase sobre tabelas em memória (listas de dicionários), só para leitura."""
+
+    def __init__(self, tabelas: dict[str, list[dict]], latencia_ms: float = 0.0):
+        self.tabelas = {
+            nome: [{**linha, **texto.colunas_de_busca(nome, linha)} for linha in linhas]
+            for nome, linhas in tabelas.items()
+        }
+        self.latencia_ms = latencia_ms
+        self.consultas: Counter = Counter()
+
+    def _registrar_consulta(self, alvo: str) -> None:
+        self.consultas[alvo] += 1
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+
+    def table(self, nome: str) -> ConsultaMemoria:
+        return ConsultaMemoria(self, nome)
+
+    def from_(self, nome: str) -> ConsultaMemoria:
+        return self.table(nome)
+
+    def rpc(self, funcao: str, parametros: dict | None = None) -> RpcMemoria:
+        return RpcMemoria(self, funcao, parametros or {})
+
+    def buscar_conteudo(self, consulta: str, limite: int = 10) -> list[dict]:
+        """
+        Aproximação da RPC 'buscar_conteudo' (busca textual do Postgres, como plainto_tsquery):
+        registros publicados que contêm todos os termos da consulta, os com mais ocorrências primeiro.
+        """
+        termos = texto.termos(consulta)
+        if not termos:
+            return []
+        encontrados = []
+        for linha in self.tabelas.get("baseconhecimento", []):
+            palavras = Counter((linha.get("conteudo_busca") or "").split())
+            if linha.get("status") == "publicado" and all(palavras[t] for t in termos):
+                encontrados.append((sum(palavras[t] for t in termos), linha))
+        encontrados.sort(key=lambda x: -x[0])
+        return [dict(linha) for _, linha in encontrados[:limite]]
+
+
+def instalar(cliente: SupabaseMemoria) -> None:
+    """
+    Faz 'from ..supabase_client import supabase' devolver o cliente em memória. Precisa ser
+    chamado antes da importação de qualquer módulo de src que use o cliente (nenhuma conexão
+    com o Supabase real é criada).
+    """
+    nome_modulo = __name__.split(".")[0] + ".supabase_client"
+    modulo = types.ModuleType(nome_modulo)
+    modulo.supabase = cliente
+    sys.modules[nome_modulo] = modulo
@@ -8,6 +8,129 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: str
     WATCHER_TARGET_FOLDER: str
 
+    # Índice local (BM25) da base de conhecimento usado pelo /ia/gerar-resposta
+    IA_INDICE_TTL_SEGUNDOS: int = 300  # Reconstrói o índice em segundo plano após esse tempo
+    IA_BUSCA_MAX_PARALELISMO: int = 8  # Consultas simultâneas ao Supabase durante a busca de contexto
+    IA_INDICE_PALAVRAS_CHAVE_PATH: str = "./dados_ia/indice_palavras_chave.json"  # Índice palavra-chave -> documentos
+    IA_INDICE_PALAVRAS_CHAVE_SALVAR_SEGUNDOS: int = 30  # Intervalo máximo entre uma escrita na base e a gravação do índice em disco
+
+    # Índice vetorial local (busca semântica sem depender da RPC 'buscar_conteudo')
+    IA_INDICE_VETORIAL_PATH: str = "./dados_ia/indice_vetorial.npz"
+    IA_INDICE_VETORIAL_DIMENSAO: int = 512
+    IA_INDICE_VETORIAL_IVF_LISTAS: int = 0  # 0 = busca exata; > 0 = busca aproximada por partições
+    IA_INDICE_VETORIAL_IVF_SONDAS: int = 4  # Partições consultadas por busca no modo aproximado
+    IA_INDICE_VETORIAL_SCORE_MINIMO: float = 0.1  # Similaridade mínima para aceitar um resultado
+    IA_INDICE_VETORIAL_SALVAR_SEGUNDOS: int = 30  # Intervalo máximo entre uma escrita na base e a gravação do índice em disco
+
+    # Cache de respostas do /ia/gerar-resposta (LRU + TTL, invalidado a cada escrita na base)
+    IA_CACHE_RESPOSTAS_MAXIMO: int = 500
+    IA_CACHE_RESPOSTAS_TTL_SEGUNDOS: int = 3600
+
+    # Perguntas sem contexto (nada na base nem enviado pelo chamador): a resposta padrão é devolvida
+    # sem chamar o Gemini, e a pergunta fica num cache negativo (invalidado a cada escrita na base)
+    IA_SEM_CONTEXTO_CURTO_CIRCUITO: bool = True
+    IA_CACHE_NEGATIVO_MAXIMO: int = 1000
+    IA_CACHE_NEGATIVO_TTL_SEGUNDOS: int = 600
+
+    # Cache em disco dos documentos baixados no fallback do /ia/gerar-resposta
+    IA_CACHE_DOCUMENTOS_DIR: str = "./dados_ia/documentos"
+    IA_CACHE_DOCUMENTOS_MAX_MB: int = 200
+    IA_CACHE_DOCUMENTOS_REVALIDAR_SEGUNDOS: int = 300  # Intervalo mínimo entre revalidações (ETag/Last-Modified)
+    IA_CACHE_DOCUMENTOS_SALVAR_SEGUNDOS: int = 60  # Intervalo máximo entre um acerto no cache e a gravação do último acesso
+
+    # Fallback por documento quando a base não tem contexto suficiente
+    IA_MAX_DOCUMENTOS_FALLBACK: int = 3  # Quantidade máxima de documentos processados por pergunta
+    IA_DOCUMENTO_TIMEOUT_SEGUNDOS: float = 20  # Tempo máximo para processar cada documento
+    IA_DOCUMENTOS_PRAZO_SEGUNDOS: float = 30  # Prazo total; documentos que não terminarem são descartados
+
+    # Trechos do texto dos documentos (tabela 'trechoconhecimento')
+    IA_TRECHOS_TAMANHO_CARACTERES: int = 1200
+    IA_TRECHOS_SOBREPOSICAO_CARACTERES: int = 200  # Caracteres repetidos entre trechos vizinhos
+    IA_TRECHOS_MAX_RESULTADOS: int = 8  # Trechos retornados por pergunta
+
+    # Busca de contexto em etapas (fontes baratas e precisas primeiro, parada antecipada)
+    IA_BUSCA_CONTEXTOS_SUFICIENTES: int = 5  # Contextos relevantes para encerrar a busca; 0 = roda todas as etapas
+    IA_BUSCA_RELEVANCIA_MINIMA: float = 0.6  # Relevância (0 a 1) para um resultado contar como relevante
+    IA_BUSCA_ORCAMENTO_MS: float = 1500  # Depois disso, as etapas restantes não são iniciadas; 0 = sem limite
+
+    # Ranking híbrido: fusão das posições de cada etapa da busca (reciprocal rank fusion)
+    IA_RRF_K: int = 60  # Constante k de peso / (k + posição); maior = posições pesam menos
+    IA_RRF_PESOS: dict[str, float] = {
+        "busca_palavras_chave": 1.0,
+        "busca_bm25": 1.0,
+        "busca_vetorial": 0.8,
+        "busca_trechos": 0.7,
+        "busca_rpc": 1.0,
+        "busca_conteudo_ilike": 1.2,
+        "busca_categoria_ilike": 0.6,
+    }  # Etapas fora da lista têm peso 1
+
+    # Roteador de intenções: perguntas sobre horário de aula, professor da disciplina, provas e
+    # prazos de trabalhos são respondidas direto das tabelas, sem busca na base nem Gemini
+    IA_INTENCOES_ATIVO: bool = True
+    IA_INTENCOES_TTL_SEGUNDOS: int = 300  # Validade da cópia em memória das tabelas
+    IA_INTENCOES_MAX_ITENS: int = 8  # Com mais itens que isso na resposta, a pergunta segue para o RAG
+
+    # Busca restrita às disciplinas em que o aluno está matriculado (tabela 'alunodisciplina')
+    IA_ESCOPO_MATRICULAS_ATIVO: bool = True
+    IA_ESCOPO_MATRICULAS_TTL_SEGUNDOS: int = 600  # Tempo que as matrículas de um aluno ficam em memória
+
+    # Prazo do /ia/gerar-resposta e resposta degradada
+    IA_PRAZO_RESPOSTA_SEGUNDOS: float = 25  # Depois disso, devolve os trechos mais relevantes e os links; 0 = sem prazo
+    IA_PRAZO_RESERVA_GERACAO_SEGUNDOS: float = 8  # Parte do prazo que a busca e os documentos deixam para o Gemini
+    IA_RESPOSTA_DEGRADADA_TRECHOS: int = 3  # Trechos da base devolvidos na resposta degradada
+    IA_RESPOSTA_DEGRADADA_MAX_CARACTERES: int = 600  # Tamanho máximo de cada trecho
+    IA_HEDGE_ATIVO: bool = True  # Envia uma segunda chamada ao Gemini quando a primeira passa do percentil abaixo
+    IA_HEDGE_PERCENTIL: float = 0.95
+    IA_HEDGE_AMOSTRAS_MINIMAS: int = 20  # Gerações concluídas ('geracao_concluida') necessárias antes de usar o percentil
+
+    # Empacotamento do contexto no prompt do /ia/gerar-resposta
+    IA_CONTEXTO_ORCAMENTO_TOKENS: int = 6000  # Tokens estimados (caracteres / 4) reservados para o contexto
+    IA_CONTEXTO_MAX_CONTEXTOS: int = 6  # Contextos da base (os mais bem ranqueados) por prompt; 0 = só o orçamento limita
+
+    # Cache do prefixo do prompt (instruções + contextos selecionados frequentes) no provedor do LLM
+    IA_CACHE_PREFIXO_ATIVO: bool = True
+    IA_CACHE_PREFIXO_MIN_TOKENS: int = 1024  # Menor prefixo aceito pelo Gemini para cache explícito
+    IA_CACHE_PREFIXO_MIN_USOS: int = 3  # Perguntas com os mesmos contextos selecionados (dentro do TTL) para registrar o prefixo
+    IA_CACHE_PREFIXO_TTL_SEGUNDOS: int = 3600
+
+    # Respostas pré-geradas para as dúvidas frequentes (tabela 'respostafrequente')
+    IA_FAQ_ATIVO: bool = True
+    IA_FAQ_MAX_PERGUNTAS: int = 20  # Grupos mais frequentes do dashboard que recebem resposta pré-gerada
+    IA_FAQ_SIMILARIDADE_MINIMA: float = 0.8  # Jaccard mínimo entre a pergunta e o grupo para usar a resposta
+    IA_FAQ_INTERVALO_SEGUNDOS: int = 3600  # Idade máxima de uma resposta antes de ser gerada de novo
+    IA_FAQ_VERIFICACAO_SEGUNDOS: int = 60  # Intervalo da tarefa de segundo plano
+    IA_FAQ_ESPERA_ALTERACOES_SEGUNDOS: int = 120  # Tempo sem escritas na base antes de gerar as respostas de novo
+    IA_FAQ_LEASE_SEGUNDOS: int = 900  # Validade da reserva de um worker para gerar as respostas (maior que uma geração)
+
+    # Métricas de latência por etapa (GET /ia/metricas)
+    IA_METRICAS_SERVER_TIMING: bool = False  # Devolve as durações no cabeçalho Server-Timing (depuração)
+
+    # Endpoint em lote /ia/gerar-respostas
+    IA_LOTE_MAX_PERGUNTAS: int = 50
+    IA_LOTE_MAX_PARALELISMO: int = 4  # Buscas e chamadas ao Gemini simultâneas dentro de um lote
+    IA_LOTE_PERGUNTAS_POR_CHAMADA: int = 5  # Máximo de perguntas respondidas numa mesma chamada ao Gemini
+    IA_LOTE_SOBREPOSICAO_MINIMA: float = 0.5  # Fração dos contextos em comum para agrupar duas perguntas
+
+    # Gateway das chamadas ao Gemini (concorrência, taxa e retentativas)
+    IA_GEMINI_MODELO: str = "gemini-2.5-flash"
+    IA_GEMINI_MAX_CONCORRENCIA: int = 4  # Chamadas simultâneas ao Gemini por worker
+    IA_GEMINI_REQUISICOES_POR_MINUTO: float = 60  # Taxa máxima (token bucket) por worker
+    IA_GEMINI_RAJADA: int = 10  # Requisições que podem sair de uma vez antes de aplicar a taxa
+    IA_GEMINI_MAX_TENTATIVAS: int = 4  # Tentativas por chamada em caso de erro temporário (429, 503...)
+    IA_GEMINI_ORCAMENTO_RETENTATIVAS_SEGUNDOS: float = 20  # Tempo máximo gasto com retentativas por chamada
+    IA_GEMINI_BACKOFF_BASE_SEGUNDOS: float = 0.5
+    IA_GEMINI_BACKOFF_MAX_SEGUNDOS: float = 8
+    IA_GEMINI_ESPERA_MAXIMA_SEGUNDOS: float = 30  # Espera máxima na fila antes de recusar a chamada
+
+    # Backend do modelo de linguagem: "gemini" ou "fake" (local, para testes de carga sem gastar cota)
+    IA_LLM_BACKEND: str = "gemini"
+    IA_LLM_FAKE_LATENCIA_SEGUNDOS: float = 1.0
+    IA_LLM_FAKE_VARIACAO_LATENCIA: float = 0.3  # Variação aleatória da latência (fração, para mais ou para menos)
+    IA_LLM_FAKE_TAXA_FALHA: float = 0.0  # Probabilidade de erro temporário (429/503) em cada chamada
+    IA_LLM_FAKE_RESPOSTA_JSON: str = '{"resumo": "Resumo simulado do documento.", "palavras_chave": ["teste", "simulado"]}'
+    IA_LLM_FAKE_SEMENTE: int | None = None  # Semente do gerador aleatório (resultados reproduzíveis)
+
 
     class Config:
         env_file = ".env"
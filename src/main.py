@@ -1,11 +1,33 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from .config import settings
+from .services import indice_palavras_chave, indice_vetorial
+from .services.cache_documentos import cache_documentos
 from .routers import auth, alunos, professores, coordenador, curso, curso_disciplina, disciplina, avaliacao, cronograma, aviso, base_conhecimento, msg_aluno, documento, ia_services, trabalho_academico
 
+# Executado na inicialização de cada worker da API
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Carrega o índice vetorial da base de conhecimento salvo em disco (se existir)
+    indice_vetorial.carregar_do_disco()
+    # Mantém as respostas das dúvidas frequentes carregadas em memória (só o worker com a reserva no banco as gera)
+    tarefa_faq = asyncio.create_task(ia_services.manter_respostas_frequentes()) if settings.IA_FAQ_ATIVO else None
+    yield
+    if tarefa_faq is not None:
+        tarefa_faq.cancel()
+    # Grava as alterações dos índices locais que ainda não foram salvas
+    indice_vetorial.salvar_alteracoes()
+    indice_palavras_chave.salvar_alteracoes()
+    cache_documentos.salvar_indice()
+
+
 # Descrição: Este é o ponto de entrada da API do Chatbot Acadêmico, que gerencia as interações e dados do chatbot integrado ao Teams.
 app = FastAPI(
     title="API do Chatbot Acadêmico",
     description="API para gerenciar as interações e dados do chatbot acadêmico integrado ao Teams.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Inclui os roteadores no aplicativo principal
@@ -3,6 +3,7 @@ from typing import List
 from src.supabase_client import supabase
 from src.schemas.sch_aluno import AlunoCreate, Aluno, AlunoUpdate, AlunoEmailRA, AlunoQuantidadeTurma
 from ..dependencies import require_admin_or_coordenador, require_all, require_admin_or_coordenador_or_professor
+from ..services import matriculas
 import uuid
 
 # --- ROUTER ALUNOS ---
@@ -184,6 +185,7 @@ def update_aluno(ra: str, aluno_update_data: AlunoUpdate):
         if new_id_curso != id_curso_previous:
             # DELETE: Remove todas as matrículas antigas do aluno
             supabase.table("alunodisciplina").delete().eq("id_aluno", id_aluno).execute()
+            matriculas.invalidar(id_aluno)
 
             # SELECT & INSERT: Busca as disciplinas do novo curso e cria as novas matrículas
             disciplinas_response = supabase.table("disciplina").select("id_disciplina").eq("id_curso", new_id_curso).execute()
@@ -5,6 +5,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from ..supabase_client import supabase
 from ..schemas.sch_avaliacao import AvaliacaoCreate, Avaliacao, AvaliacaoUpdate, TipoAvaliacaoEnum
 from ..dependencies import get_current_user, require_admin_or_coordenador_or_professor, require_all, require_admin
+from ..services import roteador_intencoes
 import uuid
 
 # --- ROUTER AVALIACAO ---
@@ -32,6 +33,7 @@ def create_avaliacao(avaliacao_data: AvaliacaoCreate): #  current_user: dict = D
         if not response.data:
             raise HTTPException(status_code=500, detail="Erro ao criar a avaliação.")
 
+        roteador_intencoes.invalidar()
         return response.data[0]
 
     except Exception as e:
@@ -114,6 +116,7 @@ def update_avaliacao_por_tipo_e_disciplina(
                 detail=f"Nenhuma avaliação do tipo '{tipo_avaliacao.upper()}' encontrada para a disciplina especificada."
             )
 
+        roteador_intencoes.invalidar()
         # O Supabase retorna uma lista de registros atualizados, pegamos o primeiro.
         return response.data[0]
         
@@ -139,6 +142,7 @@ def delete_avaliacao(
         if not response.data:
             raise HTTPException(status_code=404, detail="Avaliação não encontrada.")
 
+        roteador_intencoes.invalidar()
         return None  # Retorna None para status 204
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -4,7 +4,9 @@ from typing import Annotated
 from fastapi import APIRouter, HTTPException, status, Query, Depends
 from ..supabase_client import supabase
 from ..schemas.sch_base_conhecimento import BaseConhecimento, BaseConhecimentoCreate, BaseConhecimentoUpdate, DocumentoURLResponse
+from ..services import eventos_base, indice_vetorial, texto
 # from ..dependencies import 
+import asyncio
 import uuid
 import json
 
@@ -51,6 +53,9 @@ def create_conhecimento(item: BaseConhecimentoCreate):
         if payload.get('id_hora_complementares'):
             payload['id_hora_complementares'] = str(payload['id_hora_complementares'])
 
+        # Colunas normalizadas (sem acentos, sem plural) usadas nas buscas
+        payload.update(texto.colunas_de_busca("baseconhecimento", payload))
+
         response = supabase.table("baseconhecimento").insert(payload).execute()
 
         # Filtro de erro, para um mensagem mais clara
@@ -69,6 +74,9 @@ def create_conhecimento(item: BaseConhecimentoCreate):
 
         db_data = response.data[0]
 
+        # Avisa os índices/caches locais da IA sobre o novo registro
+        eventos_base.notificar_upsert(db_data)
+
         return convert_json_fields(db_data)
 
     except Exception as e:
@@ -81,6 +89,13 @@ def create_conhecimento(item: BaseConhecimentoCreate):
 @router.get("/get_buscar")
 async def buscar_conhecimento(q: Annotated[str, Query(..., min_length=3, description="Termo de busca para a pergunta do usuário")] ):
     try:
+        # Busca primeiro no índice vetorial local (sem ida ao banco); a RPC fica como fallback.
+        # Num worker recém-iniciado o índice é construído aqui, fora do event loop
+        if await asyncio.to_thread(indice_vetorial.garantir_indice):
+            resultados = await asyncio.to_thread(indice_vetorial.buscar, q, 10)
+            if resultados:
+                return {"contextos": [item['conteudo_processado'] for item, score in resultados]}
+
         response = supabase.rpc("buscar_conteudo", {"query": q}).execute()
 
 
@@ -118,51 +133,39 @@ def get_url_documento_por_termo(termo_busca: str):
     Exemplo: "cocomo" encontrará "CoCoMo_Marcelo.pdf"
     """
     try:
-        # Remove espaços e converte para minúsculas para busca mais flexível
-        termo_limpo = termo_busca.strip().lower()
-        
-        # Busca por nome do arquivo (busca parcial case-insensitive)
-        response_nome = supabase.table("baseconhecimento").select(
-            "url_documento, nome_arquivo_origem"
-        ).ilike('nome_arquivo_origem', f'%{termo_limpo}%').execute()
-        
-        # Se não encontrou por nome, tenta buscar nas palavras-chave
-        if not response_nome.data:
-            # Busca em todos os registros e filtra por palavra-chave no código
-            response_todos = supabase.table("baseconhecimento").select(
-                "url_documento, nome_arquivo_origem, palavra_chave"
+        # Uma única busca nas colunas normalizadas do nome do arquivo e das palavras-chave
+        # ("avaliacao" encontra "Avaliações", "cocomo" encontra "CoCoMo_Marcelo.pdf")
+        termo_normalizado = texto.texto_de_busca(termo_busca)
+        resultados = []
+        if termo_normalizado:
+            # No filtro 'or' do PostgREST o curinga do ilike é '*'
+            padrao = f'"*{termo_normalizado}*"'
+            response = supabase.table("baseconhecimento").select(
+                "url_documento, nome_arquivo_origem, nome_arquivo_busca"
+            ).or_(
+                f"nome_arquivo_busca.ilike.{padrao},palavra_chave_busca.ilike.{padrao}"
             ).execute()
-            
-            # Filtra registros onde o termo está nas palavras-chave
-            resultados = []
-            for item in response_todos.data:
-                palavras_chave = item.get('palavra_chave', [])
-                # Se palavra_chave é string JSON, converte
-                if isinstance(palavras_chave, str):
-                    try:
-                        palavras_chave = json.loads(palavras_chave)
-                    except:
-                        palavras_chave = []
-                
-                # Verifica se o termo está em alguma palavra-chave
-                if any(termo_limpo in str(palavra).lower() for palavra in palavras_chave):
-                    resultados.append({
-                        'url_documento': item.get('url_documento'),
-                        'nome_arquivo_origem': item.get('nome_arquivo_origem')
-                    })
-            
-            if resultados:
-                # Retorna o primeiro resultado encontrado
-                resultado = resultados[0]
-                if not resultado.get('url_documento'):
-                    raise HTTPException(status_code=404, detail="Documento encontrado mas sem URL disponível.")
-                return resultado
-        else:
-            # Encontrou por nome do arquivo
-            resultado = response_nome.data[0]
+            resultados = response.data or []
+
+        if not resultados:
+            # Fallback no nome original do arquivo (registros gravados sem a coluna de busca preenchida)
+            response = supabase.table("baseconhecimento").select(
+                "url_documento, nome_arquivo_origem"
+            ).ilike('nome_arquivo_origem', f'%{termo_busca.strip().lower()}%').execute()
+            resultados = response.data or []
+
+        if resultados:
+            # Quem casou pelo nome do arquivo tem prioridade sobre quem casou pela palavra-chave
+            resultado = next(
+                (r for r in resultados if termo_normalizado and termo_normalizado in (r.get("nome_arquivo_busca") or "")),
+                resultados[0],
+            )
             if not resultado.get('url_documento'):
                 raise HTTPException(status_code=404, detail="Documento encontrado mas sem URL disponível.")
-            return resultado
+            return {
+                'url_documento': resultado.get('url_documento'),
+                'nome_arquivo_origem': resultado.get('nome_arquivo_origem')
+            }
         
         # Se chegou aqui, não encontrou nada
         raise HTTPException(
@@ -217,6 +220,7 @@ def update_conhecimento(item_id: uuid.UUID, item: BaseConhecimentoUpdate):
             payload['id_hora_complementares'] = str(payload['id_hora_complementares'])
 
         payload['atualizado_em'] = datetime.now().isoformat()
+        payload.update(texto.colunas_de_busca("baseconhecimento", payload))
 
         response = supabase.table("baseconhecimento").update(payload).eq('id_conhecimento', str(item_id)).execute()
 
@@ -226,6 +230,9 @@ def update_conhecimento(item_id: uuid.UUID, item: BaseConhecimentoUpdate):
 
         db_data = response.data[0]
 
+        # Avisa os índices/caches locais da IA sobre a alteração
+        eventos_base.notificar_upsert(db_data)
+
         return convert_json_fields(db_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -238,5 +245,8 @@ def delete_conhecimento(item_id: uuid.UUID):
 
         if not response.data:
             raise HTTPException(status_code=404, detail=f"Item com ID '{item_id}' não encontrado.")
+
+        # Avisa os índices/caches locais da IA sobre a remoção
+        eventos_base.notificar_remocao(item_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
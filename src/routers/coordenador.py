@@ -6,6 +6,7 @@ from src.supabase_client import supabase
 from src.schemas.sch_coordenador import CoordenadorCreate, Coordenador, CoordenadorUpdate
 from ..dependencies import require_admin_or_coordenador, require_all
 from ..config import settings
+from ..services import texto
 
 # --- ROUTER COORDENADOR ---
 
@@ -38,6 +39,7 @@ def create_coordenador(coordenador_data: CoordenadorCreate, current_user: dict =
         # Para converter os time
         coordenador_profile_data['atendimento_hora_inicio'] = coordenador_profile_data['atendimento_hora_inicio'].isoformat()
         coordenador_profile_data['atendimento_hora_fim'] = coordenador_profile_data['atendimento_hora_fim'].isoformat()
+        coordenador_profile_data.update(texto.colunas_de_busca("coordenador", coordenador_profile_data))
 
         # Inserir o perfil do Coordenador na tabela "Coordenador"
         db_response = supabase.table("coordenador").insert(coordenador_profile_data).execute()
@@ -111,11 +113,15 @@ def get_all_aluno():
 @router.get("/get_nome/{nome}", response_model=List[Coordenador])
 def get_coordenador_by_nome(nome: str):
     try:
-        # Realiza a consulta na tabela "coordenador" filtrando pelo nome_coordenador (busca parcial e case-insensitive)
-        response = supabase.table("coordenador").select("*").ilike("nome_coordenador", f"%{nome}%").execute()
+        # Busca parcial na coluna normalizada: "joao" encontra "João" e vice-versa
+        padrao = texto.padrao_ilike(nome)
+        response = supabase.table("coordenador").select("*").ilike("nome_coordenador_busca", padrao).execute() if padrao else None
+        if not response or not response.data:
+            # Fallback na coluna original (registros gravados sem a coluna de busca preenchida)
+            response = supabase.table("coordenador").select("*").ilike("nome_coordenador", f"%{nome}%").execute()
 
         # Verifica se a busca retornou algum dado
-        if not response.data:
+        if not response or not response.data:
             # Se não retornou, o coordenador não foi encontrado. Lançamos um erro 404.
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -161,6 +167,8 @@ def update_coordenador(id: str, coordenador_update_data: CoordenadorUpdate):
         if 'atendimento_hora_fim' in update_payload:
             update_payload['atendimento_hora_fim'] = update_payload['atendimento_hora_fim'].isoformat()
 
+        update_payload.update(texto.colunas_de_busca("coordenador", update_payload))
+
         if not update_payload and not coordenador_update_data.curso_nomes:
             raise HTTPException(status_code=400, detail="Nenhum dado fornecido para atualização.")
 
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from ..supabase_client import supabase
 from ..schemas.sch_cronograma import CronogramaCreate, Cronograma, CronogramaUpdate
 from ..dependencies import require_admin_or_coordenador_or_professor
+from ..services import roteador_intencoes
 import uuid
 
 # --- ROUTER CRONOGRAMA ---
@@ -39,6 +40,7 @@ def create_cronograma(cronograma_data: CronogramaCreate, current_user: dict = De
         if not db_response.data:
             raise HTTPException(status_code=500, detail="Erro ao cadatrar a cronograma")
 
+        roteador_intencoes.invalidar()
         return db_response.data[0]
     except Exception as e:
         if "violates foreign key constraint" in str(e).lower():
@@ -108,6 +110,7 @@ def update_cronograma(cronograma_id: uuid.UUID, cronograma_data: CronogramaUpdat
         if not db_response.data:
             raise HTTPException(status_code=404, detail="Cronograma não encontrada para atualização.")
 
+        roteador_intencoes.invalidar()
         return db_response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -122,6 +125,7 @@ def delete_cronograma(cronograma_id: uuid.UUID):
         if not db_response.data:
             raise HTTPException(status_code=404, detail="Cronograma não encontrado para deletar")
 
+        roteador_intencoes.invalidar()
         return
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,6 +1,7 @@
 from src.schemas.sch_disciplina import Disciplina
 from fastapi import APIRouter, HTTPException, status, Depends
 from ..supabase_client import supabase
+from ..services import matriculas, roteador_intencoes
 from pydantic import BaseModel
 from typing import List
 # from ..dependencies import 
@@ -31,6 +32,7 @@ def create_disciplina_a_curso(association_data: CursoDisciplinaCreate):
 
         if not db_response.data:
             raise HTTPException(status_code=500, detail="Erro ao associar disciplina ao curso.")
+        roteador_intencoes.invalidar()
 
         # Busca todos os alunos do curso
         alunos_response = supabase.table("aluno").select("id").eq("id_curso", payload['id_curso']).execute()
@@ -43,6 +45,7 @@ def create_disciplina_a_curso(association_data: CursoDisciplinaCreate):
             ]
             if matriculas_para_criar:
                 supabase.table("alunodisciplina").insert(matriculas_para_criar).execute()
+                matriculas.invalidar()
 
         return db_response.data[0]
 
@@ -91,6 +94,7 @@ def delete_disciplina_of_curso(id_curso: uuid.UUID, id_disciplina: uuid.UUID):
                 ).in_(
                     "id_aluno", ids_alunos_afetados
                 ).execute()
+                matriculas.invalidar()
 
         # Remove a associação principal da tabela CursoDisciplina
         db_response = supabase.table("cursodisciplina").delete().match({
@@ -101,6 +105,7 @@ def delete_disciplina_of_curso(id_curso: uuid.UUID, id_disciplina: uuid.UUID):
         # Se a resposta não contiver dados, significa que a associação não existia.
         if not db_response.data:
             raise HTTPException(status_code=404, detail="Associação entre curso e disciplina não encontrada.")
+        roteador_intencoes.invalidar()
 
         return
     except Exception as e:
@@ -4,6 +4,7 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from ..supabase_client import supabase
 from ..schemas.sch_disciplina import DisciplinaCreate, Disciplina, DisciplinaUpdate, DisciplinaEmenta
 from ..dependencies import require_admin_or_coordenador_or_professor
+from ..services import matriculas, roteador_intencoes, texto
 import uuid
 
 # --- ROUTER DISCIPLINA ---
@@ -13,11 +14,27 @@ router = APIRouter(
     tags=["Disciplina"]
 )
 
+
+def _buscar_disciplinas_por_nome(colunas: str, nome_disciplina: str) -> list[dict]:
+    """
+    Busca parcial pelo nome na coluna normalizada (sem acentos); se nada casar, tenta a coluna
+    original (registros gravados sem a coluna de busca preenchida).
+    """
+    padrao = texto.padrao_ilike(nome_disciplina)
+    if padrao:
+        response = supabase.table("disciplina").select(colunas).ilike("nome_disciplina_busca", padrao).execute()
+        if response.data:
+            return response.data
+    response = supabase.table("disciplina").select(colunas).ilike("nome_disciplina", f"%{nome_disciplina}%").execute()
+    return response.data or []
+
+
 ### ENDPOINT PARA CADASTRAR DISCIPLINAS #####
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=Disciplina)
 def create_disciplina(disciplina_data: DisciplinaCreate, current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
     try:
         disciplina_payload = disciplina_data.model_dump()
+        disciplina_payload.update(texto.colunas_de_busca("disciplina", disciplina_payload))
         
         # Insere a disciplina na tabela disciplina
         db_response = supabase.table("disciplina").insert(disciplina_payload).execute()
@@ -25,6 +42,7 @@ def create_disciplina(disciplina_data: DisciplinaCreate, current_user: dict = De
         if not db_response.data:
             raise HTTPException(status_code=500, detail="Erro ao cadastrar a disciplina")
 
+        roteador_intencoes.invalidar()
         return db_response.data[0]
 
     except Exception as e:
@@ -84,33 +102,29 @@ def get_disciplina_detalhado(disciplina_id: uuid.UUID):
 def get_ementa_da_disciplina(nome_disciplina: str):
     try:
         # seleciona apenas a coluna 'ementa' da tabela 'Disciplina' usando o nome
-        db_response = supabase.table("disciplina").select(
-            "ementa"
-        ).ilike(
-            'nome_disciplina', f"%{nome_disciplina}%"
-        ).single().execute()
+        disciplinas = _buscar_disciplinas_por_nome("ementa", nome_disciplina)
 
-
-        if not db_response.data:
+        # Nenhuma ou mais de uma disciplina com esse nome: não dá para escolher a ementa
+        if len(disciplinas) != 1:
             raise HTTPException(status_code=404, detail=f"Disciplina '{nome_disciplina}' não encontrada.")
 
-        return db_response.data
+        return disciplinas[0]
 
+    except HTTPException:
+        raise
     except Exception as e:
-        if "JSON object requested, multiple (or no) rows returned" in str(e):
-             raise HTTPException(status_code=404, detail=f"Disciplina '{nome_disciplina}' não encontrada.")
         raise HTTPException(status_code=500, detail=str(e))
 
 #### ENDPOINT PARA BUSCAR O CRONOGRAMA DE UMA DISCIPLINA PELO NOME ####
 @router.get("/get_diciplina_nome/{nome_disciplina}/cronograma", response_model=List[Cronograma]) #tags=["disciplina"]
 def get_cronograma_por_disciplina(nome_disciplina: str):
     try:
-        disciplina_response = supabase.table("disciplina").select("id_disciplina").ilike("nome_disciplina", f"%{nome_disciplina}%").execute()
+        disciplinas = _buscar_disciplinas_por_nome("id_disciplina", nome_disciplina)
 
-        if not disciplina_response.data:
+        if not disciplinas:
             raise HTTPException(status_code=404, detail=f"Disciplina '{nome_disciplina}' não encontrada.")
 
-        disciplina_id = disciplina_response.data[0]['id_disciplina']
+        disciplina_id = disciplinas[0]['id_disciplina']
 
         cronograma_response = supabase.table("cronograma").select("*").eq('id_disciplina', disciplina_id).execute()
 
@@ -168,6 +182,8 @@ def update_disciplina(disciplina_id: uuid.UUID, disciplina_data: DisciplinaUpdat
         if not update_payload:
             raise HTTPException(status_code=400, detail="Nenhum dado fornecido para atualização")
 
+        update_payload.update(texto.colunas_de_busca("disciplina", update_payload))
+
         # Atualiza apenas os campos da disciplina (nome, codigo, semestre, ementa, carga_horaria)
         # Relacionamentos com professores são gerenciados através da tabela professordisciplina
         # e devem ser atualizados via endpoint de professores
@@ -176,6 +192,7 @@ def update_disciplina(disciplina_id: uuid.UUID, disciplina_data: DisciplinaUpdat
         if not response.data:
             raise HTTPException(status_code=404, detail="Disciplina não encontrada para atualização.")
 
+        roteador_intencoes.invalidar()
         return response.data[0]
     except HTTPException:
         raise
@@ -201,6 +218,7 @@ def delete_disciplina(disciplina_id: uuid.UUID, current_user: dict = Depends(req
         # 2. Deletar relacionamentos na tabela alunodisciplina
         try:
             supabase.table('alunodisciplina').delete().eq('id_disciplina', str(disciplina_id)).execute()
+            matriculas.invalidar()
         except Exception as e:
             print(f"[WARN] Erro ao deletar relacionamentos aluno-disciplina: {e}")
         
@@ -246,6 +264,7 @@ def delete_disciplina(disciplina_id: uuid.UUID, current_user: dict = Depends(req
         if not db_response.data:
             raise HTTPException(status_code=404, detail="Disciplina não encontrada para deletar")
 
+        roteador_intencoes.invalidar()
         return
     except HTTPException:
         raise
@@ -1,14 +1,16 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, status, Form, Depends
 import os
+import asyncio
 import shutil
 import json
 import uuid
 import re
 import unicodedata
 import requests
-import google.generativeai as genai
 from ..config import settings
 from ..supabase_client import supabase
+from ..services import eventos_base, texto, trechos_documento
+from ..services.gateway_llm import gateway_llm, LimiteGeminiExcedido
 # from ..dependencies import 
 
 router = APIRouter(
@@ -27,11 +29,6 @@ os.makedirs(TEMP_FOLDER_PATH, exist_ok=True)
 BUCKET_NAME = "documentos"
 
 
-# Configura o Gemini (reutiliza mesma chave do projeto)
-genai.configure(api_key=settings.GOOGLE_API_KEY)
-gemini_model = genai.GenerativeModel("gemini-2.5-flash")
-
-
 def _extrair_disciplina_e_categoria(nome_arquivo: str) -> tuple[str, str]:
     """
     Replica a lógica do metadata_enricher:
@@ -58,16 +55,26 @@ def _buscar_id_disciplina_por_nome(nome_disciplina: str) -> str | None:
         f"   [Busca] Procurando ID para a disciplina '{nome_disciplina}' na tabela 'disciplina'..."
     )
     try:
+        # Compara pela coluna normalizada: "Calculo_I" (do nome do arquivo) encontra "Cálculo I"
         # Usamos limit(1) em vez de .single() para evitar erro quando não há linhas
         response = (
             supabase.table("disciplina")
             .select("id_disciplina")
-            .eq("nome_disciplina", nome_disciplina)
+            .eq("nome_disciplina_busca", texto.texto_de_busca(nome_disciplina))
             .limit(1)
             .execute()
         )
 
         rows = response.data or []
+        if not rows:
+            # Fallback na coluna original (registros gravados sem a coluna de busca preenchida)
+            rows = (
+                supabase.table("disciplina")
+                .select("id_disciplina")
+                .ilike("nome_disciplina", nome_disciplina)
+                .limit(1)
+                .execute()
+            ).data or []
         if rows:
             disciplina_id = rows[0].get("id_disciplina")
             if disciplina_id:
@@ -457,7 +464,7 @@ def _upload_para_supabase_storage(caminho_arquivo: str, nome_arquivo: str) -> st
         )
 
 
-def _processar_com_gemini(caminho_arquivo: str, content_type: str) -> dict:
+async def _processar_com_gemini(caminho_arquivo: str, content_type: str) -> dict:
     """
     Lê o arquivo e pede para o Gemini gerar:
     - resumo (conteudo_processado)
@@ -469,8 +476,9 @@ def _processar_com_gemini(caminho_arquivo: str, content_type: str) -> dict:
 
     # Faz upload do arquivo para o Gemini como input multimodal
     try:
-        with open(caminho_arquivo, "rb") as f:
-            uploaded_file = genai.upload_file(f, mime_type=content_type)
+        uploaded_file = await gateway_llm.enviar_arquivo(caminho_arquivo, content_type)
+    except LimiteGeminiExcedido as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -492,9 +500,11 @@ Regras importantes:
 """
 
     try:
-        response = gemini_model.generate_content([prompt, uploaded_file])
+        response = await gateway_llm.gerar([prompt, uploaded_file])
         raw_text = response.text.strip()
         print(f"   [Gemini] 2. Resposta bruta do modelo:\n{raw_text[:400]}...")
+    except LimiteGeminiExcedido as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -534,6 +544,19 @@ Regras importantes:
     }
 
 
+async def _indexar_documento(registro: dict, texto_documento: str) -> None:
+    """
+    Depois que o documento foi salvo na base de conhecimento: salva os trechos do texto para a
+    busca por parágrafos do /ia/gerar-resposta e avisa os índices/caches locais da IA.
+    As escritas no banco e a atualização dos índices rodam fora do event loop.
+    """
+    try:
+        await asyncio.to_thread(trechos_documento.salvar_trechos, registro, texto_documento)
+    except Exception as e:
+        print(f"   [AVISO] Não foi possível salvar os trechos do documento: {e}")
+    await asyncio.to_thread(eventos_base.notificar_upsert, registro)
+
+
 @router.post("/upload_disciplina", status_code=status.HTTP_201_CREATED)
 async def upload_documento(
     file: UploadFile = File(...),
@@ -567,7 +590,10 @@ async def upload_documento(
         disciplina_id = _buscar_id_disciplina_por_nome(nome_disciplina.strip())
 
         # 2) Processar o conteúdo com o Gemini (resumo + palavras-chave)
-        resultado_gemini = _processar_com_gemini(destination_path, file.content_type)
+        resultado_gemini = await _processar_com_gemini(destination_path, file.content_type)
+
+        # 2.2) Extrair o texto do documento (antes de remover o arquivo temporário) para dividi-lo em trechos
+        texto_documento = await asyncio.to_thread(trechos_documento.extrair_texto, destination_path, file.content_type)
 
         # 2.1) Deixar a "categoria" a cargo do Gemini:
         #      usamos a primeira palavra-chave como categoria principal, se existir.
@@ -595,6 +621,8 @@ async def upload_documento(
             "url_documento": url_documento,
         }
 
+        payload_base.update(texto.colunas_de_busca("baseconhecimento", payload_base))
+
         print("   [API] 6. Salvando conteúdo na tabela 'baseconhecimento'...")
         db_response = (
             supabase.table("baseconhecimento").insert(payload_base).execute()
@@ -611,6 +639,9 @@ async def upload_documento(
             f"   [API] 7. Salvo com sucesso na base de conhecimento (id_conhecimento={registro.get('id_conhecimento')})."
         )
 
+        # Salva os trechos do texto e avisa os índices/caches locais da IA sobre o novo documento
+        await _indexar_documento(registro, texto_documento)
+
         return {
             "message": f"Arquivo '{file.filename}' recebido, processado pelo Gemini, enviado para o Supabase Storage e salvo na base de conhecimento.",
             "filename": file.filename,
@@ -684,7 +715,10 @@ async def upload_tcc(
             )
 
         # Processar o conteúdo com o Gemini
-        resultado_gemini = _processar_com_gemini(destination_path, file.content_type)
+        resultado_gemini = await _processar_com_gemini(destination_path, file.content_type)
+
+        # 2.2) Extrair o texto do documento (antes de remover o arquivo temporário) para dividi-lo em trechos
+        texto_documento = await asyncio.to_thread(trechos_documento.extrair_texto, destination_path, file.content_type)
 
         palavras_chave = resultado_gemini["palavras_chave"]
         categoria = palavras_chave[0] if palavras_chave else "Geral"
@@ -710,6 +744,8 @@ async def upload_tcc(
             "url_documento": url_documento,
         }
 
+        payload_base.update(texto.colunas_de_busca("baseconhecimento", payload_base))
+
         print("   [API] 6. Salvando conteúdo na tabela 'baseconhecimento'...")
         db_response = (
             supabase.table("baseconhecimento").insert(payload_base).execute()
@@ -726,6 +762,9 @@ async def upload_tcc(
             f"   [API] 7. Salvo com sucesso na base de conhecimento (id_conhecimento={registro.get('id_conhecimento')})."
         )
 
+        # Salva os trechos do texto e avisa os índices/caches locais da IA sobre o novo documento
+        await _indexar_documento(registro, texto_documento)
+
         return {
             "message": f"Arquivo '{file.filename}' recebido, processado pelo Gemini, enviado para o Supabase Storage e salvo na base de conhecimento.",
             "filename": file.filename,
@@ -797,7 +836,10 @@ async def upload_aps(
             )
 
         # Processar o conteúdo com o Gemini
-        resultado_gemini = _processar_com_gemini(destination_path, file.content_type)
+        resultado_gemini = await _processar_com_gemini(destination_path, file.content_type)
+
+        # 2.2) Extrair o texto do documento (antes de remover o arquivo temporário) para dividi-lo em trechos
+        texto_documento = await asyncio.to_thread(trechos_documento.extrair_texto, destination_path, file.content_type)
 
         palavras_chave = resultado_gemini["palavras_chave"]
         categoria = palavras_chave[0] if palavras_chave else "Geral"
@@ -823,6 +865,8 @@ async def upload_aps(
             "url_documento": url_documento,
         }
 
+        payload_base.update(texto.colunas_de_busca("baseconhecimento", payload_base))
+
         print("   [API] 6. Salvando conteúdo na tabela 'baseconhecimento'...")
         db_response = (
             supabase.table("baseconhecimento").insert(payload_base).execute()
@@ -839,6 +883,9 @@ async def upload_aps(
             f"   [API] 7. Salvo com sucesso na base de conhecimento (id_conhecimento={registro.get('id_conhecimento')})."
         )
 
+        # Salva os trechos do texto e avisa os índices/caches locais da IA sobre o novo documento
+        await _indexar_documento(registro, texto_documento)
+
         return {
             "message": f"Arquivo '{file.filename}' recebido, processado pelo Gemini, enviado para o Supabase Storage e salvo na base de conhecimento.",
             "filename": file.filename,
@@ -910,7 +957,10 @@ async def upload_estagio(
             )
 
         # Processar o conteúdo com o Gemini
-        resultado_gemini = _processar_com_gemini(destination_path, file.content_type)
+        resultado_gemini = await _processar_com_gemini(destination_path, file.content_type)
+
+        # 2.2) Extrair o texto do documento (antes de remover o arquivo temporário) para dividi-lo em trechos
+        texto_documento = await asyncio.to_thread(trechos_documento.extrair_texto, destination_path, file.content_type)
 
         palavras_chave = resultado_gemini["palavras_chave"]
         categoria = palavras_chave[0] if palavras_chave else "Geral"
@@ -936,6 +986,8 @@ async def upload_estagio(
             "url_documento": url_documento,
         }
 
+        payload_base.update(texto.colunas_de_busca("baseconhecimento", payload_base))
+
         print("   [API] 6. Salvando conteúdo na tabela 'baseconhecimento'...")
         db_response = (
             supabase.table("baseconhecimento").insert(payload_base).execute()
@@ -952,6 +1004,9 @@ async def upload_estagio(
             f"   [API] 7. Salvo com sucesso na base de conhecimento (id_conhecimento={registro.get('id_conhecimento')})."
         )
 
+        # Salva os trechos do texto e avisa os índices/caches locais da IA sobre o novo documento
+        await _indexar_documento(registro, texto_documento)
+
         return {
             "message": f"Arquivo '{file.filename}' recebido, processado pelo Gemini, enviado para o Supabase Storage e salvo na base de conhecimento.",
             "filename": file.filename,
@@ -1023,7 +1078,10 @@ async def upload_hora_complementares(
             )
 
         # Processar o conteúdo com o Gemini
-        resultado_gemini = _processar_com_gemini(destination_path, file.content_type)
+        resultado_gemini = await _processar_com_gemini(destination_path, file.content_type)
+
+        # 2.2) Extrair o texto do documento (antes de remover o arquivo temporário) para dividi-lo em trechos
+        texto_documento = await asyncio.to_thread(trechos_documento.extrair_texto, destination_path, file.content_type)
 
         palavras_chave = resultado_gemini["palavras_chave"]
         categoria = palavras_chave[0] if palavras_chave else "Geral"
@@ -1049,6 +1107,8 @@ async def upload_hora_complementares(
             "url_documento": url_documento,
         }
 
+        payload_base.update(texto.colunas_de_busca("baseconhecimento", payload_base))
+
         print("   [API] 6. Salvando conteúdo na tabela 'baseconhecimento'...")
         db_response = (
             supabase.table("baseconhecimento").insert(payload_base).execute()
@@ -1065,6 +1125,9 @@ async def upload_hora_complementares(
             f"   [API] 7. Salvo com sucesso na base de conhecimento (id_conhecimento={registro.get('id_conhecimento')})."
         )
 
+        # Salva os trechos do texto e avisa os índices/caches locais da IA sobre o novo documento
+        await _indexar_documento(registro, texto_documento)
+
         return {
             "message": f"Arquivo '{file.filename}' recebido, processado pelo Gemini, enviado para o Supabase Storage e salvo na base de conhecimento.",
             "filename": file.filename,
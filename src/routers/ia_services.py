@@ -1,20 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai
-import requests
-import os
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+import asyncio
+import json
+import re
+import time
 from ..config import settings
 from ..supabase_client import supabase
 from ..dependencies import require_all, require_aluno, require_admin_or_coordenador_or_professor
+from . import msg_aluno
+from ..services import (
+    indice_bm25, indice_palavras_chave, indice_vetorial, matriculas, prazo, respostas_frequentes, roteador_intencoes, texto,
+    trechos_documento,
+)
+from ..services.cache_respostas import cache_respostas, cache_negativo, gerar_chave, normalizar_pergunta
+from ..services.cache_documentos import cache_documentos
+from ..services.gateway_llm import gateway_llm, LimiteGeminiExcedido
+from ..services.empacotador_contexto import empacotar_contextos, estimar_tokens
+from ..services.fusao_rankings import ContextoRanqueado, FusaoRankings
+from ..services.single_flight import SingleFlight
+from ..services.cache_prefixos import cache_prefixos, ERROS_PREFIXO
+from ..services.metricas import metricas, Medicao, iniciar_requisicao, cabecalho_server_timing
+from ..services.prazo import PrazoEsgotado
 
 # from ..dependencies import 
 
 
-# Carrega a chave da API do Gemini
-genai.configure(api_key=settings.GOOGLE_API_KEY)
-gemini_model = genai.GenerativeModel("gemini-2.5-flash")
-
 router = APIRouter(
     prefix="/ia",
     tags=["Serviços de IA"],
@@ -24,288 +39,332 @@ router = APIRouter(
 class GenerationRequest(BaseModel):
     pergunta: str
     contexto: str | None = None
+    prazo_segundos: float | None = None  # Tempo que o cliente espera (ex.: bot do Teams); limitado a IA_PRAZO_RESPOSTA_SEGUNDOS
+
+
+class BatchGenerationRequest(BaseModel):
+    perguntas: list[str]
+    contexto: str | None = None
+
+
+CAMPOS_BUSCA = "id_conhecimento, conteudo_processado, url_documento, nome_arquivo_origem, palavra_chave, categoria, id_disciplina"
+
+# Pool limitado de threads para as consultas ao Supabase (o cliente é síncrono).
+# Permite disparar as etapas da busca em paralelo sem bloquear o event loop.
+_executor_busca = ThreadPoolExecutor(
+    max_workers=settings.IA_BUSCA_MAX_PARALELISMO,
+    thread_name_prefix="busca-base",
+)
+
+
+def _extrair_palavras_chave(pergunta_lower: str) -> list[str]:
+    # Remove pontuação e extrai palavras-chave (mínimo 3 caracteres, exclui palavras comuns)
+    palavras_comuns = {"que", "qual", "quais", "como", "onde", "quando", "por", "para", "com", "sem", "sobre", "este", "esta", "isso", "isso"}
+    palavras_raw = re.findall(r'\b\w+\b', pergunta_lower)
+    return [p for p in palavras_raw if len(p) >= 3 and p not in palavras_comuns]
+
+
+def _aplicar_escopo(consulta, disciplinas: frozenset[str] | None):
+    # Só registros gerais (sem disciplina) e das disciplinas do aluno. Vários filtros 'or' são combinados com AND.
+    if disciplinas is None:
+        return consulta
+    if not disciplinas:
+        return consulta.is_("id_disciplina", "null")
+    return consulta.or_(f"id_disciplina.is.null,id_disciplina.in.({','.join(sorted(disciplinas))})")
+
+
+def _consulta_rpc(pergunta: str, disciplinas: frozenset[str] | None = None) -> list[dict]:
+    # Busca semântica/vetorial via função RPC (a função não recebe o escopo, então ele é aplicado no resultado)
+    search_response = supabase.rpc("buscar_conteudo", {"query": pergunta}).execute()
+    return [item for item in search_response.data or [] if matriculas.no_escopo(item, disciplinas)]
+
+
+def _consulta_ilike(coluna: str, termo: str, disciplinas: frozenset[str] | None = None) -> list[dict]:
+    # Busca parcial na versão normalizada (sem acentos e sem plural) de uma coluna da base de conhecimento
+    padrao = texto.padrao_ilike(termo)
+    if not padrao:
+        return []
+    consulta = (
+        supabase.table("baseconhecimento")
+        .select(CAMPOS_BUSCA)
+        .ilike(texto.coluna_de_busca("baseconhecimento", coluna), padrao)
+        .eq("status", "publicado")
+    )
+    response = _aplicar_escopo(consulta, disciplinas).limit(10).execute()
+    return response.data or []
+
+
+def _consulta_algum_termo(coluna: str, termos: tuple[str, ...], disciplinas: frozenset[str] | None = None) -> list[dict]:
+    # Registros que contêm qualquer um dos termos: uma consulta só, em vez de uma por termo
+    termos_busca = list(dict.fromkeys(t for t in map(texto.texto_de_busca, termos) if t))
+    if not termos_busca:
+        return []
+    coluna_busca = texto.coluna_de_busca("baseconhecimento", coluna)
+    # No filtro 'or' do PostgREST o curinga do ilike é '*'
+    filtro = ",".join(f'{coluna_busca}.ilike."*{t}*"' for t in termos_busca)
+    consulta = (
+        supabase.table("baseconhecimento")
+        .select(CAMPOS_BUSCA)
+        .or_(filtro)
+        .eq("status", "publicado")
+    )
+    response = _aplicar_escopo(consulta, disciplinas).limit(10).execute()
+    return response.data or []
+
+
+# Durante o /ia/gerar-respostas (lote), consultas idênticas feitas para perguntas diferentes
+# (ex.: o mesmo termo em 'ilike') são executadas uma vez só e o resultado é compartilhado.
+_consultas_do_lote: ContextVar[dict | None] = ContextVar("consultas_do_lote", default=None)
+
+
+async def _executar_consulta(descricao: str, consulta, *args) -> list[dict]:
+    """
+    Executa uma consulta síncrona no pool de busca.
+    Erros são registrados e tratados como 'nenhum resultado', para não derrubar as demais etapas.
+    """
+    consultas_do_lote = _consultas_do_lote.get()
+    if consultas_do_lote is not None:
+        chave = (consulta.__name__, repr(args))
+        if chave not in consultas_do_lote:
+            consultas_do_lote[chave] = asyncio.ensure_future(_executar_consulta_no_pool(descricao, consulta, *args))
+        return await asyncio.shield(consultas_do_lote[chave])
+    return await _executar_consulta_no_pool(descricao, consulta, *args)
+
+
+# Nome da etapa, nas métricas, de cada tipo de consulta ao banco
+ETAPAS_CONSULTA = {
+    "Busca RPC": "busca_rpc",
+    "Busca Conteudo": "busca_conteudo_ilike",
+    "Busca Categoria": "busca_categoria_ilike",
+}
+
+
+async def _executar_consulta_no_pool(descricao: str, consulta, *args) -> list[dict]:
+    loop = asyncio.get_running_loop()
+    try:
+        with metricas.medir(ETAPAS_CONSULTA.get(descricao, descricao)) as medicao:
+            resultado = await loop.run_in_executor(_executor_busca, consulta, *args)
+            medicao.linhas = len(resultado)
+        if resultado:
+            print(f"   [{descricao}] Encontrados {len(resultado)} resultados")
+        return resultado
+    except Exception as e:
+        print(f"   [ERRO {descricao}] {e}")
+        return []
 
 
-def _buscar_contextos_da_base(pergunta: str) -> tuple[list[str], list[dict]]:
+# Palavras-chave do registro encontradas na pergunta que equivalem à relevância 1.0
+PALAVRAS_CHAVE_PARA_RELEVANCIA_MAXIMA = 2
+
+
+@dataclass
+class EtapaBusca:
+    """Uma fonte de contexto do planejador da busca. 'executar' devolve (resultado, relevância de 0 a 1)."""
+    nome: str  # Nome da etapa nas métricas
+    executar: Callable[[], Awaitable[list[tuple[dict, float]]]]
+    trechos: bool = False  # Resultados são trechos de documentos (e não registros da base)
+
+
+def _relevancia_bm25(score: float, referencia: float) -> float:
+    return min(1.0, score / referencia) if referencia > 0 else 0.0
+
+
+async def _buscar_contextos_da_base(pergunta: str, disciplinas: frozenset[str] | None = None) -> tuple[list[ContextoRanqueado], list[dict]]:
     """
-    Busca contexto na base de conhecimento de forma abrangente.
-    Retorna uma tupla: (lista de contextos de texto, lista de documentos com URL).
+    Busca contexto na base de conhecimento em etapas, das fontes mais baratas e precisas
+    (índices locais em memória) para as mais caras (consultas ao banco).
+    A busca termina assim que IA_BUSCA_CONTEXTOS_SUFICIENTES contextos atingem
+    IA_BUSCA_RELEVANCIA_MINIMA, quando o orçamento IA_BUSCA_ORCAMENTO_MS se esgota ou quando
+    o prazo da requisição só deixa a reserva para a geração (IA_PRAZO_RESERVA_GERACAO_SEGUNDOS);
+    as etapas que não rodaram são registradas nas métricas como 'puladas'.
+    Com 'disciplinas', todas as fontes só consideram os registros gerais e os dessas disciplinas.
+    Os resultados de todas as etapas são combinados por reciprocal rank fusion (IA_RRF_K,
+    IA_RRF_PESOS por etapa), e os documentos com URL seguem a ordem do registro de origem.
+    Retorna uma tupla: (contextos ranqueados, do mais para o menos relevante, com o score da
+    fusão; lista de documentos com URL).
     """
-    contextos: list[str] = []
+    fusao = FusaoRankings(settings.IA_RRF_K, settings.IA_RRF_PESOS)
     documentos_com_url: list[dict] = []
-    registros_processados = set()  # Para evitar duplicatas
+
+    def _adicionar_item(fonte: str, item: dict, relevancia: float) -> bool:
+        """Põe o registro no ranking da fonte; retorna True se ele trouxe um contexto novo."""
+        id_reg = item.get("id_conhecimento")
+        if not id_reg:
+            return False
+        if str(id_reg) not in fusao:
+            url_doc = item.get("url_documento")
+            if url_doc:
+                documentos_com_url.append({
+                    "url_documento": url_doc,
+                    "nome_arquivo": item.get("nome_arquivo_origem", "documento"),
+                    "id_conhecimento": id_reg
+                })
+        conteudo = item.get("conteudo_processado", "")
+        if fonte == "busca_rpc":
+            # O conteúdo original só é usado como contexto quando vem da RPC
+            conteudo = conteudo or item.get("conteudo_original") or ""
+        return fusao.adicionar(fonte, str(id_reg), conteudo, relevancia, id_conhecimento=str(id_reg))
 
     # Normaliza a pergunta para busca
-    import re
     pergunta_lower = pergunta.lower().strip()
-    # Remove pontuação e extrai palavras-chave (mínimo 3 caracteres, exclui palavras comuns)
-    palavras_comuns = {"que", "qual", "quais", "como", "onde", "quando", "por", "para", "com", "sem", "sobre", "este", "esta", "isso", "isso"}
-    palavras_raw = re.findall(r'\b\w+\b', pergunta_lower)
-    palavras_chave_pergunta = [p for p in palavras_raw if len(p) >= 3 and p not in palavras_comuns]
+    palavras_chave_pergunta = _extrair_palavras_chave(pergunta_lower)
 
     print(f"   [Busca] Procurando por: '{pergunta_lower}'")
     print(f"   [Busca] Palavras-chave extraídas: {palavras_chave_pergunta}")
+    if disciplinas:
+        print(f"   [Busca] Restrita a {len(disciplinas)} disciplina(s) do aluno e aos registros gerais")
+    elif disciplinas is not None:
+        print("   [Busca] Restrita aos registros gerais")
 
+    inicio = time.perf_counter()
+    relevantes = 0
+    etapas_executadas: list[str] = []
     try:
-        # 1) Tenta via função RPC (busca semântica/vetorial) - mas não depende só dela
-        try:
-            search_response = supabase.rpc(
-                "buscar_conteudo", {"query": pergunta}
-            ).execute()
-
-            if search_response.data:
-                print(f"   [Busca RPC] Encontrados {len(search_response.data)} resultados via RPC")
-                for item in search_response.data:
-                    id_reg = item.get("id_conhecimento")
-                    if id_reg and id_reg not in registros_processados:
-                        registros_processados.add(id_reg)
-                        conteudo = item.get("conteudo_processado") or item.get("conteudo_original") or ""
-                        if conteudo:
-                            contextos.append(conteudo)
-                        
-                        url_doc = item.get("url_documento")
-                        if url_doc:
-                            documentos_com_url.append({
-                                "url_documento": url_doc,
-                                "nome_arquivo": item.get("nome_arquivo_origem", "documento"),
-                                "id_conhecimento": id_reg
-                            })
-        except Exception as e:
-            print(f"   [Busca RPC] RPC não disponível ou erro: {e}")
-
-        # 2) Busca direta na tabela - SEMPRE executa (não é só fallback)
-        # 2.1) Busca em conteudo_processado (busca pela pergunta completa E por termos individuais)
-        try:
-            # Busca pela pergunta completa
-            busca_conteudo = (
-                supabase.table("baseconhecimento")
-                .select("id_conhecimento, conteudo_processado, url_documento, nome_arquivo_origem, palavra_chave, categoria")
-                .ilike("conteudo_processado", f"%{pergunta_lower}%")
-                .eq("status", "publicado")
-                .limit(10)
-                .execute()
+        # Índices locais: palavras-chave, BM25 (conteúdo, categoria, palavras-chave e nome do
+        # arquivo), que substitui as buscas 'ilike' por termo, vetorial (semântico), que não
+        # depende da RPC do banco, e o dos trechos do texto dos documentos.
+        loop = asyncio.get_running_loop()
+        with metricas.medir("indices_locais"):
+            indice_disponivel, vetorial_disponivel, trechos_disponivel, palavras_disponivel = await asyncio.gather(
+                loop.run_in_executor(_executor_busca, indice_bm25.garantir_indice),
+                loop.run_in_executor(_executor_busca, indice_vetorial.garantir_indice),
+                loop.run_in_executor(_executor_busca, trechos_documento.garantir_indice),
+                loop.run_in_executor(_executor_busca, indice_palavras_chave.garantir_indice),
             )
 
-            if busca_conteudo.data:
-                print(f"   [Busca Conteudo] Encontrados {len(busca_conteudo.data)} resultados em conteudo_processado (pergunta completa)")
-                for item in busca_conteudo.data:
-                    id_reg = item.get("id_conhecimento")
-                    if id_reg and id_reg not in registros_processados:
-                        registros_processados.add(id_reg)
-                        conteudo = item.get("conteudo_processado", "")
-                        if conteudo:
-                            contextos.append(conteudo)
-                        
-                        url_doc = item.get("url_documento")
-                        if url_doc:
-                            documentos_com_url.append({
-                                "url_documento": url_doc,
-                                "nome_arquivo": item.get("nome_arquivo_origem", "documento"),
-                                "id_conhecimento": id_reg
-                            })
-            
-            # Busca por termos individuais (se houver palavras-chave)
-            if palavras_chave_pergunta:
-                for termo in palavras_chave_pergunta:
-                    busca_termo = (
-                        supabase.table("baseconhecimento")
-                        .select("id_conhecimento, conteudo_processado, url_documento, nome_arquivo_origem, palavra_chave, categoria")
-                        .ilike("conteudo_processado", f"%{termo}%")
-                        .eq("status", "publicado")
-                        .limit(10)
-                        .execute()
-                    )
-                    
-                    if busca_termo.data:
-                        print(f"   [Busca Conteudo] Encontrados {len(busca_termo.data)} resultados para termo '{termo}'")
-                        for item in busca_termo.data:
-                            id_reg = item.get("id_conhecimento")
-                            if id_reg and id_reg not in registros_processados:
-                                registros_processados.add(id_reg)
-                                conteudo = item.get("conteudo_processado", "")
-                                if conteudo:
-                                    contextos.append(conteudo)
-                                
-                                url_doc = item.get("url_documento")
-                                if url_doc:
-                                    documentos_com_url.append({
-                                        "url_documento": url_doc,
-                                        "nome_arquivo": item.get("nome_arquivo_origem", "documento"),
-                                        "id_conhecimento": id_reg
-                                    })
-        except Exception as e:
-            print(f"   [ERRO Busca Conteudo] {e}")
+        def _etapa_local(nome: str, buscar) -> Callable[[], Awaitable[list[tuple[dict, float]]]]:
+            async def _executar() -> list[tuple[dict, float]]:
+                with metricas.medir(nome) as medicao:
+                    resultados = buscar()
+                    medicao.linhas = len(resultados)
+                return resultados
+            return _executar
 
-        # 2.2) Busca em categoria (busca pela pergunta completa E por termos individuais)
-        try:
-            # Busca pela pergunta completa
-            busca_categoria = (
-                supabase.table("baseconhecimento")
-                .select("id_conhecimento, conteudo_processado, url_documento, nome_arquivo_origem, palavra_chave, categoria")
-                .ilike("categoria", f"%{pergunta_lower}%")
-                .eq("status", "publicado")
-                .limit(10)
-                .execute()
+        def _etapa_banco(*consultas: tuple) -> Callable[[], Awaitable[list[tuple[dict, float]]]]:
+            # Cada consulta: (relevância dos resultados, descrição, função, *args); rodam em paralelo
+            async def _executar() -> list[tuple[dict, float]]:
+                resultados = await asyncio.gather(*[_executar_consulta(*consulta[1:]) for consulta in consultas])
+                return [(item, consulta[0]) for consulta, itens in zip(consultas, resultados) for item in itens]
+            return _executar
+
+        def _palavras_chave() -> list[tuple[dict, float]]:
+            return [
+                (item, min(1.0, quantidade / PALAVRAS_CHAVE_PARA_RELEVANCIA_MAXIMA))
+                for item, quantidade in indice_palavras_chave.buscar(pergunta, limite=10, disciplinas=disciplinas)
+            ]
+
+        def _bm25() -> list[tuple[dict, float]]:
+            referencia = indice_bm25.score_referencia(pergunta)
+            return [(item, _relevancia_bm25(score, referencia)) for item, score in indice_bm25.buscar(pergunta, limite=10, disciplinas=disciplinas)]
+
+        def _vetorial() -> list[tuple[dict, float]]:
+            # Similaridade de cosseno, já entre 0 e 1
+            return indice_vetorial.buscar(pergunta, limite=10, disciplinas=disciplinas)
+
+        def _trechos() -> list[tuple[dict, float]]:
+            referencia = trechos_documento.score_referencia(pergunta)
+            return [(trecho, _relevancia_bm25(score, referencia)) for trecho, score in trechos_documento.buscar(pergunta, disciplinas=disciplinas)]
+
+        # Plano, das fontes mais baratas e precisas para as mais caras:
+        # 1) palavras-chave  2) BM25  3) vetorial local  4) trechos dos documentos  (memória)
+        # 5) RPC (busca semântica)  6) conteudo_processado  7) categoria  (banco)
+        # A RPC e o texto inteiro da pergunta encontrado numa coluna contam como resultado relevante.
+        # As buscas por termo só rodam sem o índice BM25 (uma consulta por coluna, com todos os
+        # termos) e não contam para a parada antecipada.
+        # As colunas consultadas são as normalizadas ('_busca'), então "avaliacao" encontra "avaliações".
+        termos_pergunta = tuple(palavras_chave_pergunta)
+        etapas: list[EtapaBusca] = []
+        if palavras_disponivel:
+            etapas.append(EtapaBusca("busca_palavras_chave", _etapa_local("busca_palavras_chave", _palavras_chave)))
+        if indice_disponivel:
+            etapas.append(EtapaBusca("busca_bm25", _etapa_local("busca_bm25", _bm25)))
+        else:
+            print("   [Busca Indice] Índice indisponível. Usando busca por termos no banco.")
+        if vetorial_disponivel:
+            etapas.append(EtapaBusca("busca_vetorial", _etapa_local("busca_vetorial", _vetorial)))
+        if trechos_disponivel:
+            etapas.append(EtapaBusca("busca_trechos", _etapa_local("busca_trechos", _trechos), trechos=True))
+
+        consultas_conteudo = [(1.0, "Busca Conteudo", _consulta_ilike, "conteudo_processado", pergunta_lower, disciplinas)]
+        consultas_categoria = [(1.0, "Busca Categoria", _consulta_ilike, "categoria", pergunta_lower, disciplinas)]
+        if not indice_disponivel:
+            consultas_conteudo.append(
+                (0.0, "Busca Conteudo", _consulta_algum_termo, "conteudo_processado", termos_pergunta, disciplinas)
             )
+            consultas_categoria.append((0.0, "Busca Categoria", _consulta_algum_termo, "categoria", termos_pergunta, disciplinas))
+        etapas.append(EtapaBusca("busca_rpc", _etapa_banco((1.0, "Busca RPC", _consulta_rpc, pergunta, disciplinas))))
+        etapas.append(EtapaBusca("busca_conteudo_ilike", _etapa_banco(*consultas_conteudo)))
+        etapas.append(EtapaBusca("busca_categoria_ilike", _etapa_banco(*consultas_categoria)))
 
-            if busca_categoria.data:
-                print(f"   [Busca Categoria] Encontrados {len(busca_categoria.data)} resultados em categoria (pergunta completa)")
-                for item in busca_categoria.data:
-                    id_reg = item.get("id_conhecimento")
-                    if id_reg and id_reg not in registros_processados:
-                        registros_processados.add(id_reg)
-                        conteudo = item.get("conteudo_processado", "")
-                        if conteudo:
-                            contextos.append(conteudo)
-                        
-                        url_doc = item.get("url_documento")
-                        if url_doc:
-                            documentos_com_url.append({
-                                "url_documento": url_doc,
-                                "nome_arquivo": item.get("nome_arquivo_origem", "documento"),
-                                "id_conhecimento": id_reg
-                            })
-            
-            # Busca por termos individuais em categoria
-            if palavras_chave_pergunta:
-                for termo in palavras_chave_pergunta:
-                    busca_cat_termo = (
-                        supabase.table("baseconhecimento")
-                        .select("id_conhecimento, conteudo_processado, url_documento, nome_arquivo_origem, palavra_chave, categoria")
-                        .ilike("categoria", f"%{termo}%")
-                        .eq("status", "publicado")
-                        .limit(10)
-                        .execute()
-                    )
-                    
-                    if busca_cat_termo.data:
-                        print(f"   [Busca Categoria] Encontrados {len(busca_cat_termo.data)} resultados para termo '{termo}' em categoria")
-                        for item in busca_cat_termo.data:
-                            id_reg = item.get("id_conhecimento")
-                            if id_reg and id_reg not in registros_processados:
-                                registros_processados.add(id_reg)
-                                conteudo = item.get("conteudo_processado", "")
-                                if conteudo:
-                                    contextos.append(conteudo)
-                                
-                                url_doc = item.get("url_documento")
-                                if url_doc:
-                                    documentos_com_url.append({
-                                        "url_documento": url_doc,
-                                        "nome_arquivo": item.get("nome_arquivo_origem", "documento"),
-                                        "id_conhecimento": id_reg
-                                    })
-        except Exception as e:
-            print(f"   [ERRO Busca Categoria] {e}")
-
-        # 2.3) Busca em palavra_chave (JSONB) - busca por cada palavra-chave da pergunta
-        if palavras_chave_pergunta:
-            try:
-                # Busca todos os registros publicados e filtra localmente por palavra_chave
-                busca_palavras = (
-                    supabase.table("baseconhecimento")
-                    .select("id_conhecimento, conteudo_processado, url_documento, nome_arquivo_origem, palavra_chave, categoria")
-                    .eq("status", "publicado")
-                    .limit(50)  # Busca mais registros para filtrar localmente
-                    .execute()
-                )
+        # O orçamento conta a partir das etapas: a (re)construção dos índices locais fica de fora
+        suficientes = settings.IA_BUSCA_CONTEXTOS_SUFICIENTES
+        orcamento_ms = settings.IA_BUSCA_ORCAMENTO_MS
+        inicio_etapas = time.perf_counter()
+        for posicao, etapa in enumerate(etapas):
+            decorrido_ms = (time.perf_counter() - inicio_etapas) * 1000
+            if suficientes and relevantes >= suficientes:
+                motivo = "contextos_suficientes"
+            elif orcamento_ms and decorrido_ms >= orcamento_ms:
+                motivo = "orcamento_esgotado"
+            elif prazo.esgotado(reserva=settings.IA_PRAZO_RESERVA_GERACAO_SEGUNDOS):
+                motivo = "prazo_esgotado"
+            else:
+                motivo = None
+            if motivo:
+                puladas = [e.nome for e in etapas[posicao:]]
+                for nome in puladas:
+                    metricas.pular(nome, motivo)
+                print(f"   [Busca] Etapas puladas ({motivo}): {puladas}")
+                break
 
-                if busca_palavras.data:
-                    print(f"   [Busca Palavras] Analisando {len(busca_palavras.data)} registros para palavras-chave")
-                    for item in busca_palavras.data:
-                        id_reg = item.get("id_conhecimento")
-                        if id_reg and id_reg not in registros_processados:
-                            # Processa palavra_chave (pode ser JSONB ou string)
-                            palavra_chave_data = item.get("palavra_chave")
-                            palavra_chave_str = ""
-                            
-                            if isinstance(palavra_chave_data, list):
-                                palavra_chave_str = " ".join([str(p).lower() for p in palavra_chave_data])
-                            elif isinstance(palavra_chave_data, str):
-                                # Tenta fazer parse se for JSON string
-                                try:
-                                    import json
-                                    parsed = json.loads(palavra_chave_data)
-                                    if isinstance(parsed, list):
-                                        palavra_chave_str = " ".join([str(p).lower() for p in parsed])
-                                    else:
-                                        palavra_chave_str = str(palavra_chave_data).lower()
-                                except:
-                                    palavra_chave_str = str(palavra_chave_data).lower()
-                            else:
-                                palavra_chave_str = str(palavra_chave_data or "").lower()
-                            
-                            # Verifica se alguma palavra da pergunta está nas palavras-chave (match exato ou parcial)
-                            # Também verifica se alguma palavra-chave está na pergunta
-                            match_encontrado = False
-                            for palavra in palavras_chave_pergunta:
-                                if palavra in palavra_chave_str or any(palavra in str(pk).lower() for pk in (palavra_chave_data if isinstance(palavra_chave_data, list) else [])):
-                                    match_encontrado = True
-                                    break
-                            
-                            if match_encontrado:
-                                registros_processados.add(id_reg)
-                                conteudo = item.get("conteudo_processado", "")
-                                if conteudo:
-                                    contextos.append(conteudo)
-                                
-                                url_doc = item.get("url_documento")
-                                if url_doc:
-                                    documentos_com_url.append({
-                                        "url_documento": url_doc,
-                                        "nome_arquivo": item.get("nome_arquivo_origem", "documento"),
-                                        "id_conhecimento": id_reg
-                                    })
-            except Exception as e:
-                print(f"   [ERRO Busca Palavras] {e}")
+            resultados = await etapa.executar()
+            etapas_executadas.append(etapa.nome)
+            # Dentro de uma etapa com várias consultas, os resultados mais relevantes ficam na frente
+            for item, relevancia in sorted(resultados, key=lambda r: -r[1]):
+                if etapa.trechos:
+                    texto_trecho = trechos_documento.formatar_trecho(item)
+                    chave = f"trecho:{item.get('id_trecho') or texto_trecho}"
+                    novo = fusao.adicionar(etapa.nome, chave, texto_trecho, relevancia)
+                else:
+                    novo = _adicionar_item(etapa.nome, item, relevancia)
+                if novo and relevancia >= settings.IA_BUSCA_RELEVANCIA_MINIMA:
+                    relevantes += 1
+            if resultados:
+                print(f"   [Busca] Etapa {etapa.nome}: {len(resultados)} resultados ({relevantes} contextos relevantes até aqui)")
 
     except Exception as e:
         print(f"   [ERRO Busca Geral] Erro ao buscar na base: {e}")
         import traceback
         traceback.print_exc()
 
-    # Remove strings vazias para não poluir o contexto
-    contextos_limpos = [c for c in contextos if c]
-    print(f"   [Busca] Total de contextos encontrados: {len(contextos_limpos)}")
+    ranking = fusao.ranking()
+    posicao_do_registro = {item.id_conhecimento: i for i, item in enumerate(ranking) if item.id_conhecimento}
+    documentos_com_url.sort(key=lambda doc: posicao_do_registro.get(str(doc["id_conhecimento"]), len(ranking)))
+
+    # Remove itens sem texto (registros só com URL) para não poluir o contexto
+    contextos_ranqueados = [item for item in ranking if item.texto]
+    metricas.observar("busca_total", (time.perf_counter() - inicio) * 1000, Medicao(contextos=len(contextos_ranqueados)))
+    print(f"   [Busca] Total de contextos encontrados: {len(contextos_ranqueados)} em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    print(f"   [Busca] Etapas executadas: {etapas_executadas}")
     print(f"   [Busca] Total de documentos com URL: {len(documentos_com_url)}")
     
-    return (contextos_limpos, documentos_com_url)
+    return (contextos_ranqueados, documentos_com_url)
 
 
-def _processar_documento_da_url(url_documento: str, pergunta: str) -> str:
+async def _processar_documento_da_url(url_documento: str, pergunta: str) -> str:
     """
-    Baixa um documento da URL e processa com Gemini para extrair informação relevante.
+    Obtém o documento da URL (via cache local) e processa com Gemini para extrair informação relevante.
+    O download e o upload para o Gemini só são refeitos quando o documento muda ou o upload expira.
     """
     print(f"   [Documento] Processando documento da URL: {url_documento}")
     
     try:
-        # Baixa o arquivo temporariamente
-        response = requests.get(url_documento, timeout=30)
-        response.raise_for_status()
-        
-        # Determina o tipo MIME baseado na extensão ou Content-Type
-        content_type = response.headers.get("Content-Type", "application/pdf")
-        if "pdf" in content_type.lower() or url_documento.lower().endswith(".pdf"):
-            mime_type = "application/pdf"
-        elif "word" in content_type.lower() or url_documento.lower().endswith((".docx", ".doc")):
-            mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        elif "text" in content_type.lower() or url_documento.lower().endswith(".txt"):
-            mime_type = "text/plain"
-        else:
-            mime_type = "application/octet-stream"
-        
-        # Salva temporariamente
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(url_documento)[1]) as tmp_file:
-            tmp_file.write(response.content)
-            tmp_path = tmp_file.name
+        # Baixa (ou reutiliza) o arquivo e o upload já feito para o Gemini
+        documento = await asyncio.to_thread(cache_documentos.obter_documento, url_documento)
+        uploaded_file = await cache_documentos.obter_arquivo_gemini(documento)
         
-        try:
-            # Faz upload para o Gemini
-            with open(tmp_path, "rb") as f:
-                uploaded_file = genai.upload_file(f, mime_type=mime_type)
-            
-            # Prompt para extrair informação relevante
-            prompt = f"""
+        # Prompt para extrair informação relevante
+        prompt = f"""
 Você é um assistente acadêmico. Leia o documento fornecido e extraia APENAS as informações relevantes para responder à seguinte pergunta:
 
 PERGUNTA: {pergunta}
@@ -316,21 +375,14 @@ INSTRUÇÕES:
 - Seja conciso e objetivo.
 - Retorne apenas o texto extraído, sem comentários adicionais.
 """
-            
-            # Processa com Gemini
-            response_gemini = gemini_model.generate_content([prompt, uploaded_file])
-            resultado = response_gemini.text.strip()
-            
-            print(f"   [Documento] Informação extraída do documento (primeiros 200 chars): {resultado[:200]}...")
-            
-            return resultado
-            
-        finally:
-            # Remove arquivo temporário
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        
+        # Processa com Gemini
+        response_gemini = await gateway_llm.gerar([prompt, uploaded_file])
+        resultado = response_gemini.text.strip()
+        
+        print(f"   [Documento] Informação extraída do documento (primeiros 200 chars): {resultado[:200]}...")
+        
+        return resultado
                 
     except Exception as e:
         print(f"   [ERRO Documento] Falha ao processar documento: {e}")
@@ -338,71 +390,883 @@ INSTRUÇÕES:
 
 
 
-@router.post("/gerar-resposta")
-async def gerar_resposta_com_ia(request: GenerationRequest, current_user: dict = Depends(require_all)):
+async def _processar_documentos_em_paralelo(documentos: list[dict], pergunta: str) -> list[str]:
     """
-    Recebe uma pergunta, consulta a base de conhecimento no Supabase de forma abrangente,
-    e se não encontrar resposta suficiente, processa documentos das URLs armazenadas.
+    Processa os documentos ao mesmo tempo, cada um com o seu timeout e todos com um prazo total.
+    Resultados que chegarem depois do prazo são descartados (não esperamos por eles).
+    Retorna o texto extraído de cada documento, na mesma ordem dos documentos.
     """
-    print(f"[IA] Processando pergunta: {request.pergunta}")
+    if not documentos:
+        return []
+    # O prazo total também respeita o prazo da requisição, deixando a reserva para a geração
+    reserva = settings.IA_PRAZO_RESERVA_GERACAO_SEGUNDOS
+    prazo_total = prazo.limitar(settings.IA_DOCUMENTOS_PRAZO_SEGUNDOS, reserva=reserva)
+    if prazo_total <= 0:
+        print("   [Documento] Sem tempo para processar documentos antes do prazo da requisição.")
+        return []
 
-    # 1) Buscar contexto na base de conhecimento (busca abrangente)
-    contextos, documentos_com_url = _buscar_contextos_da_base(request.pergunta)
-    contexto_base = "\n\n---\n\n".join(contextos[:10]) if contextos else ""
-    
-    print(f"[IA] Contextos encontrados na base: {len(contextos)}")
-    print(f"[IA] Documentos com URL disponíveis: {len(documentos_com_url)}")
+    async def _processar(doc: dict) -> str:
+        try:
+            return await asyncio.wait_for(
+                _processar_documento_da_url(doc["url_documento"], pergunta),
+                timeout=prazo.limitar(settings.IA_DOCUMENTO_TIMEOUT_SEGUNDOS, reserva=reserva),
+            )
+        except asyncio.TimeoutError:
+            print(f"   [ERRO] Tempo esgotado ao processar documento {doc['url_documento']}")
+        except Exception as e:
+            print(f"   [ERRO] Falha ao processar documento {doc['url_documento']}: {e}")
+        return ""
 
-    # 2) Se não encontrou contexto suficiente, processa documentos das URLs
-    contexto_documentos = ""
-    if not contexto_base or len(contextos) < 2:
-        print("[IA] Contexto insuficiente. Processando documentos das URLs...")
-        for doc in documentos_com_url[:3]:  # Limita a 3 documentos para não sobrecarregar
-            try:
-                resultado_doc = _processar_documento_da_url(doc["url_documento"], request.pergunta)
-                if resultado_doc and "Nenhuma informação relevante" not in resultado_doc:
-                    contexto_documentos += f"\n\n--- Documento: {doc['nome_arquivo']} ---\n{resultado_doc}\n"
-            except Exception as e:
-                print(f"   [ERRO] Falha ao processar documento {doc['url_documento']}: {e}")
-                continue
+    tarefas = [asyncio.create_task(_processar(doc)) for doc in documentos]
+    concluidas, pendentes = await asyncio.wait(tarefas, timeout=prazo_total)
+    for tarefa in pendentes:
+        tarefa.cancel()
+    if pendentes:
+        print(f"   [Documento] Prazo total esgotado. {len(pendentes)} documento(s) descartado(s).")
+
+    contextos_documentos: list[str] = []
+    for doc, tarefa in zip(documentos, tarefas):
+        if tarefa not in concluidas:
+            continue
+        resultado_doc = tarefa.result()
+        if resultado_doc and "Nenhuma informação relevante" not in resultado_doc:
+            contextos_documentos.append(f"--- Documento: {doc['nome_arquivo']} ---\n{resultado_doc}")
+    return contextos_documentos
 
-    # 3) Combinar todos os contextos
-    partes_contexto: list[str] = []
-    if request.contexto:
-        partes_contexto.append(str(request.contexto))
-    if contexto_base:
-        partes_contexto.append(contexto_base)
-    if contexto_documentos:
-        partes_contexto.append(contexto_documentos)
 
-    contexto_final = (
+def _combinar_contextos(*partes: str | None) -> str:
+    partes_contexto = [str(parte) for parte in partes if parte]
+    return (
         "\n\n---\n\n".join(partes_contexto)
         if partes_contexto
         else "NENHUM CONTEXTO DISPONÍVEL."
     )
 
-    # 4) Montar o prompt para o Gemini
-    prompt = f"""
-Você é um assistente acadêmico. Sua tarefa é responder à pergunta do usuário de forma clara, objetiva e pedagógica.
+
+# Resposta pedida ao Gemini quando o contexto não responde à pergunta; sem contexto nenhum ela é
+# devolvida direto, sem chamar o Gemini (IA_SEM_CONTEXTO_CURTO_CIRCUITO)
+RESPOSTA_SEM_CONTEXTO = "Com base no material que tenho, não encontrei uma resposta para sua pergunta."
+
+# Instruções fixas do prompt (também registradas como system_instruction nos prefixos em cache)
+INSTRUCOES_PROMPT = f"""Você é um assistente acadêmico. Sua tarefa é responder à pergunta do usuário de forma clara, objetiva e pedagógica.
 Baseie-se EXCLUSIVAMENTE no contexto fornecido abaixo (que vem da base de conhecimento do sistema e documentos processados).
 Não use nenhum conhecimento externo ou invente informações.
 Se a resposta não estiver claramente presentes no contexto, diga exatamente:
-"Com base no material que tenho, não encontrei uma resposta para sua pergunta.".
+"{RESPOSTA_SEM_CONTEXTO}"."""
+
+
+def _cabecalho_prompt(contexto_final: str) -> str:
+    return f"""
+{INSTRUCOES_PROMPT}
 
 ================ CONTEXTO =================
 {contexto_final}
 ===========================================
+"""
+
+
+def _montar_prompt(contexto_final: str, pergunta: str) -> str:
+    return _cabecalho_prompt(contexto_final) + f"""
+Pergunta do usuário: {pergunta}
+
+Responda de forma concisa e bem estruturada:
+"""
 
-Pergunta do usuário: {request.pergunta}
+
+def _montar_prompt_com_prefixo(contextos_restantes: list[str], pergunta: str) -> str:
+    """
+    Parte do prompt enviada quando as instruções e parte dos contextos selecionados já estão
+    num prefixo em cache no provedor: só os contextos que não estão nele e a pergunta.
+    """
+    contexto_adicional = ""
+    if contextos_restantes:
+        contexto_adicional = f"""
+============ CONTEXTO ADICIONAL ============
+{_combinar_contextos(*contextos_restantes)}
+===========================================
+"""
+    return contexto_adicional + f"""
+Pergunta do usuário: {pergunta}
 
 Responda de forma concisa e bem estruturada:
 """
 
+
+def _montar_prompt_lote(contexto_final: str, perguntas: list[str]) -> str:
+    """Mesmo prompt da pergunta individual, com várias perguntas e resposta em JSON."""
+    perguntas_numeradas = "\n".join(f"{i}. {pergunta}" for i, pergunta in enumerate(perguntas, start=1))
+    return _cabecalho_prompt(contexto_final) + f"""
+Perguntas dos usuários (responda cada uma separadamente, seguindo as regras acima):
+{perguntas_numeradas}
+
+Responda ESTRITAMENTE em JSON válido, sem comentários nem texto extra, no formato:
+{{"respostas": ["resposta da pergunta 1", "resposta da pergunta 2", "..."]}}
+com exatamente {len(perguntas)} respostas, na mesma ordem das perguntas, cada uma concisa e bem estruturada.
+"""
+
+
+@dataclass
+class PreparacaoResposta:
+    prompt: str
+    documentos_com_url: list[dict]
+    chave_cache: str
+    resposta_cache: dict | None = None
+    contextos: list[str] = field(default_factory=list)  # Contextos que entraram no prompt
+    prefixo: str | None = None  # Prefixo em cache no provedor (instruções + contextos selecionados)
+    prompt_com_prefixo: str = ""  # O que é enviado junto com o prefixo (o prompt completo fica de reserva)
+
+
+async def _preparar_resposta(pergunta: str, contexto: str | None, disciplinas: frozenset[str] | None = None) -> PreparacaoResposta:
+    """
+    Executa as etapas anteriores à geração: busca na base, consulta ao cache,
+    fallback por documentos e montagem do prompt.
+    Se a resposta estiver no cache, as etapas seguintes não são executadas.
+    Com 'disciplinas' (as do aluno), a busca fica restrita a elas e aos registros gerais;
+    a base inteira só é consultada se essa busca não encontrar nada. Com ESCOPO_GERAL (conjunto
+    vazio), só os registros gerais, sem ampliar a busca.
+    Sem contexto nenhum (nem do chamador), a resposta padrão vem pronta, sem prompt.
+    """
+    print(f"[IA] Processando pergunta: {pergunta}")
+
+    # Pergunta que há pouco não encontrou nada na base: nem refaz a busca
+    sem_contexto_do_chamador = settings.IA_SEM_CONTEXTO_CURTO_CIRCUITO and not contexto
+    chave_negativa = _chave_sem_contexto(pergunta, disciplinas)
+    if sem_contexto_do_chamador and cache_negativo.obter(chave_negativa):
+        print("[IA] Pergunta sem contexto na base (cache negativo). Resposta padrão sem chamar o Gemini.")
+        return PreparacaoResposta("", [], "", _resposta_sem_contexto())
+
+    # 1) Buscar contexto na base de conhecimento (busca abrangente)
+    ranqueados, documentos_com_url = await _buscar_contextos_da_base(pergunta, disciplinas)
+    if disciplinas and not ranqueados and not documentos_com_url:
+        print("[IA] Nada encontrado nas disciplinas do aluno. Buscando na base inteira...")
+        ranqueados, documentos_com_url = await _buscar_contextos_da_base(pergunta)
+    contextos = [item.texto for item in ranqueados]
+
+    # Segue o ranking da busca, remove duplicatas e corta os contextos para caber no orçamento de tokens do prompt
+    orcamento = settings.IA_CONTEXTO_ORCAMENTO_TOKENS - estimar_tokens(contexto or "")
+    with metricas.medir("empacotamento_contexto") as medicao:
+        contextos_selecionados = empacotar_contextos(
+            pergunta, contextos, orcamento,
+            relevancias=[item.score for item in ranqueados], maximo=settings.IA_CONTEXTO_MAX_CONTEXTOS,
+        )
+        medicao.contextos = len(contextos_selecionados)
+    contexto_base = "\n\n---\n\n".join(contextos_selecionados)
+    
+    print(f"[IA] Contextos encontrados na base: {len(contextos)} ({len(contextos_selecionados)} no prompt)")
+    print(f"[IA] Documentos com URL disponíveis: {len(documentos_com_url)}")
+
+    # Se a mesma pergunta já foi respondida com os mesmos contextos, devolve a resposta do cache
+    chave_cache = gerar_chave(pergunta, contexto, contextos_selecionados)
+    resposta_cache = cache_respostas.obter(chave_cache)
+    if resposta_cache is not None:
+        print("[IA] Resposta encontrada no cache.")
+        return PreparacaoResposta("", documentos_com_url, chave_cache, resposta_cache)
+
+    # 2) Se não encontrou contexto suficiente, processa documentos das URLs (em paralelo)
+    contextos_documentos_selecionados: list[str] = []
+    if not contexto_base or len(contextos) < 2:
+        print("[IA] Contexto insuficiente. Processando documentos das URLs...")
+        # Limita a quantidade de documentos para não sobrecarregar
+        with metricas.medir("documentos_fallback") as medicao:
+            contextos_documentos = await _processar_documentos_em_paralelo(
+                documentos_com_url[:settings.IA_MAX_DOCUMENTOS_FALLBACK], pergunta
+            )
+            medicao.contextos = len(contextos_documentos)
+        # Os trechos dos documentos ocupam o que sobrou do orçamento
+        restante = orcamento - estimar_tokens(contexto_base)
+        contextos_documentos_selecionados = empacotar_contextos(pergunta, contextos_documentos, restante)
+    contexto_documentos = "\n\n".join(contextos_documentos_selecionados)
+
+    # Sem contexto nenhum o Gemini só responderia a frase padrão, então ela é devolvida direto.
+    # Só vai para o cache negativo se a busca não achou nem documentos (o fallback pode ter
+    # falhado por um erro passageiro, como um download lento)
+    if sem_contexto_do_chamador and not contextos_selecionados and not contextos_documentos_selecionados:
+        print("[IA] Nenhum contexto encontrado. Resposta padrão sem chamar o Gemini.")
+        if not documentos_com_url:
+            cache_negativo.guardar(chave_negativa, True)
+        return PreparacaoResposta("", documentos_com_url, chave_cache, _resposta_sem_contexto())
+
+    # 3) Combinar todos os contextos e 4) montar o prompt para o Gemini
+    with metricas.medir("montagem_prompt"):
+        contexto_final = _combinar_contextos(contexto, contexto_base, contexto_documentos)
+        prompt = _montar_prompt(contexto_final, pergunta)
+        preparacao = PreparacaoResposta(
+            prompt, documentos_com_url, chave_cache,
+            contextos=contextos_selecionados + contextos_documentos_selecionados,
+        )
+        # Se as instruções e contextos selecionados já estão em cache no provedor, envia só o resto
+        prefixo, restantes = cache_prefixos.usar(INSTRUCOES_PROMPT, contextos_selecionados)
+        if prefixo is not None:
+            preparacao.prefixo = prefixo.nome
+            preparacao.prompt_com_prefixo = _montar_prompt_com_prefixo(
+                [c for c in [contexto, *restantes, *contextos_documentos_selecionados] if c], pergunta
+            )
+    return preparacao
+
+
+async def _gerar_texto(preparacao: PreparacaoResposta) -> str:
+    """Gera a resposta usando o prefixo em cache, se houver; se o provedor recusar o prefixo, envia o prompt completo."""
+    if preparacao.prefixo:
+        try:
+            response = await gateway_llm.gerar(preparacao.prompt_com_prefixo, prefixo=preparacao.prefixo)
+            return response.text
+        except ERROS_PREFIXO as e:
+            print(f"   [Cache Prefixo] Prefixo {preparacao.prefixo} recusado ({type(e).__name__}); usando o prompt completo")
+            cache_prefixos.descartar(preparacao.prefixo)
+    response = await gateway_llm.gerar(preparacao.prompt)
+    return response.text
+
+
+async def _gerar_texto_stream(preparacao: PreparacaoResposta) -> AsyncIterator[str]:
+    """Versão em streaming de _gerar_texto (o erro de prefixo aparece antes do primeiro trecho)."""
+    if preparacao.prefixo:
+        stream = gateway_llm.gerar_stream(preparacao.prompt_com_prefixo, prefixo=preparacao.prefixo)
+        try:
+            primeiro = await stream.__anext__()
+        except StopAsyncIteration:
+            return
+        except ERROS_PREFIXO as e:
+            print(f"   [Cache Prefixo] Prefixo {preparacao.prefixo} recusado ({type(e).__name__}); usando o prompt completo")
+            cache_prefixos.descartar(preparacao.prefixo)
+        else:
+            yield primeiro
+            async for texto in stream:
+                yield texto
+            return
+    async for texto in gateway_llm.gerar_stream(preparacao.prompt):
+        yield texto
+
+
+async def _gerar_texto_stream_com_prazo(preparacao: PreparacaoResposta) -> AsyncIterator[str]:
+    """
+    _gerar_texto_stream em que o primeiro trecho precisa chegar antes do prazo da requisição
+    (senão, PrazoEsgotado). Depois dele o aluno já está vendo a resposta, então o resto não tem prazo.
+    """
+    stream = _gerar_texto_stream(preparacao)
+    try:
+        primeiro = await asyncio.wait_for(stream.__anext__(), timeout=prazo.restante())
+    except StopAsyncIteration:
+        return
+    except asyncio.TimeoutError:
+        raise PrazoEsgotado("Nenhum trecho da resposta chegou antes do prazo") from None
+    yield primeiro
+    async for texto in stream:
+        yield texto
+
+
+# Chamadas de reserva ao Gemini (hedge), respostas degradadas e respostas sem contexto, para GET /ia/cache/metricas
+hedges_disparados = 0
+hedges_vencedores = 0
+respostas_degradadas = 0
+respostas_sem_contexto = 0
+
+
+def _resposta_sem_contexto() -> dict:
+    global respostas_sem_contexto
+    respostas_sem_contexto += 1
+    return {"resposta": RESPOSTA_SEM_CONTEXTO, "sem_contexto": True}
+
+
+async def _gerar_texto_com_hedge(preparacao: PreparacaoResposta) -> str:
+    """
+    _gerar_texto com uma chamada de reserva: se a primeira passar do percentil IA_HEDGE_PERCENTIL
+    da etapa 'geracao_concluida', uma segunda chamada igual é enviada e vale a que terminar primeiro.
+    Não há reserva sem medições suficientes ou sem vaga livre no gateway.
+    """
+    global hedges_disparados, hedges_vencedores
+    limite_ms = None
+    if settings.IA_HEDGE_ATIVO:
+        limite_ms = metricas.percentil("geracao_concluida", settings.IA_HEDGE_PERCENTIL, settings.IA_HEDGE_AMOSTRAS_MINIMAS)
+    primeira = asyncio.ensure_future(_gerar_texto(preparacao))
+    tarefas = [primeira]
+    try:
+        if limite_ms is None:
+            return await primeira
+        concluidas, _ = await asyncio.wait(tarefas, timeout=limite_ms / 1000)
+        if concluidas or gateway_llm.em_andamento >= gateway_llm.max_concorrencia:
+            return await primeira
+
+        print(f"   [Hedge] Geração passou de {limite_ms:.0f} ms; enviando uma chamada de reserva ao Gemini")
+        hedges_disparados += 1
+        tarefas.append(asyncio.ensure_future(_gerar_texto(preparacao)))
+        pendentes = set(tarefas)
+        while pendentes:
+            concluidas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in concluidas:
+                if tarefa.exception() is None:
+                    hedges_vencedores += int(tarefa is not primeira)
+                    return tarefa.result()
+        # As duas falharam: vale o erro da primeira
+        return primeira.result()
+    finally:
+        for tarefa in tarefas:
+            if not tarefa.done():
+                tarefa.cancel()
+
+
+def _resposta_degradada(preparacao: PreparacaoResposta) -> dict:
+    """
+    Resposta usada quando o Gemini não termina antes do prazo: os trechos da base mais bem
+    ranqueados pelo empacotador e os links dos documentos encontrados.
+    """
+    global respostas_degradadas
+    respostas_degradadas += 1
+    limite = settings.IA_RESPOSTA_DEGRADADA_MAX_CARACTERES
+    trechos = []
+    for contexto in preparacao.contextos[:settings.IA_RESPOSTA_DEGRADADA_TRECHOS]:
+        contexto = contexto.strip()
+        if len(contexto) > limite:
+            contexto = contexto[:limite].rsplit(" ", 1)[0] + "..."
+        trechos.append(f"- {contexto}")
+    if trechos:
+        texto_resposta = (
+            "Não consegui gerar a resposta completa a tempo. Estes são os trechos do material "
+            "mais relacionados à sua pergunta:\n\n" + "\n\n".join(trechos)
+        )
+    else:
+        texto_resposta = "Não consegui gerar a resposta a tempo. Tente novamente em instantes."
+    documentos = [
+        {"nome_arquivo": doc["nome_arquivo"], "url_documento": doc["url_documento"]}
+        for doc in preparacao.documentos_com_url
+    ]
+    return {"resposta": texto_resposta, "documentos": documentos, "degradada": True}
+
+
+def _evento_sse(evento: str, dados: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+# Perguntas iguais feitas ao mesmo tempo compartilham a mesma busca e a mesma chamada ao Gemini.
+# No streaming cada cliente recebe o seu próprio stream, então só a preparação é compartilhada.
+_voos_respostas = SingleFlight()
+_voos_preparacao = SingleFlight()
+
+
+def _chave_escopo(disciplinas: frozenset[str] | None) -> str:
+    return ",".join(sorted(disciplinas)) if disciplinas is not None else "*"
+
+
+def _chave_voo(request: GenerationRequest, disciplinas: frozenset[str] | None = None) -> str:
+    # Alunos com matrículas diferentes veem contextos diferentes, então não compartilham a execução
+    return f"{normalizar_pergunta(request.pergunta)}\x1e{request.contexto or ''}\x1e{_chave_escopo(disciplinas)}"
+
+
+def _chave_sem_contexto(pergunta: str, disciplinas: frozenset[str] | None) -> str:
+    return f"{normalizar_pergunta(pergunta)}\x1e{_chave_escopo(disciplinas)}"
+
+
+async def _escopo_do_usuario(current_user: dict) -> frozenset[str] | None:
+    """
+    Disciplinas do aluno que restringem a busca (IA_ESCOPO_MATRICULAS_ATIVO). None (base inteira)
+    para os outros perfis. Aluno sem matrícula, ou cujas matrículas não puderam ser lidas, fica
+    com ESCOPO_GERAL (conjunto vazio): só os registros gerais, sem disciplina.
+    """
+    if not settings.IA_ESCOPO_MATRICULAS_ATIVO or current_user.get("role") != "aluno" or not current_user.get("id"):
+        return None
+    try:
+        return await asyncio.to_thread(matriculas.disciplinas_do_aluno, str(current_user["id"]))
+    except Exception as e:
+        print(f"   [Escopo] Não foi possível ler as matrículas do aluno: {e}")
+        return matriculas.ESCOPO_GERAL
+
+
+async def _gerar_eventos_resposta(request: GenerationRequest, disciplinas: frozenset[str] | None = None) -> AsyncIterator[str]:
+    """
+    Gera a resposta no formato Server-Sent Events: um evento 'chunk' para cada trecho
+    recebido do Gemini e, no final, um evento 'fim' com os documentos usados como fonte.
+    """
+    preparacao = await _voos_preparacao.executar(
+        _chave_voo(request, disciplinas), lambda: _preparar_resposta(request.pergunta, request.contexto, disciplinas)
+    )
+    fontes = [
+        {"nome_arquivo": doc["nome_arquivo"], "url_documento": doc["url_documento"]}
+        for doc in preparacao.documentos_com_url
+    ]
+
+    if preparacao.resposta_cache is not None:
+        yield _evento_sse("chunk", {"texto": preparacao.resposta_cache["resposta"]})
+        if preparacao.resposta_cache.get("sem_contexto"):
+            yield _evento_sse("fim", {"documentos": fontes, "cache": False, "sem_contexto": True})
+        else:
+            yield _evento_sse("fim", {"documentos": fontes, "cache": True})
+        return
+
+    partes_resposta: list[str] = []
+    try:
+        with metricas.medir("geracao_stream"):
+            async for texto in _gerar_texto_stream_com_prazo(preparacao):
+                partes_resposta.append(texto)
+                yield _evento_sse("chunk", {"texto": texto})
+    except PrazoEsgotado:
+        print("[IA] Prazo esgotado antes do primeiro trecho; enviando resposta degradada")
+        degradada = _resposta_degradada(preparacao)
+        yield _evento_sse("chunk", {"texto": degradada["resposta"]})
+        yield _evento_sse("fim", {"documentos": fontes, "cache": False, "degradada": True})
+        return
+    except LimiteGeminiExcedido as e:
+        yield _evento_sse("erro", {"detail": str(e)})
+        return
+    except Exception as e:
+        yield _evento_sse("erro", {"detail": f"Erro ao comunicar com a API do Gemini: {e}"})
+        return
+
+    cache_respostas.guardar(preparacao.chave_cache, {"resposta": "".join(partes_resposta)})
+    yield _evento_sse("fim", {"documentos": fontes, "cache": False})
+
+
+async def _eventos_resposta_frequente(frequente: dict) -> AsyncIterator[str]:
+    fontes = [
+        {"nome_arquivo": doc["nome_arquivo"], "url_documento": doc["url_documento"]}
+        for doc in frequente.get("documentos") or []
+    ]
+    yield _evento_sse("chunk", {"texto": frequente["resposta"]})
+    yield _evento_sse("fim", {"documentos": fontes, "cache": True})
+
+
+async def _eventos_resposta_direta(direta: dict) -> AsyncIterator[str]:
+    yield _evento_sse("chunk", {"texto": direta["resposta"]})
+    yield _evento_sse("fim", {"documentos": [], "cache": False, "intencao": direta["intencao"]})
+
+
+@router.post("/gerar-resposta")
+async def gerar_resposta_com_ia(request: GenerationRequest, http_request: Request, response: Response, current_user: dict = Depends(require_all)):
+    """
+    Recebe uma pergunta, consulta a base de conhecimento no Supabase de forma abrangente,
+    e se não encontrar resposta suficiente, processa documentos das URLs armazenadas.
+    Com o cabeçalho 'Accept: text/event-stream' a resposta é enviada em streaming (SSE),
+    à medida que o Gemini gera o texto.
+    Perguntas sobre horário de aula, professor da disciplina, provas e prazos de trabalhos são
+    respondidas direto das tabelas, sem o Gemini ('intencao' indica qual consulta foi feita).
+    Se o Gemini não responder dentro do prazo (IA_PRAZO_RESPOSTA_SEGUNDOS ou o 'prazo_segundos'
+    do cliente, o menor), devolve uma resposta degradada com os trechos mais relevantes da base
+    e os links dos documentos ('degradada': true).
+    """
+    medicoes = iniciar_requisicao()
+    prazos = [p for p in (settings.IA_PRAZO_RESPOSTA_SEGUNDOS, request.prazo_segundos) if p]
+    if prazos:
+        prazo.definir(min(prazos))
+    streaming = "text/event-stream" in http_request.headers.get("accept", "")
+
+    # Para alunos, a busca fica restrita às disciplinas em que estão matriculados
+    disciplinas = await _escopo_do_usuario(current_user)
+
+    # Dúvidas frequentes já respondidas em segundo plano não passam pela busca nem pelo Gemini.
+    # Essas respostas só usam os registros gerais, visíveis em qualquer escopo
+    frequente = None
+    if settings.IA_FAQ_ATIVO and not request.contexto:
+        frequente = respostas_frequentes.buscar(request.pergunta)
+    if frequente is not None:
+        print(f"[IA] Resposta pré-gerada para a dúvida frequente: {frequente['pergunta']}")
+        if streaming:
+            return StreamingResponse(
+                _eventos_resposta_frequente(frequente),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        return {"resposta": frequente["resposta"]}
+
+    # Horário de aula, professor da disciplina, provas e prazos de trabalhos vêm direto das tabelas
+    if settings.IA_INTENCOES_ATIVO and not request.contexto:
+        if roteador_intencoes.precisa_carregar():
+            await asyncio.to_thread(roteador_intencoes.carregar)
+        with metricas.medir("roteador_intencoes"):
+            direta = roteador_intencoes.responder(request.pergunta, disciplinas)
+        if direta is not None:
+            print(f"[IA] Resposta direta das tabelas (intenção: {direta['intencao']})")
+            if streaming:
+                return StreamingResponse(
+                    _eventos_resposta_direta(direta),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                )
+            return direta
+
+    if streaming:
+        return StreamingResponse(
+            _gerar_eventos_resposta(request, disciplinas),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        with metricas.medir("total"):
+            return await _voos_respostas.executar(
+                _chave_voo(request, disciplinas), lambda: _gerar_resposta(request.pergunta, request.contexto, disciplinas)
+            )
+    finally:
+        # Quem só aguardou a execução de outra requisição igual recebe apenas o 'total'
+        if settings.IA_METRICAS_SERVER_TIMING:
+            response.headers["Server-Timing"] = cabecalho_server_timing(medicoes)
+
+
+async def _gerar_resposta(pergunta: str, contexto: str | None, disciplinas: frozenset[str] | None = None) -> dict:
+    preparacao = await _preparar_resposta(pergunta, contexto, disciplinas)
+    if preparacao.resposta_cache is not None:
+        return preparacao.resposta_cache
+
     try:
-        response = gemini_model.generate_content(prompt)
-        return {"resposta": response.text}
+        with metricas.medir("geracao"):
+            inicio = time.perf_counter()
+            texto_resposta = await asyncio.wait_for(_gerar_texto_com_hedge(preparacao), timeout=prazo.restante())
+            # Base do percentil do hedge: só gerações que terminaram (prazos esgotados e erros
+            # entram em 'geracao', mas puxariam o percentil para o valor do próprio prazo)
+            metricas.observar("geracao_concluida", (time.perf_counter() - inicio) * 1000)
+        resposta = {"resposta": texto_resposta}
+        cache_respostas.guardar(preparacao.chave_cache, resposta)
+        return resposta
+    except (PrazoEsgotado, asyncio.TimeoutError):
+        # A resposta degradada não vai para o cache: a próxima pergunta igual tenta o Gemini de novo
+        print("[IA] Prazo esgotado antes do fim da geração; devolvendo resposta degradada")
+        return _resposta_degradada(preparacao)
+    except LimiteGeminiExcedido as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erro ao comunicar com a API do Gemini: {e}",
         )
+
+
+@dataclass
+class PerguntaDoLote:
+    pergunta: str
+    contextos: list[str]
+    chave_cache: str
+    resposta: str | None = None
+    erro: str | None = None
+    cache: bool = False
+
+
+def _extrair_respostas_json(texto: str, quantidade: int) -> list[str] | None:
+    """Interpreta a resposta JSON do prompt em lote. Retorna None se o formato não for o esperado."""
+    texto = texto.strip()
+    # Às vezes o modelo devolve ```json ... ```, então limpamos isso
+    if texto.startswith("```"):
+        texto = texto.strip("`")
+        if texto.lower().startswith("json"):
+            texto = texto[4:]
+    try:
+        respostas = json.loads(texto).get("respostas")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    if not isinstance(respostas, list) or len(respostas) != quantidade:
+        return None
+    return [str(resposta).strip() for resposta in respostas]
+
+
+def _agrupar_por_contexto(itens: list[PerguntaDoLote], orcamento: int) -> list[list[PerguntaDoLote]]:
+    """
+    Agrupa perguntas cujos contextos se sobrepõem, para responder várias numa única chamada,
+    respeitando o máximo de perguntas por chamada e o orçamento de tokens do contexto.
+    """
+    grupos: list[tuple[list[PerguntaDoLote], list[str]]] = []
+    for item in itens:
+        conjunto = set(item.contextos)
+        for perguntas_grupo, contextos_grupo in grupos:
+            if len(perguntas_grupo) >= settings.IA_LOTE_PERGUNTAS_POR_CHAMADA or not conjunto:
+                continue
+            comuns = conjunto & set(contextos_grupo)
+            if len(comuns) / len(conjunto) < settings.IA_LOTE_SOBREPOSICAO_MINIMA:
+                continue
+            novos = [c for c in item.contextos if c not in comuns]
+            if estimar_tokens("".join(contextos_grupo + novos)) > orcamento:
+                continue
+            perguntas_grupo.append(item)
+            contextos_grupo.extend(novos)
+            break
+        else:
+            grupos.append(([item], list(item.contextos)))
+    return [perguntas_grupo for perguntas_grupo, _ in grupos]
+
+
+async def _responder_grupo(grupo: list[PerguntaDoLote], contexto: str | None) -> None:
+    contextos_grupo: list[str] = []
+    for item in grupo:
+        contextos_grupo.extend(c for c in item.contextos if c not in contextos_grupo)
+    contexto_final = _combinar_contextos(contexto, "\n\n---\n\n".join(contextos_grupo))
+
+    respostas = None
+    if len(grupo) > 1:
+        try:
+            response = await gateway_llm.gerar(_montar_prompt_lote(contexto_final, [i.pergunta for i in grupo]))
+            respostas = _extrair_respostas_json(response.text, len(grupo))
+        except Exception as e:
+            print(f"   [Lote] Falha na chamada agrupada ({len(grupo)} perguntas): {e}")
+        if respostas is None:
+            print(f"   [Lote] Respondendo as {len(grupo)} perguntas do grupo individualmente.")
+
+    if respostas is None:
+        # Grupo de uma pergunta (ou resposta agrupada inválida): uma chamada por pergunta
+        async def _individual(item: PerguntaDoLote) -> str:
+            prompt = _montar_prompt(_combinar_contextos(contexto, "\n\n---\n\n".join(item.contextos)), item.pergunta)
+            return (await gateway_llm.gerar(prompt)).text
+        respostas = await asyncio.gather(*[_individual(item) for item in grupo], return_exceptions=True)
+
+    for item, resposta in zip(grupo, respostas):
+        if isinstance(resposta, BaseException):
+            item.erro = f"Erro ao comunicar com a API do Gemini: {resposta}"
+        else:
+            item.resposta = resposta
+            cache_respostas.guardar(item.chave_cache, {"resposta": resposta})
+
+
+async def _gerar_respostas_em_lote(perguntas: list[str], contexto: str | None) -> list[PerguntaDoLote]:
+    """
+    Responde várias perguntas de uma vez:
+    1) busca o contexto de todas em paralelo, compartilhando as consultas repetidas ao banco;
+    2) responde pelo cache o que já foi respondido;
+    3) agrupa as perguntas de contexto parecido e responde cada grupo numa chamada ao Gemini.
+    Perguntas sem contexto suficiente seguem o fluxo individual (com o fallback por documentos).
+    """
+    semaforo = asyncio.Semaphore(settings.IA_LOTE_MAX_PARALELISMO)
+    orcamento = settings.IA_CONTEXTO_ORCAMENTO_TOKENS - estimar_tokens(contexto or "")
+
+    async def _recuperar(pergunta: str) -> tuple[list[ContextoRanqueado], list[dict]]:
+        async with semaforo:
+            return await _buscar_contextos_da_base(pergunta)
+
+    token = _consultas_do_lote.set({})
+    try:
+        recuperados = await asyncio.gather(*[_recuperar(pergunta) for pergunta in perguntas])
+    finally:
+        _consultas_do_lote.reset(token)
+
+    itens: list[PerguntaDoLote] = []
+    pendentes: list[PerguntaDoLote] = []
+    individuais: list[PerguntaDoLote] = []
+    for pergunta, (ranqueados, _) in zip(perguntas, recuperados):
+        contextos = [item.texto for item in ranqueados]
+        selecionados = empacotar_contextos(
+            pergunta, contextos, orcamento,
+            relevancias=[item.score for item in ranqueados], maximo=settings.IA_CONTEXTO_MAX_CONTEXTOS,
+        )
+        item = PerguntaDoLote(pergunta, selecionados, gerar_chave(pergunta, contexto, selecionados))
+        itens.append(item)
+        resposta_cache = cache_respostas.obter(item.chave_cache)
+        if resposta_cache is not None:
+            item.resposta, item.cache = resposta_cache["resposta"], True
+        elif not selecionados or len(contextos) < 2:
+            individuais.append(item)
+        else:
+            pendentes.append(item)
+
+    grupos = _agrupar_por_contexto(pendentes, orcamento)
+    print(f"[IA] Lote: {len(perguntas)} perguntas, {len(itens) - len(pendentes) - len(individuais)} no cache, "
+          f"{len(pendentes)} em {len(grupos)} chamada(s) agrupada(s), {len(individuais)} pelo fluxo individual")
+
+    async def _limitado(coro):
+        async with semaforo:
+            return await coro
+
+    async def _fluxo_individual(item: PerguntaDoLote) -> None:
+        try:
+            item.resposta = (await _gerar_resposta(item.pergunta, contexto))["resposta"]
+        except HTTPException as e:
+            item.erro = e.detail
+
+    await asyncio.gather(
+        *[_limitado(_responder_grupo(grupo, contexto)) for grupo in grupos],
+        *[_limitado(_fluxo_individual(item)) for item in individuais],
+    )
+    return itens
+
+
+@router.post("/gerar-respostas")
+async def gerar_respostas_em_lote(request: BatchGenerationRequest, current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
+    """
+    Versão em lote do /ia/gerar-resposta, para rotinas que geram respostas para muitas perguntas
+    (relatórios, pré-geração de FAQ). Retorna as respostas na mesma ordem das perguntas.
+    """
+    if not request.perguntas:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma pergunta.")
+    if len(request.perguntas) > settings.IA_LOTE_MAX_PERGUNTAS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {settings.IA_LOTE_MAX_PERGUNTAS} perguntas por requisição.",
+        )
+
+    # Perguntas repetidas no lote são respondidas uma vez só
+    unicas: dict[str, str] = {}
+    for pergunta in request.perguntas:
+        unicas.setdefault(normalizar_pergunta(pergunta), pergunta)
+
+    itens = await _gerar_respostas_em_lote(list(unicas.values()), request.contexto)
+    por_chave = {normalizar_pergunta(item.pergunta): item for item in itens}
+
+    respostas = []
+    for pergunta in request.perguntas:
+        item = por_chave[normalizar_pergunta(pergunta)]
+        resultado = {"pergunta": pergunta, "resposta": item.resposta, "cache": item.cache}
+        if item.erro:
+            resultado["erro"] = item.erro
+        respostas.append(resultado)
+    return {"respostas": respostas}
+
+
+async def materializar_respostas_frequentes() -> dict | None:
+    """
+    Gera (pelo mesmo pipeline do /ia/gerar-resposta) as respostas das dúvidas mais frequentes
+    do dashboard de /mensagens_aluno e salva na tabela 'respostafrequente'. Respostas ainda
+    válidas (mais novas que IA_FAQ_INTERVALO_SEGUNDOS e que a última escrita na base) são mantidas.
+    As respostas só usam os registros gerais da base (sem disciplina), já que são servidas a
+    qualquer aluno; dúvidas sem contexto nesses registros ficam sem resposta pré-gerada.
+    Com vários workers, só o que obtém a reserva no banco (IA_FAQ_LEASE_SEGUNDOS) gera as
+    respostas; retorna None se outro worker já as está gerando.
+    """
+    if not await asyncio.to_thread(respostas_frequentes.adquirir_reserva, settings.IA_FAQ_LEASE_SEGUNDOS):
+        print("   [FAQ] Outro worker está gerando as respostas frequentes.")
+        return None
+    try:
+        return await _gerar_respostas_frequentes()
+    finally:
+        try:
+            await asyncio.to_thread(respostas_frequentes.liberar_reserva)
+        except Exception as e:
+            # A reserva expira sozinha depois de IA_FAQ_LEASE_SEGUNDOS
+            print(f"   [FAQ] Não foi possível liberar a reserva: {e}")
+
+
+async def _gerar_respostas_frequentes() -> dict:
+    dashboard = await asyncio.to_thread(msg_aluno.get_dashboard_duvidas_frequentes)
+    grupos = dashboard["duvidas_frequentes"][:settings.IA_FAQ_MAX_PERGUNTAS]
+
+    geradas, mantidas, sem_contexto, falhas = 0, 0, 0, 0
+    respondidas: set[str] = set()
+    for grupo in grupos:
+        existente = respostas_frequentes.obter(grupo["pergunta"])
+        if respostas_frequentes.esta_atualizada(existente, settings.IA_FAQ_INTERVALO_SEGUNDOS):
+            mantidas += 1
+            respondidas.add(normalizar_pergunta(grupo["pergunta"]))
+            continue
+        # Uma pergunta por vez, para não disputar as vagas do Gemini com as requisições dos alunos
+        try:
+            preparacao = await _preparar_resposta(grupo["pergunta"], None, matriculas.ESCOPO_GERAL)
+            if preparacao.resposta_cache is not None and preparacao.resposta_cache.get("sem_contexto"):
+                # A frase padrão não é guardada: a pergunta segue para a busca no escopo de cada aluno
+                sem_contexto += 1
+                continue
+            if preparacao.resposta_cache is not None:
+                resposta = preparacao.resposta_cache["resposta"]
+            else:
+                resposta = await _gerar_texto(preparacao)
+                cache_respostas.guardar(preparacao.chave_cache, {"resposta": resposta})
+            documentos = [
+                {"nome_arquivo": doc["nome_arquivo"], "url_documento": doc["url_documento"]}
+                for doc in preparacao.documentos_com_url
+            ]
+            await asyncio.to_thread(respostas_frequentes.salvar, grupo, resposta, preparacao.contextos, documentos)
+            geradas += 1
+            respondidas.add(normalizar_pergunta(grupo["pergunta"]))
+        except Exception as e:
+            falhas += 1
+            if existente is not None:
+                respondidas.add(normalizar_pergunta(grupo["pergunta"]))
+            print(f"   [FAQ] Falha ao gerar a resposta de '{grupo['pergunta']}': {e}")
+
+    # Saem os grupos que deixaram de ser frequentes e os que ficaram sem contexto
+    removidas = await asyncio.to_thread(respostas_frequentes.remover_exceto, respondidas)
+    resultado = {
+        "grupos": len(grupos), "geradas": geradas, "mantidas": mantidas, "sem_contexto": sem_contexto,
+        "falhas": falhas, "removidas": removidas,
+    }
+    print(f"   [FAQ] Respostas frequentes materializadas: {resultado}")
+    return resultado
+
+
+async def manter_respostas_frequentes() -> None:
+    """
+    Tarefa de segundo plano (iniciada no lifespan de cada worker): recarrega a tabela
+    'respostafrequente' a cada IA_FAQ_VERIFICACAO_SEGUNDOS e gera as respostas de novo a cada
+    IA_FAQ_INTERVALO_SEGUNDOS ou depois de escritas na base de conhecimento (de qualquer worker),
+    assim que a base fica IA_FAQ_ESPERA_ALTERACOES_SEGUNDOS sem novas escritas.
+    A geração só acontece no worker que obtém a reserva; os outros tentam de novo na próxima
+    verificação (e, enquanto isso, leem as respostas que ele salvou).
+    """
+    ultima_materializacao = 0.0
+    while True:
+        try:
+            await asyncio.to_thread(respostas_frequentes.carregar)
+            if ((time.time() - ultima_materializacao >= settings.IA_FAQ_INTERVALO_SEGUNDOS
+                    or respostas_frequentes.ha_desatualizadas()) and respostas_frequentes.base_estavel()):
+                if await materializar_respostas_frequentes() is not None:
+                    ultima_materializacao = time.time()
+        except Exception as e:
+            print(f"   [FAQ] Falha ao atualizar as respostas frequentes: {e}")
+        await asyncio.sleep(settings.IA_FAQ_VERIFICACAO_SEGUNDOS)
+
+
+### ENDPOINT PARA GERAR AGORA AS RESPOSTAS DAS DÚVIDAS FREQUENTES ###
+@router.post("/respostas-frequentes/materializar")
+async def materializar_respostas_frequentes_agora(current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
+    try:
+        resultado = await materializar_respostas_frequentes()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar as respostas frequentes: {e}")
+    if resultado is None:
+        raise HTTPException(status_code=409, detail="As respostas frequentes já estão sendo geradas por outro worker.")
+    return resultado
+
+
+### ENDPOINT PARA RECONSTRUIR O ÍNDICE LOCAL DA BASE DE CONHECIMENTO ###
+@router.post("/indice/reconstruir")
+def reconstruir_indice_base(current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
+    """
+    Recarrega do banco todos os registros publicados de 'baseconhecimento' e reconstrói
+    os índices locais (BM25, vetorial, de trechos e de palavras-chave) usados pelo /ia/gerar-resposta.
+    """
+    try:
+        total = indice_bm25.reconstruir_indice()
+        indice_vetorial.reconstruir_indice()
+        trechos_documento.reconstruir_indice()
+        indice_palavras_chave.reconstruir_indice()
+        return {
+            "message": f"Índices reconstruídos com {total} documentos.",
+            **indice_bm25.estatisticas(),
+            "indice_vetorial": indice_vetorial.estatisticas(),
+            "trechos": trechos_documento.estatisticas(),
+            "palavras_chave": indice_palavras_chave.estatisticas(),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao reconstruir o índice: {e}")
+
+
+### ENDPOINT PARA CONSULTAR AS MÉTRICAS DO CACHE DE RESPOSTAS ###
+@router.get("/cache/metricas")
+def get_metricas_cache(current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
+    return {
+        **cache_respostas.metricas(),
+        "documentos": cache_documentos.metricas(),
+        "gemini": gateway_llm.metricas(),
+        "prefixos_prompt": cache_prefixos.metricas(),
+        "respostas_frequentes": respostas_frequentes.estatisticas(),
+        "matriculas": matriculas.estatisticas(),
+        "intencoes": roteador_intencoes.estatisticas(),
+        "hedge": {"disparados": hedges_disparados, "vencedores": hedges_vencedores},
+        "respostas_degradadas": respostas_degradadas,
+        "sem_contexto": {"respostas": respostas_sem_contexto, "cache_negativo": cache_negativo.metricas()},
+        "requisicoes_agrupadas": {
+            "respostas": _voos_respostas.metricas(),
+            "streaming": _voos_preparacao.metricas(),
+        },
+    }
+
+
+### ENDPOINT PARA CONSULTAR A LATÊNCIA DE CADA ETAPA DO /ia/gerar-resposta ###
+@router.get("/metricas")
+def get_metricas_etapas(current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
+    """
+    Histograma de duração (ms) de cada etapa: buscas no banco, índices locais, fallback por
+    documentos, montagem do prompt e geração, com as linhas/contextos médios por chamada.
+    """
+    return {"etapas": metricas.resumo()}
+
+
+@router.delete("/metricas", status_code=204)
+def limpar_metricas_etapas(current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
+    metricas.limpar()
+
+
+### ENDPOINT PARA LIMPAR O CACHE DE RESPOSTAS ###
+@router.delete("/cache", status_code=204)
+def limpar_cache(current_user: dict = Depends(require_admin_or_coordenador_or_professor)):
+    cache_respostas.limpar()
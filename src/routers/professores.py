@@ -3,6 +3,7 @@ from src.supabase_client import supabase
 from ..schemas.sch_professor import ProfessorCreate, Professor, ProfessorUpdate
 from ..dependencies import require_admin_or_coordenador, require_all, require_admin_or_coordenador_or_professor
 from ..config import settings
+from ..services import roteador_intencoes, texto
 from typing import List
 import requests
 import re
@@ -42,6 +43,8 @@ def create_professor(professor_data: ProfessorCreate, current_user: dict = Depen
         if professor_profile_data.get('atendimento_hora_fim'):
             professor_profile_data['atendimento_hora_fim'] = professor_profile_data['atendimento_hora_fim'].isoformat()
 
+        professor_profile_data.update(texto.colunas_de_busca("professor", professor_profile_data))
+
         #Inserir o perfil do Professor na tabela "Professor"
         db_response = supabase.table("professor").insert(professor_profile_data).execute()
 
@@ -72,6 +75,7 @@ def create_professor(professor_data: ProfessorCreate, current_user: dict = Depen
                 supabase.table("professordisciplina").insert(associations_to_create).execute()
 
         created_professor_dict = db_response.data[0]
+        roteador_intencoes.invalidar()
 
         professor_obj = Professor.model_validate(created_professor_dict)
         return professor_obj
@@ -201,11 +205,15 @@ def get_professor_by_id(professor_id: str):
 @router.get("/get_nome/{nome}", response_model=List[Professor])
 def get_professor_by_nome(nome: str):
     try:
-        # Realiza a consulta na tabela "professor" filtrando pelo nome_professor (busca parcial e case-insensitive)
-        response = supabase.table("professor").select("*").ilike("nome_professor", f"%{nome}%").execute()
+        # Busca parcial na coluna normalizada: "joao" encontra "João" e vice-versa
+        padrao = texto.padrao_ilike(nome)
+        response = supabase.table("professor").select("*").ilike("nome_professor_busca", padrao).execute() if padrao else None
+        if not response or not response.data:
+            # Fallback na coluna original (registros gravados sem a coluna de busca preenchida)
+            response = supabase.table("professor").select("*").ilike("nome_professor", f"%{nome}%").execute()
 
         # Verifica se a busca retornou algum dado
-        if not response.data:
+        if not response or not response.data:
             # Se não retornou, o professor não foi encontrado. Lançamos um erro 404.
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -270,6 +278,8 @@ def update_professor(id: str, professor_update_data: ProfessorUpdate):
         if 'atendimento_hora_fim' in update_payload:
             update_payload['atendimento_hora_fim'] = update_payload['atendimento_hora_fim'].isoformat()
 
+        update_payload.update(texto.colunas_de_busca("professor", update_payload))
+
         # Verificar se o id é um UUID (tem hífens e formato UUID) ou id_funcional
         uuid_pattern = r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
         is_uuid = bool(re.match(uuid_pattern, id, re.IGNORECASE))
@@ -308,6 +318,8 @@ def update_professor(id: str, professor_update_data: ProfessorUpdate):
                     ]
                     supabase.table("professordisciplina").insert(associations_to_create).execute()
         
+        roteador_intencoes.invalidar()
+
         # Buscar professor atualizado
         prof_response = supabase.table("professor").select("*").eq('id', professor_uuid).single().execute()
         
@@ -379,6 +391,7 @@ def delete_professor(id: str, current_user: dict = Depends(require_admin_or_coor
             print(f"AVISO: Falha ao deletar usuário do Auth: {auth_exc}")
             # Não levanta exceção aqui para não abortar a operação
         
+        roteador_intencoes.invalidar()
         return None
 
     except Exception as e:
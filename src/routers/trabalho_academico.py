@@ -9,8 +9,9 @@ from ..schemas.sch_trabalho_academico import (
     TipoTrabalhoEnum,
 )
 from ..dependencies import require_admin_or_coordenador
+from ..services import roteador_intencoes, texto
+from ..services.nomes_academicos import normalizar_tipo_trabalho, converter_numero_para_romano, converter_romano_para_numero
 import uuid
-import re
 
 # --- ROUTER TRABALHO ACADÊMICO ---
 
@@ -40,6 +41,7 @@ def create_trabalho_academico(trabalho_data: TrabalhoAcademicoCreate):
                 status_code=500, detail="Erro ao criar o trabalho acadêmico."
             )
 
+        roteador_intencoes.invalidar()
         return response.data[0]
     except Exception as e:
         if "violates foreign key constraint" in str(e).lower():
@@ -50,133 +52,40 @@ def create_trabalho_academico(trabalho_data: TrabalhoAcademicoCreate):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-def _normalizar_tipo_trabalho(tipo: str) -> Optional[str]:
+def _buscar_disciplina_por_nome_flexivel(nome_disciplina: str) -> Optional[dict]:
     """
-    Normaliza diferentes variações de tipo de trabalho para o formato esperado no banco.
-    Retorna None se o tipo não for reconhecido.
+    Busca disciplina por nome de forma flexível na coluna normalizada 'nome_disciplina_busca'
+    (sem acentos e sem diferença de plural), aceitando variações número ↔ romano.
+    Todas as variações vão numa única consulta; a do nome original tem prioridade.
     """
-    if not tipo:
+    # Preparar variações do nome, já normalizadas (sem duplicatas e na ordem de prioridade)
+    variacoes = []
+    for nome in (nome_disciplina, converter_numero_para_romano(nome_disciplina), converter_romano_para_numero(nome_disciplina)):
+        normalizado = texto.texto_de_busca(nome)
+        if normalizado and normalizado not in variacoes:
+            variacoes.append(normalizado)
+    if not variacoes:
+        return None
+
+    try:
+        # No filtro 'or' do PostgREST o curinga do ilike é '*'
+        filtro = ",".join(f'nome_disciplina_busca.ilike."*{v}*"' for v in variacoes)
+        response = (
+            supabase.table("disciplina")
+            .select("id_disciplina, nome_disciplina, nome_disciplina_busca")
+            .or_(filtro)
+            .execute()
+        )
+    except Exception:
         return None
-    
-    tipo_lower = tipo.lower().strip()
-    
-    # Mapeamento de variações para valores do banco
-    mapeamento = {
-        # TC 1
-        "tc1": "TC 1",
-        "tc 1": "TC 1",
-        "trabalho de conclusão 1": "TC 1",
-        "trabalho de conclusao 1": "TC 1",
-        "tcc 1": "TC 1",
-        "tcc1": "TC 1",
-        # TC 2
-        "tc2": "TC 2",
-        "tc 2": "TC 2",
-        "trabalho de conclusão 2": "TC 2",
-        "trabalho de conclusao 2": "TC 2",
-        "tcc 2": "TC 2",
-        "tcc2": "TC 2",
-        # APS
-        "aps": "APS",
-        "atividade prática": "APS",
-        "atividade pratica": "APS",
-        "atividade prática supervisionada": "APS",
-        "atividade pratica supervisionada": "APS",
-        # Estágio
-        "estagio": "estagio",
-        "estágio": "estagio",
-        # Horas complementares
-        "horas_complementares": "horas_complementares",
-        "horas complementares": "horas_complementares",
-        "hora complementar": "horas_complementares",
-        "horas_complementar": "horas_complementares",
-        "horas de complementação": "horas_complementares",
-        "horas de complementacao": "horas_complementares",
-        "hora de complementação": "horas_complementares",
-        "hora de complementacao": "horas_complementares",
-        "complementares": "horas_complementares",
-    }
-    
-    return mapeamento.get(tipo_lower)
-
-
-def _converter_numero_para_romano(nome: str) -> str:
-    """
-    Converte números para algarismos romanos no nome da disciplina.
-    Exemplos:
-    - "Trabalho de Curso 1" → "Trabalho de Curso I"
-    - "Trabalho de Curso 2" → "Trabalho de Curso II"
-    """
-    if not nome:
-        return nome
-    
-    # Mapeamento de números para romanos (ordem decrescente para evitar conflitos)
-    numero_para_romano = {
-        "1": "I",
-        "2": "II",
-        "3": "III",
-        "4": "IV",
-        "5": "V",
-    }
-    
-    resultado = nome
-    # Tentar substituir números no final da string ou seguidos de espaço/fim
-    for num, romano in numero_para_romano.items():
-        # Padrão mais flexível: número seguido de espaço ou no final
-        # Ex: "Curso 2" ou "Curso 2 " ou "Curso 2."
-        padrao = r'(\s|^)' + re.escape(num) + r'(\s|$|[^\d])'
-        resultado = re.sub(padrao, r'\1' + romano + r'\2', resultado)
-    
-    return resultado.strip()
-
-
-def _converter_romano_para_numero(nome: str) -> str:
-    """
-    Converte algarismos romanos para números no nome da disciplina.
-    Exemplos:
-    - "Trabalho de Curso I" → "Trabalho de Curso 1"
-    - "Trabalho de Curso II" → "Trabalho de Curso 2"
-    """
-    if not nome:
-        return nome
-    
-    # Mapeamento de romanos para números (ordem decrescente para evitar conflitos)
-    romano_para_numero = {
-        "III": "3",
-        "II": "2",
-        "IV": "4",
-        "I": "1",
-        "V": "5",
-    }
-    
-    resultado = nome
-    for romano, num in romano_para_numero.items():
-        # Padrão: romano no final ou seguido de espaço/pontuação
-        padrao = r'\b' + re.escape(romano) + r'(?=\s|$|[^\w])'
-        resultado = re.sub(padrao, num, resultado, flags=re.IGNORECASE)
-    
-    return resultado.strip()
 
+    for variacao in variacoes:
+        for disciplina in response.data or []:
+            if variacao in (disciplina.get("nome_disciplina_busca") or ""):
+                return disciplina
 
-def _buscar_disciplina_por_nome_flexivel(nome_disciplina: str) -> Optional[dict]:
-    """
-    Busca disciplina por nome de forma flexível usando ilike (como no endpoint get_ementa).
-    Tenta buscar com o nome original e com variações (número ↔ romano).
-    """
-    # Preparar variações do nome
-    nome_com_romano = _converter_numero_para_romano(nome_disciplina)
-    nome_com_numero = _converter_romano_para_numero(nome_disciplina)
-    
-    # Lista de nomes para tentar (sem duplicatas)
-    nomes_para_tentar = [nome_disciplina]
-    if nome_com_romano != nome_disciplina:
-        nomes_para_tentar.append(nome_com_romano)
-    if nome_com_numero != nome_disciplina and nome_com_numero not in nomes_para_tentar:
-        nomes_para_tentar.append(nome_com_numero)
-    
-    # Tentar buscar com cada variação usando ilike (busca parcial case-insensitive)
-    # Similar ao endpoint get_ementa/{nome_disciplina}
-    for nome in nomes_para_tentar:
+    # Fallback na coluna original (registros gravados sem a coluna de busca preenchida)
+    for nome in dict.fromkeys((nome_disciplina, converter_numero_para_romano(nome_disciplina), converter_romano_para_numero(nome_disciplina))):
         try:
             response = (
                 supabase.table("disciplina")
@@ -185,12 +94,10 @@ def _buscar_disciplina_por_nome_flexivel(nome_disciplina: str) -> Optional[dict]
                 .limit(1)
                 .execute()
             )
-            if response.data and len(response.data) > 0:
+            if response.data:
                 return response.data[0]
         except Exception:
-            # Continuar tentando outras variações
             continue
-    
     return None
 
 
@@ -199,7 +106,7 @@ def _buscar_disciplina_por_nome_flexivel(nome_disciplina: str) -> Optional[dict]
 def get_trabalho_academico_by_tipo_e_disciplina(tipo: str, nome_disciplina: str):
     try:
         # Normalizar o tipo de trabalho para o formato esperado no banco
-        tipo_normalizado = _normalizar_tipo_trabalho(tipo)
+        tipo_normalizado = normalizar_tipo_trabalho(tipo)
         
         if not tipo_normalizado:
             raise HTTPException(
@@ -260,8 +167,8 @@ def get_trabalhos_por_tipo(tipo: str):
     """
     try:
         # Normalizar o tipo de trabalho para o formato esperado no banco
-        # A função _normalizar_tipo_trabalho aceita variações como "horas complementares" → "horas_complementares"
-        tipo_normalizado = _normalizar_tipo_trabalho(tipo)
+        # A função normalizar_tipo_trabalho aceita variações como "horas complementares" → "horas_complementares"
+        tipo_normalizado = normalizar_tipo_trabalho(tipo)
         
         if not tipo_normalizado:
             raise HTTPException(
@@ -346,6 +253,7 @@ def update_trabalho_academico(trabalho_id: uuid.UUID, trabalho_update_data: Trab
                 status_code=404, detail="Trabalho acadêmico não encontrado."
             )
 
+        roteador_intencoes.invalidar()
         return response.data[0]
     except Exception as e:
         if "violates foreign key constraint" in str(e).lower():
@@ -375,6 +283,7 @@ def delete_trabalho_academico(
                 status_code=404, detail="Trabalho acadêmico não encontrado."
             )
 
+        roteador_intencoes.invalidar()
         return None
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,50 @@
+"""
+Preenche as colunas de busca normalizadas (sufixo '_busca', ver sql/colunas_busca.sql) dos
+registros que já existiam antes delas (ou que foram gravados fora da API). Os registros novos ou
+alterados pela API já são gravados com essas colunas preenchidas. Regrava todos os registros, então
+também deve ser rodado depois de mudar a normalização em src/services/texto.py.
+
+Uso (na raiz do projeto):
+    python -m src.scripts.preencher_colunas_busca
+    python -m src.scripts.preencher_colunas_busca --tabela disciplina
+"""
+import argparse
+from ..services import texto
+from ..services.indice_bm25 import TAMANHO_PAGINA
+from ..supabase_client import supabase
+
+# Chave primária de cada tabela com colunas de busca
+CHAVES_PRIMARIAS = {
+    "baseconhecimento": "id_conhecimento",
+    "disciplina": "id_disciplina",
+    "professor": "id",
+    "coordenador": "id",
+}
+
+
+def preencher_tabela(tabela: str) -> int:
+    chave = CHAVES_PRIMARIAS[tabela]
+    colunas = ", ".join([chave, *texto.COLUNAS_BUSCA[tabela]])
+    atualizados, inicio = 0, 0
+    while True:
+        pagina = supabase.table(tabela).select(colunas).range(inicio, inicio + TAMANHO_PAGINA - 1).execute().data or []
+        for registro in pagina:
+            supabase.table(tabela).update(texto.colunas_de_busca(tabela, registro)).eq(chave, registro[chave]).execute()
+            atualizados += 1
+        if len(pagina) < TAMANHO_PAGINA:
+            break
+        inicio += TAMANHO_PAGINA
+    print(f"   [Colunas Busca] {tabela}: {atualizados} registros atualizados")
+    return atualizados
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Preenche as colunas de busca normalizadas")
+    parser.add_argument("--tabela", choices=sorted(CHAVES_PRIMARIAS), help="Só esta tabela (padrão: todas)")
+    args = parser.parse_args()
+    for tabela in [args.tabela] if args.tabela else CHAVES_PRIMARIAS:
+        preencher_tabela(tabela)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import google.generativeai as genai
+from google.generativeai import caching
+from google.api_core import exceptions as google_exceptions
+from ..config import settings
+
+# --- BACKENDS DO MODELO DE LINGUAGEM ---
+# O gateway (gateway_llm.py) não chama o SDK do Gemini diretamente: ele usa um backend com
+# a interface abaixo. Em produção o backend é o Gemini; para testes de carga e profiling
+# existe um backend local (IA_LLM_BACKEND=fake), com latência, taxa de falhas e respostas
+# configuráveis, que não consome cota.
+
+
+class BackendLLM:
+    """
+    Interface dos backends. Os métodos são síncronos (o gateway os executa em threads).
+    gerar() devolve um objeto com '.text' ou, com stream=True, um iterável de trechos com '.text'.
+    Backends com suporta_cache_prefixo=True guardam no provedor um prefixo do prompt (instruções
+    e contexto) criado com criar_cache_prefixo(), que gerar(..., prefixo=nome) usa sem reenviar.
+    """
+
+    nome = "base"
+    suporta_cache_prefixo = False
+
+    def gerar(self, conteudo, stream: bool = False, prefixo: str | None = None, **kwargs):
+        raise NotImplementedError
+
+    def criar_cache_prefixo(self, instrucoes: str, contexto: str, ttl_segundos: int) -> str:
+        raise NotImplementedError
+
+    def remover_cache_prefixo(self, nome: str) -> None:
+        raise NotImplementedError
+
+    def enviar_arquivo(self, caminho_arquivo: str, mime_type: str):
+        raise NotImplementedError
+
+    def obter_arquivo(self, nome: str):
+        raise NotImplementedError
+
+
+class BackendGemini(BackendLLM):
+    nome = "gemini"
+    suporta_cache_prefixo = True
+
+    def __init__(self, nome_modelo: str, api_key: str):
+        genai.configure(api_key=api_key)
+        self.nome_modelo = nome_modelo
+        self.modelo = genai.GenerativeModel(nome_modelo)
+        self._modelos_com_prefixo: dict[str, genai.GenerativeModel] = {}
+
+    def _modelo(self, prefixo: str | None) -> genai.GenerativeModel:
+        if prefixo is None:
+            return self.modelo
+        modelo = self._modelos_com_prefixo.get(prefixo)
+        if modelo is None:
+            # Cache criado por outro worker: busca no provedor (NotFound se já expirou)
+            modelo = genai.GenerativeModel.from_cached_content(caching.CachedContent.get(prefixo))
+            self._modelos_com_prefixo[prefixo] = modelo
+        return modelo
+
+    def gerar(self, conteudo, stream: bool = False, prefixo: str | None = None, **kwargs):
+        return self._modelo(prefixo).generate_content(conteudo, stream=stream, **kwargs)
+
+    def criar_cache_prefixo(self, instrucoes: str, contexto: str, ttl_segundos: int) -> str:
+        cache = caching.CachedContent.create(
+            model=f"models/{self.nome_modelo}",
+            system_instruction=instrucoes,
+            contents=[contexto],
+            ttl=timedelta(seconds=ttl_segundos),
+        )
+        self._modelos_com_prefixo[cache.name] = genai.GenerativeModel.from_cached_content(cache)
+        return cache.name
+
+    def remover_cache_prefixo(self, nome: str) -> None:
+        self._modelos_com_prefixo.pop(nome, None)
+        caching.CachedContent.get(nome).delete()
+
+    def enviar_arquivo(self, caminho_arquivo: str, mime_type: str):
+        with open(caminho_arquivo, "rb") as f:
+            return genai.upload_file(f, mime_type=mime_type)
+
+    def obter_arquivo(self, nome: str):
+        return genai.get_file(nome)
+
+
+# ---------- Backend local para testes de carga ----------
+
+@dataclass
+class RespostaFake:
+    text: str
+
+
+@dataclass
+class ArquivoFake:
+    name: str
+    mime_type: str
+    expiration_time: datetime = field(default_factory=lambda: datetime.now(timezone.utc) + timedelta(hours=48))
+
+
+class BackendFake(BackendLLM):
+    """
+    Backend determinístico que não acessa a rede:
+    - espera 'latencia_segundos' (± 'variacao_latencia', em fração) em cada chamada;
+    - falha com a probabilidade 'taxa_falha', com os mesmos erros temporários do Gemini (429/503);
+    - responde com 'resposta_json' quando o prompt pede JSON e com um texto derivado do prompt nos demais casos.
+    """
+
+    nome = "fake"
+    suporta_cache_prefixo = True
+
+    def __init__(self, latencia_segundos: float, variacao_latencia: float, taxa_falha: float,
+                 resposta_json: str, semente: int | None = None):
+        self.latencia_segundos = latencia_segundos
+        self.variacao_latencia = variacao_latencia
+        self.taxa_falha = taxa_falha
+        self.resposta_json = resposta_json
+        self._aleatorio = random.Random(semente)
+        self._arquivos: dict[str, ArquivoFake] = {}
+        self._prefixos: dict[str, str] = {}
+
+    def _simular_chamada(self) -> None:
+        variacao = self._aleatorio.uniform(-self.variacao_latencia, self.variacao_latencia)
+        time.sleep(max(0.0, self.latencia_segundos * (1 + variacao)))
+        if self._aleatorio.random() < self.taxa_falha:
+            erro = self._aleatorio.choice([google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable])
+            raise erro("Falha simulada pelo backend fake")
+
+    @staticmethod
+    def _texto_do_prompt(conteudo) -> str:
+        partes = conteudo if isinstance(conteudo, list) else [conteudo]
+        return "\n".join(p if isinstance(p, str) else f"<arquivo {getattr(p, 'name', '')}>" for p in partes)
+
+    def _responder(self, prompt: str) -> str:
+        resumo = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        # Prompt em lote do /ia/gerar-respostas: uma resposta por pergunta
+        quantidade = re.search(r"exatamente (\d+) respostas", prompt)
+        if quantidade and '"respostas"' in prompt:
+            return json.dumps({"respostas": [f"Resposta simulada {i + 1} ({resumo})." for i in range(int(quantidade.group(1)))]})
+        if "JSON" in prompt:
+            return self.resposta_json
+        return f"Resposta simulada ({resumo}) para um prompt de {len(prompt)} caracteres."
+
+    def gerar(self, conteudo, stream: bool = False, prefixo: str | None = None, **kwargs):
+        self._simular_chamada()
+        prompt = self._texto_do_prompt(conteudo)
+        if prefixo is not None:
+            if prefixo not in self._prefixos:
+                raise google_exceptions.NotFound(f"Cache {prefixo} não encontrado")
+            prompt = self._prefixos[prefixo] + prompt
+        texto = self._responder(prompt)
+        if not stream:
+            return RespostaFake(texto)
+        palavras = texto.split(" ")
+        return iter([RespostaFake(" ".join(palavras[i:i + 5]) + " ") for i in range(0, len(palavras), 5)])
+
+    def enviar_arquivo(self, caminho_arquivo: str, mime_type: str):
+        self._simular_chamada()
+        with open(caminho_arquivo, "rb") as f:
+            nome = f"files/fake-{hashlib.sha1(f.read()).hexdigest()[:16]}"
+        arquivo = ArquivoFake(nome, mime_type)
+        self._arquivos[nome] = arquivo
+        return arquivo
+
+    def obter_arquivo(self, nome: str):
+        if nome not in self._arquivos:
+            raise google_exceptions.NotFound(f"Arquivo {nome} não encontrado")
+        return self._arquivos[nome]
+
+    def criar_cache_prefixo(self, instrucoes: str, contexto: str, ttl_segundos: int) -> str:
+        self._simular_chamada()
+        prefixo = instrucoes + contexto
+        nome = f"cachedContents/fake-{hashlib.sha1(prefixo.encode('utf-8')).hexdigest()[:16]}"
+        self._prefixos[nome] = prefixo
+        return nome
+
+    def remover_cache_prefixo(self, nome: str) -> None:
+        self._prefixos.pop(nome, None)
+
+
+def criar_backend() -> BackendLLM:
+    """Cria o backend definido em IA_LLM_BACKEND ('gemini' ou 'fake')."""
+    if settings.IA_LLM_BACKEND == "fake":
+        print("   [LLM] Usando o backend fake (sem chamadas ao Gemini).")
+        return BackendFake(
+            latencia_segundos=settings.IA_LLM_FAKE_LATENCIA_SEGUNDOS,
+            variacao_latencia=settings.IA_LLM_FAKE_VARIACAO_LATENCIA,
+            taxa_falha=settings.IA_LLM_FAKE_TAXA_FALHA,
+            resposta_json=settings.IA_LLM_FAKE_RESPOSTA_JSON,
+            semente=settings.IA_LLM_FAKE_SEMENTE,
+        )
+    if settings.IA_LLM_BACKEND != "gemini":
+        raise ValueError(f"IA_LLM_BACKEND inválido: '{settings.IA_LLM_BACKEND}' (use 'gemini' ou 'fake')")
+    return BackendGemini(settings.IA_GEMINI_MODELO, settings.GOOGLE_API_KEY)
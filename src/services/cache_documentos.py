@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import requests
+from ..config import settings
+from .gateway_llm import gateway_llm
+
+# --- CACHE DE DOCUMENTOS DO FALLBACK DO /ia/gerar-resposta ---
+# O fallback por documento baixava o arquivo inteiro e o reenviava ao Gemini a cada pergunta.
+# Aqui os bytes ficam em disco (com limite de tamanho e remoção dos menos usados), são
+# revalidados com ETag/Last-Modified e o arquivo já enviado ao Gemini é reutilizado até expirar.
+
+ARQUIVO_INDICE = "indice.json"
+MARGEM_EXPIRACAO_GEMINI = 600  # Segundos de folga antes da expiração do arquivo no Gemini
+
+
+@dataclass
+class DocumentoCache:
+    url: str
+    caminho: str
+    mime_type: str
+    sha256: str
+
+
+def detectar_mime_type(url_documento: str, content_type: str) -> str:
+    """Determina o tipo MIME baseado na extensão ou Content-Type."""
+    content_type = (content_type or "application/pdf").lower()
+    url_lower = url_documento.lower()
+    if "pdf" in content_type or url_lower.endswith(".pdf"):
+        return "application/pdf"
+    if "word" in content_type or url_lower.endswith((".docx", ".doc")):
+        return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    if "text" in content_type or url_lower.endswith(".txt"):
+        return "text/plain"
+    return "application/octet-stream"
+
+
+def _expiracao_em_segundos(expiration_time) -> float:
+    # O SDK devolve um datetime (com fuso) ou, em versões antigas, nada
+    if isinstance(expiration_time, datetime):
+        if expiration_time.tzinfo is None:
+            expiration_time = expiration_time.replace(tzinfo=timezone.utc)
+        return expiration_time.timestamp()
+    return time.time() + 47 * 3600  # Arquivos do Gemini expiram em 48h
+
+
+class CacheDocumentos:
+    def __init__(self, diretorio: str, max_bytes: int, revalidar_segundos: int):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.revalidar_segundos = revalidar_segundos
+        self._lock = threading.Lock()
+        self._locks_url: dict[str, threading.Lock] = {}
+        self._locks_gemini: dict[str, asyncio.Lock] = {}
+        self._arquivos_gemini: dict[str, object] = {}  # url -> handle do arquivo enviado
+        self.acertos = 0
+        self.revalidados = 0
+        self.downloads = 0
+        self.uploads_gemini = 0
+        self.reusos_gemini = 0
+        self._gravacao_agendada = False
+        os.makedirs(diretorio, exist_ok=True)
+        self._entradas: dict[str, dict] = self._ler_indice()
+
+    # ---------- Persistência do índice ----------
+
+    def _caminho_indice(self) -> str:
+        return os.path.join(self.diretorio, ARQUIVO_INDICE)
+
+    def _ler_indice(self) -> dict[str, dict]:
+        try:
+            with open(self._caminho_indice(), "r", encoding="utf-8") as f:
+                entradas = json.load(f)
+            # Descarta entradas cujo arquivo foi apagado
+            return {url: e for url, e in entradas.items() if os.path.exists(os.path.join(self.diretorio, e["arquivo"]))}
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return {}
+
+    def _escrever_atomico(self, caminho: str, conteudo: bytes) -> None:
+        # Temporário com nome único (outros workers usam o mesmo diretório) e troca atômica
+        descritor, caminho_temporario = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        try:
+            with os.fdopen(descritor, "wb") as f:
+                f.write(conteudo)
+            os.replace(caminho_temporario, caminho)
+        except BaseException:
+            if os.path.exists(caminho_temporario):
+                os.remove(caminho_temporario)
+            raise
+
+    def _mesclar_com_disco(self) -> None:
+        # Chamado com o _lock. Outros workers gravam o mesmo índice: para cada URL fica a entrada
+        # verificada por último (com o último acesso de ambas), e as que só existem em disco são mantidas
+        for url, entrada_disco in self._ler_indice().items():
+            entrada = self._entradas.get(url)
+            if entrada is None:
+                self._entradas[url] = entrada_disco
+                continue
+            ultimo_acesso = max(entrada.get("ultimo_acesso", 0), entrada_disco.get("ultimo_acesso", 0))
+            if entrada_disco["verificado_em"] > entrada["verificado_em"]:
+                if entrada_disco["sha256"] != entrada["sha256"]:
+                    self._arquivos_gemini.pop(url, None)
+                entrada = self._entradas[url] = entrada_disco
+            entrada["ultimo_acesso"] = ultimo_acesso
+        # Entradas cujo arquivo foi removido (por este ou por outro worker) deixam o cache
+        for url in [u for u, e in self._entradas.items() if not os.path.exists(os.path.join(self.diretorio, e["arquivo"]))]:
+            del self._entradas[url]
+            self._arquivos_gemini.pop(url, None)
+
+    def _salvar_indice(self) -> None:
+        # Chamado com o _lock
+        self._mesclar_com_disco()
+        self._escrever_atomico(self._caminho_indice(), json.dumps(self._entradas).encode("utf-8"))
+
+    def salvar_indice(self) -> None:
+        """Grava os últimos acessos acumulados em memória (junto com o que os outros workers gravaram)."""
+        with self._lock:
+            self._gravacao_agendada = False
+            self._salvar_indice()
+
+    def _agendar_gravacao(self) -> None:
+        # Chamado com o _lock: um acerto só altera o último acesso, que é gravado periodicamente
+        if not self._gravacao_agendada:
+            self._gravacao_agendada = True
+            temporizador = threading.Timer(settings.IA_CACHE_DOCUMENTOS_SALVAR_SEGUNDOS, self.salvar_indice)
+            temporizador.daemon = True
+            temporizador.start()
+
+    def _lock_da_url(self, url: str) -> threading.Lock:
+        with self._lock:
+            return self._locks_url.setdefault(url, threading.Lock())
+
+    # ---------- Bytes do documento ----------
+
+    def obter_documento(self, url: str) -> DocumentoCache:
+        """
+        Retorna o documento em disco, baixando-o apenas se não estiver no cache ou se
+        o servidor informar que mudou (requisição condicional com ETag/Last-Modified).
+        """
+        with self._lock_da_url(url):
+            with self._lock:
+                entrada = dict(self._entradas.get(url) or {})
+
+            if entrada and not os.path.exists(os.path.join(self.diretorio, entrada["arquivo"])):
+                # Arquivo removido (por exemplo, pelo limite de tamanho em outro worker): baixa de novo
+                print(f"   [Cache Documentos] Arquivo não está mais em disco, baixando de novo: {url}")
+                with self._lock:
+                    self._entradas.pop(url, None)
+                    self._arquivos_gemini.pop(url, None)
+                entrada = {}
+
+            agora = time.time()
+            if entrada and agora - entrada["verificado_em"] < self.revalidar_segundos:
+                self.acertos += 1
+                return self._registrar_acesso(url, entrada)
+
+            headers = {}
+            if entrada.get("etag"):
+                headers["If-None-Match"] = entrada["etag"]
+            if entrada.get("last_modified"):
+                headers["If-Modified-Since"] = entrada["last_modified"]
+
+            response = requests.get(url, headers=headers, timeout=30)
+            if response.status_code == 304 and entrada:
+                print(f"   [Cache Documentos] Documento não mudou (304): {url}")
+                self.revalidados += 1
+                entrada["verificado_em"] = agora
+                return self._registrar_acesso(url, entrada, salvar=True)
+
+            response.raise_for_status()
+            self.downloads += 1
+            conteudo = response.content
+            sha256 = hashlib.sha256(conteudo).hexdigest()
+            extensao = os.path.splitext(url.split("?")[0])[1]
+            nome_arquivo = f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:24]}{extensao}"
+
+            self._escrever_atomico(os.path.join(self.diretorio, nome_arquivo), conteudo)
+
+            nova_entrada = {
+                "arquivo": nome_arquivo,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "mime_type": detectar_mime_type(url, response.headers.get("Content-Type")),
+                "tamanho": len(conteudo),
+                "sha256": sha256,
+                "verificado_em": agora,
+            }
+            # Se o conteúdo não mudou, o arquivo já enviado ao Gemini continua válido
+            if entrada.get("sha256") == sha256:
+                nova_entrada["gemini_nome"] = entrada.get("gemini_nome")
+                nova_entrada["gemini_expira_em"] = entrada.get("gemini_expira_em")
+            else:
+                self._arquivos_gemini.pop(url, None)
+
+            documento = self._registrar_acesso(url, nova_entrada, salvar=True)
+            self._remover_excedentes()
+            return documento
+
+    def _registrar_acesso(self, url: str, entrada: dict, salvar: bool = False) -> DocumentoCache:
+        # Só mudanças de conteúdo gravam o índice na hora; o último acesso fica em memória até a gravação agendada
+        entrada["ultimo_acesso"] = time.time()
+        with self._lock:
+            self._entradas[url] = entrada
+            if salvar:
+                self._salvar_indice()
+            else:
+                self._agendar_gravacao()
+        return DocumentoCache(
+            url=url,
+            caminho=os.path.join(self.diretorio, entrada["arquivo"]),
+            mime_type=entrada["mime_type"],
+            sha256=entrada["sha256"],
+        )
+
+    def _remover_excedentes(self) -> None:
+        """Remove os documentos acessados há mais tempo até o cache caber em max_bytes."""
+        with self._lock:
+            # Decide sobre a visão mesclada com os outros workers (eles tratam o arquivo removido como ausente)
+            self._mesclar_com_disco()
+            total = sum(e["tamanho"] for e in self._entradas.values())
+            for url, entrada in sorted(self._entradas.items(), key=lambda x: x[1].get("ultimo_acesso", 0)):
+                if total <= self.max_bytes or len(self._entradas) <= 1:
+                    break
+                try:
+                    os.remove(os.path.join(self.diretorio, entrada["arquivo"]))
+                except FileNotFoundError:
+                    pass
+                total -= entrada["tamanho"]
+                del self._entradas[url]
+                self._arquivos_gemini.pop(url, None)
+                print(f"   [Cache Documentos] Removido do cache (limite de tamanho): {url}")
+            self._salvar_indice()
+
+    # ---------- Arquivo enviado ao Gemini ----------
+
+    async def obter_arquivo_gemini(self, documento: DocumentoCache):
+        """
+        Retorna o handle do arquivo no Gemini, reutilizando o upload anterior enquanto
+        ele não expira. Só envia o arquivo de novo (pelo gateway) quando necessário.
+        """
+        with self._lock:
+            lock_gemini = self._locks_gemini.setdefault(documento.url, asyncio.Lock())
+        async with lock_gemini:
+            with self._lock:
+                entrada = self._entradas.get(documento.url, {})
+            expira_em = entrada.get("gemini_expira_em") or 0
+            valido = time.time() < expira_em - MARGEM_EXPIRACAO_GEMINI
+
+            if valido and documento.url in self._arquivos_gemini:
+                self.reusos_gemini += 1
+                return self._arquivos_gemini[documento.url]
+
+            if valido and entrada.get("gemini_nome"):
+                # Upload feito por outro worker (ou antes de reiniciar): basta recuperar o handle
+                try:
+                    arquivo = await asyncio.to_thread(gateway_llm.backend.obter_arquivo, entrada["gemini_nome"])
+                    self._arquivos_gemini[documento.url] = arquivo
+                    self.reusos_gemini += 1
+                    return arquivo
+                except Exception as e:
+                    print(f"   [Cache Documentos] Arquivo do Gemini não encontrado, reenviando: {e}")
+
+            try:
+                arquivo = await gateway_llm.enviar_arquivo(documento.caminho, documento.mime_type)
+            except FileNotFoundError:
+                # Removido por outro worker entre a leitura do cache e o envio: conta como ausência no cache
+                documento = await asyncio.to_thread(self.obter_documento, documento.url)
+                arquivo = await gateway_llm.enviar_arquivo(documento.caminho, documento.mime_type)
+            self.uploads_gemini += 1
+            self._arquivos_gemini[documento.url] = arquivo
+
+            with self._lock:
+                if documento.url in self._entradas:
+                    self._entradas[documento.url]["gemini_nome"] = arquivo.name
+                    self._entradas[documento.url]["gemini_expira_em"] = _expiracao_em_segundos(
+                        getattr(arquivo, "expiration_time", None)
+                    )
+                    self._salvar_indice()
+            return arquivo
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "documentos": len(self._entradas),
+                "bytes": sum(e["tamanho"] for e in self._entradas.values()),
+                "max_bytes": self.max_bytes,
+                "acertos": self.acertos,
+                "revalidados_304": self.revalidados,
+                "downloads": self.downloads,
+                "uploads_gemini": self.uploads_gemini,
+                "reusos_gemini": self.reusos_gemini,
+            }
+
+
+cache_documentos = CacheDocumentos(
+    diretorio=settings.IA_CACHE_DOCUMENTOS_DIR,
+    max_bytes=settings.IA_CACHE_DOCUMENTOS_MAX_MB * 1024 * 1024,
+    revalidar_segundos=settings.IA_CACHE_DOCUMENTOS_REVALIDAR_SEGUNDOS,
+)
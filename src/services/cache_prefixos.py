@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import time
+from collections import deque
+from dataclasses import dataclass
+from google.api_core import exceptions as google_exceptions
+from ..config import settings
+from . import prazo
+from .empacotador_contexto import estimar_tokens
+from .gateway_llm import GatewayLLM, gateway_llm
+
+# --- CACHE DO PREFIXO DO PROMPT NO PROVEDOR DO LLM ---
+# Toda chamada do /ia/gerar-resposta reenviava o mesmo bloco de instruções e, para perguntas
+# parecidas, os mesmos contextos selecionados pela busca. Quando um mesmo conjunto de contextos
+# selecionados (já cortado pelo orçamento do empacotador) é usado com frequência, as instruções +
+# esses contextos são registrados no provedor (CachedContent do Gemini) e as requisições seguintes
+# enviam só a pergunta e os contextos selecionados que não estão no prefixo. O prefixo nunca tem
+# nada além do que a busca selecionou para a pergunta, então o modelo vê o mesmo contexto do
+# prompt completo e a chave do cache de respostas (que já inclui os contextos selecionados)
+# continua valendo. Sem suporte do backend, sem conjunto frequente ou se o cache expirar no
+# provedor, o prompt completo é enviado como antes. O bloco de instruções sozinho fica abaixo do
+# tamanho mínimo de cache do Gemini, por isso ele é registrado junto com os contextos
+# (como system_instruction).
+
+# Erros do provedor que indicam cache expirado/removido ou recurso indisponível para o modelo
+ERROS_PREFIXO = (
+    google_exceptions.NotFound,
+    google_exceptions.PermissionDenied,
+    google_exceptions.InvalidArgument,
+    google_exceptions.FailedPrecondition,
+)
+
+MARGEM_EXPIRACAO_SEGUNDOS = 60  # Não usa um prefixo que expira em menos tempo que isso
+PAUSA_APOS_ERRO_SEGUNDOS = 300  # Tempo sem criar prefixos depois que o provedor recusar um
+MAX_CONJUNTOS_CONTADOS = 5000  # Acima disso, os conjuntos de contextos sem uso recente são esquecidos
+
+
+@dataclass
+class PrefixoCacheado:
+    nome: str  # Nome do recurso no provedor (ex.: 'cachedContents/abc123')
+    assinatura: str  # Hash dos contextos do prefixo (ver assinatura_contextos)
+    contextos: frozenset[str]
+    tokens: int
+    expira_em: float
+
+
+def assinatura_contextos(contextos: list[str]) -> str:
+    return hashlib.sha256("\x1f".join(contextos).encode("utf-8")).hexdigest()
+
+
+def formatar_contexto(contextos: list[str]) -> str:
+    """Bloco de contexto guardado no prefixo (mesmo formato do prompt completo)."""
+    return (
+        "================ CONTEXTO =================\n"
+        + "\n\n---\n\n".join(contextos)
+        + "\n==========================================="
+    )
+
+
+class CachePrefixos:
+    def __init__(self, gateway: GatewayLLM, ativo: bool, min_tokens: int, min_usos: int, ttl_segundos: int):
+        self.gateway = gateway
+        self.ativo = ativo
+        self.min_tokens = min_tokens
+        self.min_usos = min_usos
+        self.ttl_segundos = ttl_segundos
+        self._prefixos: dict[str, PrefixoCacheado] = {}  # assinatura -> prefixo
+        self._usos: dict[str, deque[float]] = {}  # assinatura -> momentos em que o conjunto foi usado
+        self._pequenos: set[str] = set()  # Assinaturas de conjuntos pequenos demais para o provedor
+        self._criando: set[str] = set()
+        # Tarefas em segundo plano: o loop só guarda referência fraca, sem isso podem ser coletadas no meio
+        self._tarefas: set[asyncio.Task] = set()
+        self._pausado_ate = 0.0
+        self.reutilizacoes = 0
+        self.sem_prefixo = 0
+        self.criados = 0
+        self.falhas = 0
+        self.tokens_economizados = 0
+
+    def _registrar_uso(self, assinatura: str) -> int:
+        agora = time.monotonic()
+        usos = self._usos.setdefault(assinatura, deque())
+        usos.append(agora)
+        while usos and usos[0] < agora - self.ttl_segundos:
+            usos.popleft()
+        if len(self._usos) > MAX_CONJUNTOS_CONTADOS:
+            # Esquece os conjuntos que não foram usados dentro do TTL
+            self._usos = {a: u for a, u in self._usos.items() if u[-1] >= agora - self.ttl_segundos}
+        return len(usos)
+
+    def _prefixo_valido(self, contextos: list[str]) -> PrefixoCacheado | None:
+        """O maior prefixo registrado cujos contextos estão todos entre os selecionados."""
+        selecionados = set(contextos)
+        melhor = None
+        for prefixo in list(self._prefixos.values()):
+            if prefixo.expira_em - time.time() < MARGEM_EXPIRACAO_SEGUNDOS:
+                self.descartar(prefixo.nome)
+                continue
+            if prefixo.contextos <= selecionados and (melhor is None or prefixo.tokens > melhor.tokens):
+                melhor = prefixo
+        return melhor
+
+    # ---------- Uso no /ia/gerar-resposta ----------
+
+    def usar(self, instrucoes: str, contextos: list[str]) -> tuple[PrefixoCacheado | None, list[str]]:
+        """
+        Retorna um prefixo em cache formado só por contextos selecionados para esta pergunta
+        (ou None) e os contextos selecionados que ainda precisam ir no prompt. Quando o mesmo
+        conjunto de contextos passa a ser frequente, agenda a criação do prefixo em segundo
+        plano; esta requisição segue sem ele.
+        """
+        if not self.ativo or not getattr(self.gateway.backend, "suporta_cache_prefixo", False) or not contextos:
+            return None, contextos
+        assinatura = assinatura_contextos(contextos)
+        usos = self._registrar_uso(assinatura)
+
+        prefixo = self._prefixo_valido(contextos)
+        if prefixo is None:
+            self.sem_prefixo += 1
+            if (usos >= self.min_usos and assinatura not in self._criando and assinatura not in self._pequenos
+                    and time.time() >= self._pausado_ate):
+                self._criando.add(assinatura)
+                self._em_segundo_plano(self._criar(instrucoes, list(contextos), assinatura))
+            return None, contextos
+
+        restantes = [c for c in contextos if c not in prefixo.contextos]
+        self.reutilizacoes += 1
+        self.tokens_economizados += prefixo.tokens
+        return prefixo, restantes
+
+    def _em_segundo_plano(self, corotina) -> None:
+        tarefa = asyncio.ensure_future(corotina)
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._finalizar_tarefa)
+
+    def _finalizar_tarefa(self, tarefa: asyncio.Task) -> None:
+        self._tarefas.discard(tarefa)
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            print(f"   [Cache Prefixo] Tarefa em segundo plano falhou: {tarefa.exception()}")
+
+    async def _criar(self, instrucoes: str, contextos: list[str], assinatura: str) -> None:
+        prazo.remover()  # Roda em segundo plano, sem o prazo da requisição que agendou a criação
+        try:
+            contexto = formatar_contexto(contextos)
+            tokens = estimar_tokens(instrucoes) + estimar_tokens(contexto)
+            if tokens < self.min_tokens:
+                # Abaixo do mínimo aceito pelo provedor: continua com o prompt completo
+                if len(self._pequenos) >= MAX_CONJUNTOS_CONTADOS:
+                    self._pequenos.clear()
+                self._pequenos.add(assinatura)
+                return
+            nome = await self.gateway.criar_cache_prefixo(instrucoes, contexto, self.ttl_segundos)
+            self._prefixos[assinatura] = PrefixoCacheado(
+                nome=nome,
+                assinatura=assinatura,
+                contextos=frozenset(contextos),
+                tokens=tokens,
+                expira_em=time.time() + self.ttl_segundos,
+            )
+            self.criados += 1
+            print(f"   [Cache Prefixo] Prefixo com {len(contextos)} contextos registrado ({tokens} tokens estimados)")
+        except Exception as e:
+            self.falhas += 1
+            if isinstance(e, ERROS_PREFIXO + (NotImplementedError,)):
+                self._pausado_ate = time.time() + PAUSA_APOS_ERRO_SEGUNDOS
+            print(f"   [Cache Prefixo] Não foi possível registrar o prefixo: {e}")
+        finally:
+            self._criando.discard(assinatura)
+
+    def descartar(self, nome: str) -> None:
+        """Esquece um prefixo (expirado ou recusado pelo provedor) e o remove do provedor."""
+        for assinatura, prefixo in list(self._prefixos.items()):
+            if prefixo.nome == nome:
+                del self._prefixos[assinatura]
+                self._em_segundo_plano(self._remover_no_provedor(nome))
+
+    async def _remover_no_provedor(self, nome: str) -> None:
+        prazo.remover()
+        try:
+            await self.gateway.remover_cache_prefixo(nome)
+        except Exception as e:
+            # Se não der para remover, o provedor apaga sozinho quando o TTL vencer
+            print(f"   [Cache Prefixo] Não foi possível remover o prefixo {nome} do provedor: {e}")
+
+    def metricas(self) -> dict:
+        total = self.reutilizacoes + self.sem_prefixo
+        return {
+            "ativo": self.ativo and getattr(self.gateway.backend, "suporta_cache_prefixo", False),
+            "prefixos": len(self._prefixos),
+            "reutilizacoes": self.reutilizacoes,
+            "sem_prefixo": self.sem_prefixo,
+            "taxa_reutilizacao": round(self.reutilizacoes / total, 4) if total else 0.0,
+            "criados": self.criados,
+            "falhas": self.falhas,
+            "tokens_nao_reenviados": self.tokens_economizados,
+        }
+
+
+cache_prefixos = CachePrefixos(
+    gateway=gateway_llm,
+    ativo=settings.IA_CACHE_PREFIXO_ATIVO,
+    min_tokens=settings.IA_CACHE_PREFIXO_MIN_TOKENS,
+    min_usos=settings.IA_CACHE_PREFIXO_MIN_USOS,
+    ttl_segundos=settings.IA_CACHE_PREFIXO_TTL_SEGUNDOS,
+)
+
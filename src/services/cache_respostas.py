@@ -0,0 +1,94 @@
+import hashlib
+import threading
+from cachetools import TTLCache
+from ..config import settings
+from . import eventos_base
+from .texto import normalizar
+
+# --- CACHE DE RESPOSTAS DO /ia/gerar-resposta ---
+# Alunos repetem as mesmas perguntas; cada uma custa uma busca na base e uma chamada ao Gemini.
+# O cache (LRU + TTL) guarda a resposta gerada, indexada pela pergunta normalizada, pelo
+# contexto enviado pelo chamador e por uma impressão digital dos contextos recuperados.
+# Qualquer escrita na base de conhecimento limpa o cache.
+# O cache negativo guarda as perguntas que há pouco não encontraram nenhum contexto na base,
+# para que a repetição delas não refaça a busca; também é limpo a cada escrita na base.
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação e com espaços simples."""
+    return normalizar(pergunta)
+
+
+def impressao_digital(contextos: list[str]) -> str:
+    """Hash do conjunto de contextos recuperados (muda se o conteúdo da base mudar)."""
+    h = hashlib.sha256()
+    for contexto in contextos:
+        h.update(contexto.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def gerar_chave(pergunta: str, contexto: str | None, contextos_recuperados: list[str]) -> str:
+    partes = [normalizar_pergunta(pergunta), contexto or "", impressao_digital(contextos_recuperados)]
+    return hashlib.sha256("\x1e".join(partes).encode("utf-8")).hexdigest()
+
+
+class CacheRespostas:
+    """Cache LRU com expiração (TTL), seguro para uso entre threads, com contadores de acerto/erro."""
+
+    def __init__(self, maximo: int, ttl_segundos: int):
+        self._cache = TTLCache(maxsize=maximo, ttl=ttl_segundos)
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+
+    def obter(self, chave: str):
+        with self._lock:
+            valor = self._cache.get(chave)
+            if valor is None:
+                self.falhas += 1
+            else:
+                self.acertos += 1
+            return valor
+
+    def guardar(self, chave: str, valor) -> None:
+        with self._lock:
+            self._cache[chave] = valor
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.invalidacoes += 1
+
+    def metricas(self) -> dict:
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "entradas": len(self._cache),
+                "capacidade": self._cache.maxsize,
+                "ttl_segundos": self._cache.ttl,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": round(self.acertos / total, 4) if total else 0.0,
+                "invalidacoes": self.invalidacoes,
+            }
+
+
+cache_respostas = CacheRespostas(
+    maximo=settings.IA_CACHE_RESPOSTAS_MAXIMO,
+    ttl_segundos=settings.IA_CACHE_RESPOSTAS_TTL_SEGUNDOS,
+)
+
+cache_negativo = CacheRespostas(
+    maximo=settings.IA_CACHE_NEGATIVO_MAXIMO,
+    ttl_segundos=settings.IA_CACHE_NEGATIVO_TTL_SEGUNDOS,
+)
+
+
+@eventos_base.registrar_ouvinte
+def _ao_alterar_base(acao: str, registro: dict) -> None:
+    # Uma resposta pode ter sido gerada com o conteúdo antigo (ou removido) do registro,
+    # e uma pergunta sem contexto pode passar a ter um
+    cache_respostas.limpar()
+    cache_negativo.limpar()
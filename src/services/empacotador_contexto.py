@@ -0,0 +1,104 @@
+import hashlib
+import re
+from .indice_bm25 import tokenizar
+
+# --- EMPACOTADOR DE CONTEXTO DO PROMPT DO /ia/gerar-resposta ---
+# Os contextos recuperados eram concatenados na ordem em que chegavam, sem limite de tamanho.
+# Aqui eles são ranqueados pela relevância à pergunta, trechos repetidos ou quase iguais
+# são descartados e o resultado é cortado para caber em um orçamento de tokens.
+
+CARACTERES_POR_TOKEN = 4  # Estimativa usual para textos em português no Gemini
+TAMANHO_SHINGLE = 3  # Palavras por shingle na comparação de quase-duplicatas
+NUM_PERMUTACOES = 64  # Tamanho da assinatura MinHash
+LIMIAR_DUPLICATA = 0.8  # Similaridade de Jaccard estimada a partir da qual dois trechos são considerados iguais
+PESO_POSICAO = 0.5  # Peso da ordem de recuperação (as primeiras fontes já vêm ranqueadas)
+
+_MASCARA_64 = (1 << 64) - 1
+_SEMENTES = [
+    int.from_bytes(hashlib.blake2b(str(i).encode(), digest_size=8).digest(), "big") | 1
+    for i in range(NUM_PERMUTACOES)
+]
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa rápida (sem tokenizador) da quantidade de tokens de um texto."""
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+def _hash_conteudo(texto: str) -> str:
+    normalizado = " ".join(re.findall(r"\w+", texto.lower()))
+    return hashlib.sha1(normalizado.encode("utf-8")).hexdigest()
+
+
+def assinatura_minhash(texto: str) -> tuple[int, ...] | None:
+    """Assinatura MinHash dos shingles de palavras do texto (None se o texto for curto demais)."""
+    palavras = tokenizar(texto)
+    if len(palavras) < TAMANHO_SHINGLE:
+        return None
+    shingles = {
+        int.from_bytes(hashlib.blake2b(" ".join(palavras[i:i + TAMANHO_SHINGLE]).encode(), digest_size=8).digest(), "big")
+        for i in range(len(palavras) - TAMANHO_SHINGLE + 1)
+    }
+    return tuple(min((s * semente) & _MASCARA_64 for s in shingles) for semente in _SEMENTES)
+
+
+def similaridade(assinatura_a: tuple[int, ...], assinatura_b: tuple[int, ...]) -> float:
+    """Estimativa da similaridade de Jaccard entre dois textos a partir das assinaturas."""
+    return sum(a == b for a, b in zip(assinatura_a, assinatura_b)) / NUM_PERMUTACOES
+
+
+def pontuar(termos_pergunta: set[str], texto: str, posicao: int) -> float:
+    """
+    Relevância de um contexto: fração dos termos da pergunta presentes no texto,
+    com um bônus decrescente pela posição em que ele foi recuperado.
+    """
+    termos_texto = set(tokenizar(texto))
+    cobertura = len(termos_pergunta & termos_texto) / len(termos_pergunta) if termos_pergunta else 0.0
+    return cobertura + PESO_POSICAO / (1 + posicao)
+
+
+def empacotar_contextos(pergunta: str, contextos: list[str], orcamento_tokens: int,
+                        relevancias: list[float] | None = None, maximo: int = 0) -> list[str]:
+    """
+    Seleciona, em ordem de relevância, os contextos que cabem no orçamento de tokens (e, com
+    'maximo', no máximo essa quantidade), descartando duplicatas exatas e quase-duplicatas.
+    Com 'relevancias' (ex.: o score da fusão dos rankings da busca), elas definem a ordem;
+    sem elas, a relevância é calculada por pontuar().
+    """
+    if relevancias is None:
+        termos_pergunta = set(tokenizar(pergunta))
+        relevancias = [pontuar(termos_pergunta, texto, posicao) for posicao, texto in enumerate(contextos)]
+    candidatos = sorted(
+        ((relevancia, posicao, texto) for posicao, (texto, relevancia) in enumerate(zip(contextos, relevancias)) if texto),
+        key=lambda x: (-x[0], x[1]),
+    )
+
+    selecionados: list[str] = []
+    hashes: set[str] = set()
+    assinaturas: list[tuple[int, ...]] = []
+    usados = 0
+    for _, _, texto in candidatos:
+        if maximo and len(selecionados) >= maximo:
+            break
+        hash_texto = _hash_conteudo(texto)
+        if hash_texto in hashes:
+            continue
+        assinatura = assinatura_minhash(texto)
+        if assinatura and any(similaridade(assinatura, a) >= LIMIAR_DUPLICATA for a in assinaturas):
+            continue
+
+        restante = orcamento_tokens - usados
+        tokens = estimar_tokens(texto)
+        if tokens > restante:
+            # O contexto mais relevante é truncado em vez de descartado; os demais só entram inteiros
+            if selecionados or restante <= 0:
+                continue
+            texto = texto[:restante * CARACTERES_POR_TOKEN]
+            tokens = restante
+
+        selecionados.append(texto)
+        hashes.add(hash_texto)
+        if assinatura:
+            assinaturas.append(assinatura)
+        usados += tokens
+    return selecionados
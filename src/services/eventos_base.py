@@ -0,0 +1,41 @@
+from typing import Callable
+
+# --- NOTIFICAÇÕES DE ALTERAÇÃO DA TABELA 'baseconhecimento' ---
+# Os routers que escrevem na base (base_conhecimento.py e documento.py) avisam aqui
+# quando um registro é criado, atualizado ou removido. Índices e caches locais se
+# registram como ouvintes para se manterem atualizados sem consultar o banco a cada pergunta.
+
+ACAO_UPSERT = "upsert"
+ACAO_REMOCAO = "remocao"
+
+_ouvintes: list[Callable[[str, dict], None]] = []
+
+
+def registrar_ouvinte(ouvinte: Callable[[str, dict], None]) -> Callable[[str, dict], None]:
+    """
+    Registra uma função que recebe (acao, registro) a cada alteração na base.
+    Pode ser usada como decorator.
+    """
+    if ouvinte not in _ouvintes:
+        _ouvintes.append(ouvinte)
+    return ouvinte
+
+
+def _notificar(acao: str, registro: dict) -> None:
+    for ouvinte in list(_ouvintes):
+        try:
+            ouvinte(acao, registro)
+        except Exception as e:
+            # Uma falha no índice/cache nunca deve derrubar a escrita no banco
+            print(f"   [Eventos Base] Falha ao notificar '{getattr(ouvinte, '__name__', ouvinte)}': {e}")
+
+
+def notificar_upsert(registro: dict) -> None:
+    """Avisa que um registro da base de conhecimento foi criado ou atualizado."""
+    if registro:
+        _notificar(ACAO_UPSERT, registro)
+
+
+def notificar_remocao(id_conhecimento) -> None:
+    """Avisa que um registro da base de conhecimento foi removido."""
+    _notificar(ACAO_REMOCAO, {"id_conhecimento": str(id_conhecimento)})
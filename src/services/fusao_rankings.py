@@ -0,0 +1,53 @@
+from dataclasses import dataclass, field
+
+# --- RANKING HÍBRIDO DA BUSCA DE CONTEXTO (RECIPROCAL RANK FUSION) ---
+# Cada etapa da busca do /ia/gerar-resposta (palavras-chave, BM25, vetorial, trechos, RPC,
+# ilike) devolve os resultados na sua própria ordem e numa escala própria de score, que não
+# são comparáveis entre si. Em vez de juntar os contextos na ordem em que as etapas rodaram,
+# cada item recebe, por fonte em que aparece, peso_da_fonte / (k + posição na fonte); a soma
+# ordena a lista final. Itens encontrados por várias fontes sobem, e a posição e o score de
+# cada fonte ficam guardados no item.
+
+
+@dataclass
+class ContextoRanqueado:
+    texto: str
+    score: float = 0.0  # Soma da fusão (RRF) nas fontes em que o item apareceu
+    id_conhecimento: str | None = None  # Registro de origem (None para trechos de documentos)
+    fontes: dict[str, tuple[int, float]] = field(default_factory=dict)  # fonte -> (posição, score na fonte)
+
+
+class FusaoRankings:
+    def __init__(self, k: int = 60, pesos: dict[str, float] | None = None):
+        self.k = k
+        self.pesos = pesos or {}
+        self._itens: dict[str, ContextoRanqueado] = {}
+        self._posicoes: dict[str, int] = {}  # fonte -> última posição atribuída
+
+    def __contains__(self, chave: str) -> bool:
+        return chave in self._itens
+
+    def adicionar(self, fonte: str, chave: str, texto: str, score: float,
+                  id_conhecimento: str | None = None) -> bool:
+        """
+        Coloca 'chave' na próxima posição do ranking de 'fonte' (os resultados de cada fonte
+        precisam chegar do mais para o menos relevante). Repetições na mesma fonte são ignoradas.
+        Retorna True se o item passou a ser um contexto (texto não vazio) agora.
+        """
+        item = self._itens.get(chave)
+        if item is None:
+            item = self._itens[chave] = ContextoRanqueado("", id_conhecimento=id_conhecimento)
+        if fonte in item.fontes:
+            return False
+        posicao = self._posicoes.get(fonte, 0) + 1
+        self._posicoes[fonte] = posicao
+        item.fontes[fonte] = (posicao, score)
+        item.score += self.pesos.get(fonte, 1.0) / (self.k + posicao)
+        if texto and not item.texto:
+            item.texto = texto
+            return True
+        return False
+
+    def ranking(self) -> list[ContextoRanqueado]:
+        """Todos os itens, do maior para o menor score (no empate, o encontrado primeiro)."""
+        return sorted(self._itens.values(), key=lambda item: -item.score)
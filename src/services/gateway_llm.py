@@ -0,0 +1,273 @@
+import asyncio
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable
+from google.api_core import exceptions as google_exceptions
+from starlette.concurrency import iterate_in_threadpool
+from ..config import settings
+from . import prazo
+from .backends_llm import BackendLLM, criar_backend
+from .prazo import PrazoEsgotado
+
+# --- GATEWAY ÚNICO PARA AS CHAMADAS AO GEMINI ---
+# Toda chamada ao Gemini (geração, streaming e upload de arquivos) passa por aqui:
+# - um semáforo global limita quantas chamadas ficam abertas ao mesmo tempo;
+# - um token bucket mantém a taxa de requisições abaixo da cota da API;
+# - erros temporários (429, 503, timeout) são repetidos com backoff exponencial com jitter,
+#   respeitando um orçamento de tentativas e de tempo por requisição;
+# - com um prazo definido na requisição (ver prazo.py), a espera na fila, as retentativas e a
+#   própria chamada não passam dele (PrazoEsgotado).
+# As chamadas do backend (SDK do Gemini ou o fake de testes, ver backends_llm.py) são
+# síncronas, então rodam em threads para não bloquear o event loop.
+
+# Erros que costumam se resolver sozinhos e valem uma nova tentativa
+ERROS_TEMPORARIOS = (
+    google_exceptions.ResourceExhausted,  # 429 (cota)
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,  # 503
+    google_exceptions.DeadlineExceeded,  # 504
+    google_exceptions.InternalServerError,  # 500
+)
+
+
+class LimiteGeminiExcedido(Exception):
+    """O Gemini continua sobrecarregado depois de esgotado o orçamento de tentativas ou de espera."""
+
+
+class TokenBucket:
+    """Libera até 'taxa_por_segundo' requisições por segundo, com rajadas de até 'capacidade'."""
+
+    def __init__(self, taxa_por_segundo: float, capacidade: int):
+        self.taxa_por_segundo = taxa_por_segundo
+        self.capacidade = capacidade
+        self._tokens = float(capacidade)
+        self._atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reservar(self) -> float:
+        """Consome um token e retorna quantos segundos é preciso esperar até ele estar disponível."""
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(self.capacidade, self._tokens + (agora - self._atualizado_em) * self.taxa_por_segundo)
+            self._atualizado_em = agora
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.taxa_por_segundo
+
+    def _devolver(self) -> None:
+        with self._lock:
+            self._tokens = min(self.capacidade, self._tokens + 1)
+
+    async def adquirir(self, espera_maxima: float) -> float:
+        """Aguarda um token. Retorna o tempo de espera ou levanta LimiteGeminiExcedido."""
+        espera = self._reservar()
+        if espera > espera_maxima:
+            self._devolver()
+            raise LimiteGeminiExcedido(f"Limite de requisições ao Gemini atingido (espera estimada de {espera:.1f}s)")
+        if espera:
+            await asyncio.sleep(espera)
+        return espera
+
+
+class GatewayLLM:
+    def __init__(
+        self,
+        backend: BackendLLM,
+        max_concorrencia: int,
+        requisicoes_por_minuto: float,
+        rajada: int,
+        max_tentativas: int,
+        orcamento_retentativas_segundos: float,
+        backoff_base_segundos: float,
+        backoff_max_segundos: float,
+        espera_maxima_segundos: float,
+    ):
+        self.backend = backend
+        self.max_concorrencia = max_concorrencia
+        self.max_tentativas = max_tentativas
+        self.orcamento_retentativas_segundos = orcamento_retentativas_segundos
+        self.backoff_base_segundos = backoff_base_segundos
+        self.backoff_max_segundos = backoff_max_segundos
+        self.espera_maxima_segundos = espera_maxima_segundos
+        # Criado no primeiro uso, dentro do event loop que vai usá-lo (não na importação do módulo)
+        self._semaforo: asyncio.Semaphore | None = None
+        self._loop_semaforo: asyncio.AbstractEventLoop | None = None
+        self._bucket = TokenBucket(requisicoes_por_minuto / 60, rajada)
+        self.chamadas = 0
+        self.em_andamento = 0
+        self.retentativas = 0
+        self.erros_limite = 0
+        self.falhas = 0
+        self.rejeitadas = 0
+        self.prazos_esgotados = 0
+        self.espera_total_segundos = 0.0
+
+    # ---------- Controle de concorrência ----------
+
+    def _semaforo_do_loop(self) -> asyncio.Semaphore:
+        # Um semáforo só funciona no loop em que foi usado pela primeira vez; scripts que chamam
+        # asyncio.run() mais de uma vez ganham um semáforo novo a cada loop
+        loop = asyncio.get_running_loop()
+        if self._semaforo is None or self._loop_semaforo is not loop:
+            self._semaforo = asyncio.Semaphore(self.max_concorrencia)
+            self._loop_semaforo = loop
+        return self._semaforo
+
+    async def _adquirir_vaga(self) -> None:
+        inicio = time.monotonic()
+        espera_maxima = prazo.limitar(self.espera_maxima_segundos)
+        limitada_pelo_prazo = espera_maxima < self.espera_maxima_segundos
+        try:
+            await asyncio.wait_for(self._semaforo_do_loop().acquire(), timeout=espera_maxima)
+        except asyncio.TimeoutError:
+            if limitada_pelo_prazo:
+                raise PrazoEsgotado("Prazo da requisição esgotado aguardando vaga para o Gemini")
+            raise LimiteGeminiExcedido("Muitas chamadas simultâneas ao Gemini; tente novamente em instantes")
+        try:
+            restante = espera_maxima - (time.monotonic() - inicio)
+            await self._bucket.adquirir(max(restante, 0.0))
+        except LimiteGeminiExcedido as e:
+            self._semaforo.release()
+            if limitada_pelo_prazo:
+                raise PrazoEsgotado(f"Prazo da requisição esgotado aguardando a taxa do Gemini ({e})") from e
+            raise
+        except BaseException:
+            self._semaforo.release()
+            raise
+        finally:
+            self.espera_total_segundos += time.monotonic() - inicio
+        self.em_andamento += 1
+
+    def _liberar_vaga(self) -> None:
+        self.em_andamento -= 1
+        self._semaforo.release()
+
+    def _backoff(self, tentativa: int, erro: Exception) -> float:
+        """Backoff exponencial com 'full jitter'; para 429 começa do dobro da base."""
+        base = self.backoff_base_segundos * (2 if isinstance(erro, google_exceptions.ResourceExhausted) else 1)
+        return random.uniform(0, min(self.backoff_max_segundos, base * 2 ** tentativa))
+
+    # ---------- Execução com retentativas ----------
+
+    async def executar(self, funcao: Callable, *args, descricao: str = "chamada", manter_vaga: bool = False, **kwargs):
+        """
+        Executa uma chamada bloqueante do SDK do Gemini respeitando o limite de concorrência,
+        a taxa máxima e o orçamento de retentativas desta requisição.
+        Com manter_vaga=True a vaga no semáforo continua ocupada após o sucesso
+        (quem chamou deve liberá-la com _liberar_vaga).
+        """
+        self.chamadas += 1
+        inicio = time.monotonic()
+        tentativa = 0
+        while True:
+            try:
+                await self._adquirir_vaga()
+            except (LimiteGeminiExcedido, PrazoEsgotado):
+                self.rejeitadas += 1
+                raise
+            sucesso = False
+            try:
+                restante = prazo.restante()
+                if restante is None:
+                    resultado = await asyncio.to_thread(funcao, *args, **kwargs)
+                else:
+                    # A thread do SDK não pode ser interrompida: ela termina sozinha e o resultado é descartado
+                    try:
+                        resultado = await asyncio.wait_for(asyncio.to_thread(funcao, *args, **kwargs), timeout=max(restante, 0.0))
+                    except asyncio.TimeoutError:
+                        self.prazos_esgotados += 1
+                        raise PrazoEsgotado(f"{descricao}: prazo da requisição esgotado") from None
+                sucesso = True
+                return resultado
+            except ERROS_TEMPORARIOS as e:
+                if isinstance(e, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+                    self.erros_limite += 1
+                tentativa += 1
+                espera = self._backoff(tentativa, e)
+                gasto = time.monotonic() - inicio
+                if prazo.esgotado(reserva=espera):
+                    self.prazos_esgotados += 1
+                    raise PrazoEsgotado(f"{descricao}: sem tempo para nova tentativa antes do prazo ({e})") from e
+                if tentativa >= self.max_tentativas or gasto + espera > self.orcamento_retentativas_segundos:
+                    self.falhas += 1
+                    print(f"   [Gateway Gemini] {descricao}: desistindo após {tentativa} tentativa(s): {e}")
+                    raise LimiteGeminiExcedido(f"Gemini indisponível no momento: {e}") from e
+                self.retentativas += 1
+                print(f"   [Gateway Gemini] {descricao}: erro temporário ({type(e).__name__}), nova tentativa em {espera:.1f}s")
+            except PrazoEsgotado:
+                raise
+            except Exception:
+                self.falhas += 1
+                raise
+            finally:
+                if not (sucesso and manter_vaga):
+                    self._liberar_vaga()
+            await asyncio.sleep(espera)
+
+    async def gerar(self, conteudo, **kwargs):
+        """Equivalente assíncrono de GenerativeModel.generate_content."""
+        return await self.executar(self.backend.gerar, conteudo, descricao="generate_content", **kwargs)
+
+    async def gerar_stream(self, conteudo, **kwargs) -> AsyncIterator[str]:
+        """
+        Gera a resposta em streaming, devolvendo o texto de cada trecho.
+        Só há retentativa enquanto nenhum trecho foi recebido; a vaga no semáforo
+        fica ocupada até o fim do stream.
+        """
+        response = await self.executar(
+            self.backend.gerar, conteudo,
+            descricao="generate_content (stream)", manter_vaga=True, stream=True, **kwargs
+        )
+        try:
+            async for chunk in iterate_in_threadpool(iter(response)):
+                try:
+                    texto = chunk.text
+                except ValueError:
+                    # Trecho sem texto (ex.: apenas metadados de segurança)
+                    continue
+                if texto:
+                    yield texto
+        finally:
+            self._liberar_vaga()
+
+    async def enviar_arquivo(self, caminho_arquivo: str, mime_type: str):
+        """Envia um arquivo ao modelo (upload_file do backend) passando pelos mesmos limites."""
+        return await self.executar(self.backend.enviar_arquivo, caminho_arquivo, mime_type, descricao="upload_file")
+
+    async def criar_cache_prefixo(self, instrucoes: str, contexto: str, ttl_segundos: int) -> str:
+        """Registra no provedor um prefixo de prompt reutilizável (CachedContent, no Gemini)."""
+        return await self.executar(
+            self.backend.criar_cache_prefixo, instrucoes, contexto, ttl_segundos, descricao="create_cached_content"
+        )
+
+    async def remover_cache_prefixo(self, nome: str) -> None:
+        await self.executar(self.backend.remover_cache_prefixo, nome, descricao="delete_cached_content")
+
+    def metricas(self) -> dict:
+        return {
+            "backend": self.backend.nome,
+            "max_concorrencia": self.max_concorrencia,
+            "em_andamento": self.em_andamento,
+            "chamadas": self.chamadas,
+            "retentativas": self.retentativas,
+            "erros_limite_429": self.erros_limite,
+            "falhas": self.falhas,
+            "rejeitadas": self.rejeitadas,
+            "prazos_esgotados": self.prazos_esgotados,
+            "espera_total_segundos": round(self.espera_total_segundos, 3),
+        }
+
+
+gateway_llm = GatewayLLM(
+    backend=criar_backend(),
+    max_concorrencia=settings.IA_GEMINI_MAX_CONCORRENCIA,
+    requisicoes_por_minuto=settings.IA_GEMINI_REQUISICOES_POR_MINUTO,
+    rajada=settings.IA_GEMINI_RAJADA,
+    max_tentativas=settings.IA_GEMINI_MAX_TENTATIVAS,
+    orcamento_retentativas_segundos=settings.IA_GEMINI_ORCAMENTO_RETENTATIVAS_SEGUNDOS,
+    backoff_base_segundos=settings.IA_GEMINI_BACKOFF_BASE_SEGUNDOS,
+    backoff_max_segundos=settings.IA_GEMINI_BACKOFF_MAX_SEGUNDOS,
+    espera_maxima_segundos=settings.IA_GEMINI_ESPERA_MAXIMA_SEGUNDOS,
+)
@@ -0,0 +1,307 @@
+import json
+import math
+import threading
+import time
+from collections import Counter
+from typing import Callable
+from ..config import settings
+from ..supabase_client import supabase
+from . import eventos_base
+from .matriculas import no_escopo
+from .texto import termos
+
+# --- ÍNDICE INVERTIDO BM25 DA BASE DE CONHECIMENTO ---
+# Mantém em memória os registros publicados de 'baseconhecimento' para que a etapa de
+# recuperação do /ia/gerar-resposta seja respondida com uma única consulta local,
+# ranqueada por relevância, em vez de um 'ilike' no banco para cada termo da pergunta.
+
+# Peso de cada campo no cálculo da frequência dos termos (BM25F simplificado)
+PESOS_CAMPOS = {
+    "conteudo_processado": 1.0,
+    "categoria": 2.0,
+    "palavra_chave": 2.0,
+    "nome_arquivo_origem": 1.5,
+}
+
+TAMANHO_PAGINA = 1000  # Limite padrão de linhas por requisição do PostgREST
+VERSAO_TOKENIZACAO = 2  # Muda com 'tokenizar'; índices salvos em disco com outra versão são reconstruídos
+
+
+def tokenizar(texto: str) -> list[str]:
+    """
+    Converte um texto em termos de busca, com a mesma normalização das colunas de busca
+    (texto.termos: sem acentos, sem pontuação, sem stopwords e no singular). Usado por todos os índices locais.
+    """
+    if not texto:
+        return []
+    return [t for t in termos(texto) if len(t) >= 2]
+
+
+def palavras_chave_como_texto(palavra_chave) -> str:
+    # palavra_chave pode vir como lista (JSONB) ou como string JSON
+    if isinstance(palavra_chave, str):
+        try:
+            palavra_chave = json.loads(palavra_chave)
+        except (json.JSONDecodeError, ValueError):
+            return palavra_chave
+    if isinstance(palavra_chave, list):
+        return " ".join(str(p) for p in palavra_chave)
+    return str(palavra_chave or "")
+
+
+def termos_do_registro(registro: dict) -> Counter:
+    """Calcula a frequência ponderada dos termos de um registro da base de conhecimento."""
+    frequencias: Counter = Counter()
+    for campo, peso in PESOS_CAMPOS.items():
+        valor = registro.get(campo)
+        if campo == "palavra_chave":
+            valor = palavras_chave_como_texto(valor)
+        for termo in tokenizar(valor or ""):
+            frequencias[termo] += peso
+    return frequencias
+
+
+class IndiceBM25:
+    """
+    Índice invertido com ranqueamento BM25.
+    Guarda, para cada termo, a frequência (ponderada) em cada documento.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[str, float]] = {}
+        self.tamanho_docs: dict[str, float] = {}
+        self.termos_docs: dict[str, list[str]] = {}
+        self.documentos: dict[str, dict] = {}
+        self.tamanho_total = 0.0
+
+    def __len__(self) -> int:
+        return len(self.documentos)
+
+    def adicionar(self, id_doc: str, termos: Counter, documento: dict) -> None:
+        if id_doc in self.documentos:
+            self.remover(id_doc)
+        for termo, frequencia in termos.items():
+            self.postings.setdefault(termo, {})[id_doc] = frequencia
+        tamanho = float(sum(termos.values()))
+        self.termos_docs[id_doc] = list(termos)
+        self.tamanho_docs[id_doc] = tamanho
+        self.tamanho_total += tamanho
+        self.documentos[id_doc] = documento
+
+    def remover(self, id_doc: str) -> None:
+        if id_doc not in self.documentos:
+            return
+        for termo in self.termos_docs.pop(id_doc, []):
+            docs = self.postings.get(termo, {})
+            docs.pop(id_doc, None)
+            if not docs:
+                self.postings.pop(termo, None)
+        self.tamanho_total -= self.tamanho_docs.pop(id_doc, 0.0)
+        del self.documentos[id_doc]
+
+    def buscar(self, termos_consulta: list[str], limite: int = 10,
+               permitido: Callable[[str], bool] | None = None) -> list[tuple[str, float]]:
+        """
+        Retorna (id_doc, score) dos documentos mais relevantes, em ordem decrescente de score.
+        Com 'permitido', só os documentos aceitos por ele entram no ranking.
+        """
+        total_docs = len(self.documentos)
+        if not total_docs or not termos_consulta:
+            return []
+
+        media_tamanho = self.tamanho_total / total_docs or 1.0
+        scores: dict[str, float] = {}
+        for termo in set(termos_consulta):
+            docs = self.postings.get(termo)
+            if not docs:
+                continue
+            idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for id_doc, frequencia in docs.items():
+                if permitido is not None and not permitido(id_doc):
+                    continue
+                normalizacao = self.k1 * (1 - self.b + self.b * self.tamanho_docs[id_doc] / media_tamanho)
+                scores[id_doc] = scores.get(id_doc, 0.0) + idf * frequencia * (self.k1 + 1) / (frequencia + normalizacao)
+
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limite]
+
+    def score_referencia(self, termos_consulta: list[str]) -> float:
+        """
+        Score de um documento de tamanho médio que contém uma vez cada termo da consulta.
+        Serve para levar o score BM25 (sem limite superior) a uma escala de 0 a 1.
+        """
+        total_docs = len(self.documentos)
+        referencia = 0.0
+        for termo in set(termos_consulta):
+            frequencia_docs = len(self.postings.get(termo, ()))
+            referencia += math.log(1 + (total_docs - frequencia_docs + 0.5) / (frequencia_docs + 0.5))
+        return referencia
+
+
+# Índice global da base de conhecimento (compartilhado por todas as requisições do worker)
+_indice = IndiceBM25()
+_lock = threading.RLock()
+_lock_construcao = threading.Lock()  # Só uma primeira construção; a leitura do banco não bloqueia o _lock
+_construido_em: float | None = None
+_reconstrucao_em_andamento = False
+# Alterações recebidas enquanto uma reconstrução lê o banco (uma lista por reconstrução em andamento)
+_alteracoes_pendentes: list[list[tuple[str, dict]]] = []
+
+
+def carregar_registros_publicados() -> list[dict]:
+    """Busca, página por página, todos os registros publicados da tabela 'baseconhecimento'."""
+    registros: list[dict] = []
+    inicio = 0
+    while True:
+        response = (
+            supabase.table("baseconhecimento")
+            .select("*")
+            .eq("status", "publicado")
+            .range(inicio, inicio + TAMANHO_PAGINA - 1)
+            .execute()
+        )
+        pagina = response.data or []
+        registros.extend(pagina)
+        if len(pagina) < TAMANHO_PAGINA:
+            return registros
+        inicio += TAMANHO_PAGINA
+
+
+def reconstruir_indice() -> int:
+    """
+    Reconstrói o índice a partir do banco e substitui o índice atual.
+    As alterações notificadas durante a leitura do banco são aplicadas de novo no índice novo.
+    Retorna a quantidade de documentos indexados.
+    """
+    global _indice, _construido_em
+    inicio = time.perf_counter()
+    alteracoes: list[tuple[str, dict]] = []
+    with _lock:
+        _alteracoes_pendentes.append(alteracoes)
+    try:
+        registros = carregar_registros_publicados()
+
+        novo_indice = IndiceBM25()
+        for registro in registros:
+            id_reg = registro.get("id_conhecimento")
+            if id_reg:
+                novo_indice.adicionar(str(id_reg), termos_do_registro(registro), registro)
+
+        with _lock:
+            # A leitura pode ter acontecido antes dessas escritas (reaplicar é idempotente)
+            for acao, registro in alteracoes:
+                _aplicar_alteracao(novo_indice, acao, registro)
+            _indice = novo_indice
+            _construido_em = time.time()
+    finally:
+        with _lock:
+            _alteracoes_pendentes.remove(alteracoes)
+
+    print(f"   [Indice BM25] {len(novo_indice)} documentos indexados em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    return len(novo_indice)
+
+
+def _reconstruir_em_segundo_plano() -> None:
+    global _reconstrucao_em_andamento
+    try:
+        reconstruir_indice()
+    except Exception as e:
+        print(f"   [Indice BM25] Falha ao reconstruir em segundo plano: {e}")
+    finally:
+        _reconstrucao_em_andamento = False
+
+
+def garantir_indice() -> bool:
+    """
+    Garante que o índice esteja carregado. Na primeira chamada constrói de forma síncrona;
+    depois de IA_INDICE_TTL_SEGUNDOS agenda uma reconstrução em segundo plano (para captar
+    alterações feitas por outros workers) e continua respondendo com o índice atual.
+    Retorna False se o índice não puder ser construído.
+    """
+    global _reconstrucao_em_andamento
+    if _construido_em is None:
+        try:
+            with _lock_construcao:
+                if _construido_em is None:
+                    reconstruir_indice()
+        except Exception as e:
+            print(f"   [Indice BM25] Não foi possível construir o índice: {e}")
+            return False
+        return True
+
+    if time.time() - _construido_em > settings.IA_INDICE_TTL_SEGUNDOS and not _reconstrucao_em_andamento:
+        _reconstrucao_em_andamento = True
+        threading.Thread(target=_reconstruir_em_segundo_plano, daemon=True).start()
+    return True
+
+
+def buscar(pergunta: str, limite: int = 10, disciplinas: frozenset[str] | None = None) -> list[tuple[dict, float]]:
+    """
+    Retorna os registros mais relevantes para a pergunta, como (registro, score).
+    Com 'disciplinas', só os registros gerais e os dessas disciplinas (ver matriculas.no_escopo).
+    """
+    termos = tokenizar(pergunta)
+    with _lock:
+        indice = _indice
+
+        def _permitido(id_doc: str) -> bool:
+            return no_escopo(indice.documentos[id_doc], disciplinas)
+
+        resultados = indice.buscar(termos, limite, _permitido if disciplinas is not None else None)
+        return [(_indice.documentos[id_doc], score) for id_doc, score in resultados]
+
+
+def score_referencia(pergunta: str) -> float:
+    """Score BM25 que corresponde à relevância 1.0 para a pergunta (ver IndiceBM25.score_referencia)."""
+    with _lock:
+        return _indice.score_referencia(tokenizar(pergunta))
+
+
+def registros_indexados() -> list[dict]:
+    """Cópia da lista de registros publicados atualmente no índice."""
+    with _lock:
+        return list(_indice.documentos.values())
+
+
+def _aplicar_alteracao(indice: IndiceBM25, acao: str, registro: dict) -> None:
+    """Aplica uma alteração da base (ver eventos_base) em 'indice'. Registros não publicados são removidos."""
+    id_reg = registro.get("id_conhecimento")
+    if not id_reg:
+        return
+    if acao != eventos_base.ACAO_REMOCAO and registro.get("status") == "publicado":
+        indice.adicionar(str(id_reg), termos_do_registro(registro), registro)
+    else:
+        indice.remover(str(id_reg))
+
+
+def atualizar_registro(registro: dict) -> None:
+    """Insere ou atualiza um registro no índice (registros não publicados são removidos)."""
+    with _lock:
+        _aplicar_alteracao(_indice, eventos_base.ACAO_UPSERT, registro)
+
+
+def remover_registro(id_conhecimento) -> None:
+    with _lock:
+        _indice.remover(str(id_conhecimento))
+
+
+def estatisticas() -> dict:
+    with _lock:
+        return {
+            "documentos_indexados": len(_indice),
+            "termos_distintos": len(_indice.postings),
+            "construido_em": _construido_em,
+        }
+
+
+@eventos_base.registrar_ouvinte
+def _ao_alterar_base(acao: str, registro: dict) -> None:
+    with _lock:
+        # Uma reconstrução em andamento pode ter lido o banco antes desta escrita
+        for alteracoes in _alteracoes_pendentes:
+            alteracoes.append((acao, registro))
+        # Enquanto o índice não foi construído não há o que atualizar: a primeira busca já lê o banco
+        if _construido_em is None:
+            return
+        _aplicar_alteracao(_indice, acao, registro)
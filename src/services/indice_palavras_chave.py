@@ -0,0 +1,344 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from ..config import settings
+from . import eventos_base, texto
+from .matriculas import no_escopo
+from .indice_bm25 import carregar_registros_publicados, palavras_chave_como_texto, tokenizar
+
+# --- ÍNDICE PALAVRA-CHAVE -> DOCUMENTOS ---
+# A busca por 'palavra_chave' lia 50 registros quaisquer, fazia o parse do JSON de cada um e
+# procurava substrings em Python (e não via nenhum documento fora desses 50). Aqui as
+# palavras-chave de todos os registros publicados ficam num dicionário termo -> ids,
+# normalizado (minúsculas, sem acentos), salvo em disco e atualizado a cada escrita na base.
+
+CAMPOS_REGISTRO = ("id_conhecimento", "conteudo_processado", "url_documento", "nome_arquivo_origem", "palavra_chave", "categoria", "id_disciplina")
+MAX_PALAVRAS_EXPRESSAO = 3  # Expressões de até 3 palavras ("engenharia de software") também são indexadas
+VERSAO_FORMATO = 3  # Muda quando os termos gerados mudam; arquivos de outra versão são reconstruídos
+
+
+def _variantes(termo: str) -> set[str]:
+    # O termo e o seu radical (mesma regra das colunas de busca), para que "prova" encontre a
+    # palavra-chave "provas" e "avaliacao" encontre "avaliacoes" (e vice-versa)
+    return {termo, texto.radical(termo)}
+
+
+def _expressoes(tokens: list[str]) -> set[str]:
+    """Termos isolados e expressões de até MAX_PALAVRAS_EXPRESSAO palavras consecutivas."""
+    expressoes: set[str] = set()
+    for tamanho in range(1, MAX_PALAVRAS_EXPRESSAO + 1):
+        for i in range(len(tokens) - tamanho + 1):
+            *inicio, ultimo = tokens[i:i + tamanho]
+            expressoes.update(" ".join(inicio + [v]) for v in _variantes(ultimo))
+    return expressoes
+
+
+def termos_das_palavras_chave(palavra_chave) -> set[str]:
+    """Termos normalizados de cada palavra-chave: a expressão completa e cada palavra dela."""
+    # palavra_chave pode vir como lista (JSONB) ou como string JSON
+    if isinstance(palavra_chave, str):
+        try:
+            palavra_chave = json.loads(palavra_chave)
+        except (json.JSONDecodeError, ValueError):
+            pass
+    palavras = palavra_chave if isinstance(palavra_chave, list) else [palavras_chave_como_texto(palavra_chave)]
+
+    termos: set[str] = set()
+    for palavra in palavras:
+        tokens = tokenizar(str(palavra))
+        if not tokens:
+            continue
+        if len(tokens) <= MAX_PALAVRAS_EXPRESSAO:
+            termos.update(" ".join(tokens[:-1] + [v]) for v in _variantes(tokens[-1]))
+        for token in tokens:
+            termos.update(_variantes(token))
+    return termos
+
+
+class IndicePalavrasChave:
+    def __init__(self):
+        self.termos: dict[str, set[str]] = {}
+        self.registros: dict[str, dict] = {}
+        self._termos_registro: dict[str, set[str]] = {}
+        self.construido_em: float | None = None  # Quando os registros foram lidos do banco (base do TTL)
+
+    def __len__(self) -> int:
+        return len(self.registros)
+
+    def adicionar(self, registro: dict) -> None:
+        id_reg = str(registro["id_conhecimento"])
+        self.remover(id_reg)
+        termos = termos_das_palavras_chave(registro.get("palavra_chave"))
+        if not termos:
+            return
+        self.registros[id_reg] = {campo: registro.get(campo) for campo in CAMPOS_REGISTRO}
+        self._termos_registro[id_reg] = termos
+        for termo in termos:
+            self.termos.setdefault(termo, set()).add(id_reg)
+
+    def remover(self, id_reg: str) -> None:
+        for termo in self._termos_registro.pop(id_reg, set()):
+            ids = self.termos.get(termo)
+            if ids is not None:
+                ids.discard(id_reg)
+                if not ids:
+                    del self.termos[termo]
+        self.registros.pop(id_reg, None)
+
+    def buscar(self, pergunta: str, limite: int = 10, disciplinas: frozenset[str] | None = None) -> list[tuple[dict, int]]:
+        """
+        Registros cujas palavras-chave aparecem na pergunta, com a quantidade de termos encontrados.
+        Com 'disciplinas', só os registros gerais e os dessas disciplinas.
+        """
+        encontrados: dict[str, int] = {}
+        for termo in _expressoes(tokenizar(pergunta)):
+            for id_reg in self.termos.get(termo, ()):
+                if not no_escopo(self.registros[id_reg], disciplinas):
+                    continue
+                encontrados[id_reg] = encontrados.get(id_reg, 0) + 1
+        ordenados = sorted(encontrados.items(), key=lambda x: x[1], reverse=True)[:limite]
+        return [(self.registros[id_reg], quantidade) for id_reg, quantidade in ordenados]
+
+    def para_dict(self) -> dict:
+        return {
+            "versao": VERSAO_FORMATO,
+            "construido_em": self.construido_em,
+            "termos": {termo: sorted(ids) for termo, ids in self.termos.items()},
+            "registros": dict(self.registros),
+        }
+
+    @classmethod
+    def de_dict(cls, dados: dict) -> "IndicePalavrasChave":
+        indice = cls()
+        # Arquivos salvos antes de 'id_disciplina' fazer parte do registro são reconstruídos
+        if any("id_disciplina" not in registro for registro in dados["registros"].values()):
+            raise KeyError("id_disciplina")
+        # Arquivos salvos com outra regra de variantes também
+        if dados.get("versao") != VERSAO_FORMATO:
+            raise KeyError("versao")
+        indice.registros = dados["registros"]
+        indice.construido_em = dados.get("construido_em")
+        for termo, ids in dados["termos"].items():
+            indice.termos[termo] = set(ids)
+            for id_reg in ids:
+                indice._termos_registro.setdefault(id_reg, set()).add(termo)
+        return indice
+
+
+# Índice global (compartilhado por todas as requisições do worker)
+_indice = IndicePalavrasChave()
+_lock = threading.RLock()
+_lock_construcao = threading.Lock()  # Só uma primeira construção; a leitura do banco não bloqueia o _lock
+_modificado_em: float | None = None  # mtime do arquivo em que o índice em memória se baseia
+_reconstrucao_em_andamento = False
+# Alterações recebidas enquanto uma reconstrução lê o banco (uma lista por reconstrução em andamento)
+_alteracoes_pendentes: list[list[tuple[str, dict]]] = []
+# Gravação em disco: as escritas na base só alteram o índice em memória e ficam em
+# '_alteracoes_nao_salvas' até a próxima gravação (no máximo a cada IA_INDICE_PALAVRAS_CHAVE_SALVAR_SEGUNDOS).
+# Se outro worker tiver salvo o arquivo nesse meio tempo, ele é recarregado e essas alterações
+# são reaplicadas por cima, em vez de sobrescrever o que o outro worker gravou.
+_alteracoes_nao_salvas: list[tuple[str, dict]] = []
+_lock_disco = threading.Lock()  # Uma gravação do arquivo por vez
+_gravacao_agendada = False
+
+
+def _aplicar_alteracao(indice: IndicePalavrasChave, acao: str, registro: dict) -> None:
+    if acao == eventos_base.ACAO_REMOCAO or registro.get("status") != "publicado":
+        indice.remover(str(registro["id_conhecimento"]))
+    else:
+        indice.adicionar(registro)
+
+
+def _ler_do_disco() -> tuple[IndicePalavrasChave, float] | None:
+    """Lê o índice salvo (sem tocar no índice em memória). None se não houver arquivo válido."""
+    caminho = settings.IA_INDICE_PALAVRAS_CHAVE_PATH
+    try:
+        modificado_em = os.path.getmtime(caminho)
+        with open(caminho, "r", encoding="utf-8") as f:
+            indice = IndicePalavrasChave.de_dict(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"   [Indice Palavras-chave] Arquivo inválido, será reconstruído: {e}")
+        return None
+    if indice.construido_em is None:
+        indice.construido_em = modificado_em
+    return indice, modificado_em
+
+
+def carregar_do_disco() -> bool:
+    """
+    Carrega o índice salvo, reaplicando as alterações deste worker que ainda não foram gravadas.
+    Retorna False se não houver arquivo válido.
+    """
+    global _indice, _modificado_em
+    lido = _ler_do_disco()
+    if lido is None:
+        return False
+    novo_indice, modificado_em = lido
+    with _lock:
+        for acao, registro in _alteracoes_nao_salvas:
+            _aplicar_alteracao(novo_indice, acao, registro)
+        _indice = novo_indice
+        _modificado_em = modificado_em
+    print(f"   [Indice Palavras-chave] {len(novo_indice)} documentos carregados do disco")
+    return True
+
+
+def _arquivo_mais_novo() -> bool:
+    """True se outro worker salvou o arquivo depois da versão em que o índice em memória se baseia."""
+    try:
+        return _modificado_em is not None and os.path.getmtime(settings.IA_INDICE_PALAVRAS_CHAVE_PATH) > _modificado_em
+    except FileNotFoundError:
+        return False
+
+
+def salvar_alteracoes(forcar: bool = False) -> None:
+    """
+    Salva em disco as alterações ainda não gravadas. Se outro worker salvou o arquivo depois da
+    última leitura, ele é recarregado antes (com as alterações deste worker por cima).
+    Com forcar=True (índice recém-reconstruído do banco) grava o índice em memória como está.
+    O conteúdo é copiado sob o lock e escrito fora dele, para que as buscas não esperem pelo disco.
+    """
+    global _modificado_em, _gravacao_agendada
+    with _lock_disco:
+        with _lock:
+            _gravacao_agendada = False
+            if not forcar and not _alteracoes_nao_salvas:
+                return
+        if not forcar and _arquivo_mais_novo():
+            carregar_do_disco()
+        with _lock:
+            dados = _indice.para_dict()
+            quantidade = len(_alteracoes_nao_salvas)
+        try:
+            caminho = settings.IA_INDICE_PALAVRAS_CHAVE_PATH
+            os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+            # Nome único do temporário: outro worker pode estar salvando ao mesmo tempo
+            descritor, caminho_temporario = tempfile.mkstemp(dir=os.path.dirname(caminho) or ".", suffix=".tmp")
+            try:
+                with os.fdopen(descritor, "w", encoding="utf-8") as f:
+                    json.dump(dados, f, ensure_ascii=False)
+                os.replace(caminho_temporario, caminho)
+            except BaseException:
+                if os.path.exists(caminho_temporario):
+                    os.remove(caminho_temporario)
+                raise
+        except Exception as e:
+            print(f"   [Indice Palavras-chave] Não foi possível salvar o índice em disco: {e}")
+            return
+        with _lock:
+            # Alterações que chegaram durante a escrita continuam pendentes para a próxima gravação
+            del _alteracoes_nao_salvas[:quantidade]
+            _modificado_em = os.path.getmtime(caminho)
+
+
+def _agendar_gravacao() -> None:
+    # Chamado com o _lock: agenda uma gravação, se ainda não houver uma
+    global _gravacao_agendada
+    if not _gravacao_agendada:
+        _gravacao_agendada = True
+        temporizador = threading.Timer(settings.IA_INDICE_PALAVRAS_CHAVE_SALVAR_SEGUNDOS, salvar_alteracoes)
+        temporizador.daemon = True
+        temporizador.start()
+
+
+def reconstruir_indice() -> int:
+    """
+    Reconstrói o índice a partir dos registros publicados e salva em disco. As alterações
+    notificadas durante a leitura do banco são aplicadas de novo no índice novo.
+    """
+    global _indice
+    inicio = time.perf_counter()
+    alteracoes: list[tuple[str, dict]] = []
+    with _lock:
+        _alteracoes_pendentes.append(alteracoes)
+    try:
+        novo_indice = IndicePalavrasChave()
+        novo_indice.construido_em = time.time()
+        for registro in carregar_registros_publicados():
+            if registro.get("id_conhecimento"):
+                novo_indice.adicionar(registro)
+        with _lock:
+            # A leitura pode ter acontecido antes dessas escritas (reaplicar é idempotente)
+            for acao, registro in alteracoes:
+                _aplicar_alteracao(novo_indice, acao, registro)
+            _indice = novo_indice
+            # O índice novo já reflete o banco: as alterações locais antigas não precisam ser reaplicadas
+            _alteracoes_nao_salvas.clear()
+    finally:
+        with _lock:
+            _alteracoes_pendentes.remove(alteracoes)
+    salvar_alteracoes(forcar=True)
+    print(f"   [Indice Palavras-chave] {len(novo_indice)} documentos, {len(novo_indice.termos)} termos "
+          f"em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    return len(novo_indice)
+
+
+def _reconstruir_em_segundo_plano() -> None:
+    global _reconstrucao_em_andamento
+    try:
+        reconstruir_indice()
+    except Exception as e:
+        print(f"   [Indice Palavras-chave] Falha ao reconstruir em segundo plano: {e}")
+    finally:
+        _reconstrucao_em_andamento = False
+
+
+def garantir_indice() -> bool:
+    """
+    Garante que o índice esteja carregado: lê do disco (ou constrói a partir do banco, na
+    primeira vez) e recarrega quando outro worker tiver salvo uma versão mais nova. Depois de
+    IA_INDICE_TTL_SEGUNDOS (contados da leitura do banco) agenda uma reconstrução em segundo
+    plano e continua respondendo com o índice atual.
+    Retorna False se o índice não puder ser obtido.
+    """
+    global _reconstrucao_em_andamento
+    try:
+        if _modificado_em is None:
+            with _lock_construcao:
+                if _modificado_em is None and not carregar_do_disco():
+                    reconstruir_indice()
+        elif _arquivo_mais_novo():
+            carregar_do_disco()
+    except Exception as e:
+        print(f"   [Indice Palavras-chave] Não foi possível carregar o índice: {e}")
+        return False
+
+    construido_em = _indice.construido_em
+    if (construido_em is not None and time.time() - construido_em > settings.IA_INDICE_TTL_SEGUNDOS
+            and not _reconstrucao_em_andamento):
+        _reconstrucao_em_andamento = True
+        threading.Thread(target=_reconstruir_em_segundo_plano, daemon=True).start()
+    return True
+
+
+def buscar(pergunta: str, limite: int = 10, disciplinas: frozenset[str] | None = None) -> list[tuple[dict, int]]:
+    with _lock:
+        return _indice.buscar(pergunta, limite, disciplinas)
+
+
+def estatisticas() -> dict:
+    with _lock:
+        return {
+            "documentos_indexados": len(_indice),
+            "termos_distintos": len(_indice.termos),
+            "construido_em": _indice.construido_em,
+            "salvo_em": _modificado_em,
+            "alteracoes_nao_salvas": len(_alteracoes_nao_salvas),
+        }
+
+
+@eventos_base.registrar_ouvinte
+def _ao_alterar_base(acao: str, registro: dict) -> None:
+    with _lock:
+        # Uma reconstrução em andamento pode ter lido o banco antes desta escrita
+        for alteracoes in _alteracoes_pendentes:
+            alteracoes.append((acao, registro))
+        # Enquanto o índice não foi carregado não há o que atualizar: a primeira busca já lê o banco
+        if _modificado_em is None:
+            return
+        _aplicar_alteracao(_indice, acao, registro)
+        _alteracoes_nao_salvas.append((acao, registro))
+        _agendar_gravacao()
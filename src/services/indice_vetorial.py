@@ -0,0 +1,475 @@
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Callable
+import numpy as np
+from ..config import settings
+from . import eventos_base, indice_bm25
+from .matriculas import no_escopo
+
+# --- ÍNDICE VETORIAL LOCAL DA BASE DE CONHECIMENTO ---
+# Busca semântica em memória (NumPy) sobre os registros publicados de 'baseconhecimento',
+# sem depender da função RPC 'buscar_conteudo' do banco. A função de embedding é
+# plugável; por padrão usa uma projeção TF-IDF por hashing que funciona offline.
+# O índice é salvo em disco para que os workers o carreguem na inicialização, e reconstruído
+# a partir do banco depois de IA_INDICE_TTL_SEGUNDOS (como o BM25) para captar as escritas
+# feitas por outros workers.
+
+# Uma função de embedding recebe uma lista de textos e devolve uma matriz (n_textos, dimensao)
+FuncaoEmbedding = Callable[[list[str]], np.ndarray]
+
+
+def _hash_estavel(texto: str) -> int:
+    # hash() do Python muda a cada processo; o índice persistido precisa de um hash estável
+    return int.from_bytes(hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _normalizar_linhas(matriz: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+class EmbeddingHashing:
+    """
+    Embedding TF-IDF por hashing: cada termo (e cada trigrama de caracteres, para tolerar
+    variações como plural e erros de digitação) cai em uma posição do vetor, com sinal
+    definido pelo hash. O IDF por posição é aprendido em 'ajustado' e salvo com o índice;
+    uma instância nunca muda de IDF, para que a pergunta e os vetores do índice construído
+    com ela usem sempre o mesmo.
+    """
+
+    def __init__(self, dimensao: int = 512, idf: np.ndarray | None = None):
+        self.dimensao = dimensao
+        self.idf = idf.astype(np.float32) if idf is not None else np.ones(dimensao, dtype=np.float32)
+
+    def _caracteristicas(self, texto: str) -> Counter:
+        termos = indice_bm25.tokenizar(texto)
+        caracteristicas = Counter(termos)
+        for termo in termos:
+            marcado = f"#{termo}#"
+            caracteristicas.update(marcado[i:i + 3] for i in range(len(marcado) - 2))
+        return caracteristicas
+
+    def _vetor_tf(self, texto: str) -> np.ndarray:
+        vetor = np.zeros(self.dimensao, dtype=np.float32)
+        for caracteristica, frequencia in self._caracteristicas(texto).items():
+            h = _hash_estavel(caracteristica)
+            sinal = 1.0 if (h >> 63) & 1 else -1.0
+            vetor[h % self.dimensao] += sinal * (1.0 + math.log(frequencia))
+        return vetor
+
+    def ajustado(self, textos: list[str]) -> "EmbeddingHashing":
+        """Novo embedding com o IDF de cada posição calculado a partir do corpus (este não é alterado)."""
+        if not textos:
+            return self
+        frequencia_docs = np.zeros(self.dimensao, dtype=np.float32)
+        for texto in textos:
+            frequencia_docs += self._vetor_tf(texto) != 0
+        return EmbeddingHashing(self.dimensao, np.log((1 + len(textos)) / (1 + frequencia_docs)) + 1.0)
+
+    def __call__(self, textos: list[str]) -> np.ndarray:
+        matriz = np.stack([self._vetor_tf(t) for t in textos]) if textos else np.zeros((0, self.dimensao), dtype=np.float32)
+        return _normalizar_linhas(matriz * self.idf)
+
+
+class IndiceVetorial:
+    """
+    Índice de vetores normalizados com busca exata (similaridade de cosseno) e modo
+    aproximado opcional por partições (IVF): os vetores são agrupados por k-means e a
+    busca só compara a pergunta com as 'n_sondas' partições mais próximas.
+    """
+
+    def __init__(self, dimensao: int):
+        self.dimensao = dimensao
+        self.ids: list[str] = []
+        self.registros: list[dict] = []
+        self.centroides: np.ndarray | None = None
+        self._posicoes: dict[str, int] = {}  # id -> linha da matriz
+        # Matriz e partições com folga no fim: inserir não copia o índice inteiro a cada escrita
+        self._vetores = np.zeros((0, dimensao), dtype=np.float32)
+        self._atribuicoes = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def matriz(self) -> np.ndarray:
+        return self._vetores[:len(self.ids)]
+
+    @property
+    def atribuicoes(self) -> np.ndarray:
+        return self._atribuicoes[:len(self.ids)]
+
+    @atribuicoes.setter
+    def atribuicoes(self, atribuicoes: np.ndarray) -> None:
+        self._atribuicoes = atribuicoes.astype(np.int32)
+
+    def definir(self, ids: list[str], registros: list[dict], matriz: np.ndarray,
+                atribuicoes: np.ndarray | None = None) -> None:
+        """Substitui todo o conteúdo do índice (uma linha de 'matriz' por id)."""
+        self.ids = list(ids)
+        self.registros = list(registros)
+        self._posicoes = {id_doc: posicao for posicao, id_doc in enumerate(self.ids)}
+        self._vetores = matriz.astype(np.float32)
+        self.atribuicoes = atribuicoes if atribuicoes is not None else np.zeros(len(self.ids), dtype=np.int32)
+
+    def _garantir_capacidade(self, quantidade: int) -> None:
+        # Capacidade dobra quando acaba: inserções custam O(1) amortizado
+        if len(self._vetores) < quantidade:
+            vetores = np.zeros((max(16, 2 * quantidade), self.dimensao), dtype=np.float32)
+            vetores[:len(self)] = self.matriz
+            self._vetores = vetores
+        if len(self._atribuicoes) < quantidade:
+            atribuicoes = np.zeros(max(16, 2 * quantidade), dtype=np.int32)
+            atribuicoes[:len(self)] = self.atribuicoes
+            self._atribuicoes = atribuicoes
+
+    def adicionar(self, id_doc: str, vetor: np.ndarray, registro: dict) -> None:
+        posicao = self._posicoes.get(id_doc)
+        if posicao is None:
+            posicao = len(self)
+            self._garantir_capacidade(posicao + 1)
+            self.ids.append(id_doc)
+            self.registros.append(registro)
+            self._posicoes[id_doc] = posicao
+        else:
+            self.registros[posicao] = registro
+        self._vetores[posicao] = vetor
+        self._atribuicoes[posicao] = int(np.argmax(self.centroides @ vetor)) if self.centroides is not None else 0
+
+    def remover(self, id_doc: str) -> None:
+        posicao = self._posicoes.pop(id_doc, None)
+        if posicao is None:
+            return
+        # A última linha ocupa o lugar da removida (a ordem das linhas não importa na busca)
+        ultima = len(self) - 1
+        if posicao != ultima:
+            self.ids[posicao] = self.ids[ultima]
+            self.registros[posicao] = self.registros[ultima]
+            self._vetores[posicao] = self._vetores[ultima]
+            self._atribuicoes[posicao] = self._atribuicoes[ultima]
+            self._posicoes[self.ids[posicao]] = posicao
+        self.ids.pop()
+        self.registros.pop()
+
+    def copia(self) -> "IndiceVetorial":
+        indice = IndiceVetorial(self.dimensao)
+        indice.definir(self.ids, self.registros, self.matriz.copy(), self.atribuicoes.copy())
+        indice.centroides = self.centroides
+        return indice
+
+    def treinar_ivf(self, n_listas: int, iteracoes: int = 10) -> None:
+        """Agrupa os vetores em n_listas partições (k-means esférico)."""
+        n_listas = min(n_listas, len(self))
+        if n_listas < 2:
+            self.centroides = None
+            self.atribuicoes = np.zeros(len(self), dtype=np.int32)
+            return
+
+        rng = np.random.default_rng(0)
+        centroides = self.matriz[rng.choice(len(self), n_listas, replace=False)].copy()
+        for _ in range(iteracoes):
+            atribuicoes = np.argmax(self.matriz @ centroides.T, axis=1)
+            for i in range(n_listas):
+                membros = self.matriz[atribuicoes == i]
+                # Partição vazia recebe um vetor aleatório para não ser desperdiçada
+                centroides[i] = membros.sum(axis=0) if len(membros) else self.matriz[rng.integers(len(self))]
+            centroides = _normalizar_linhas(centroides)
+
+        self.centroides = centroides.astype(np.float32)
+        self.atribuicoes = np.argmax(self.matriz @ self.centroides.T, axis=1).astype(np.int32)
+
+    def buscar(self, vetor: np.ndarray, limite: int = 10, n_sondas: int | None = None,
+               permitidos: np.ndarray | None = None) -> list[tuple[int, float]]:
+        """
+        Retorna (posição, similaridade) dos vetores mais próximos, em ordem decrescente.
+        'permitidos' (máscara booleana por posição) restringe os candidatos.
+        """
+        if not len(self):
+            return []
+
+        candidatos = np.arange(len(self))
+        if permitidos is not None:
+            candidatos = candidatos[permitidos]
+        if self.centroides is not None and n_sondas:
+            particoes = np.argsort(-(self.centroides @ vetor))[:n_sondas]
+            candidatos = candidatos[np.isin(self.atribuicoes[candidatos], particoes)]
+        if not len(candidatos):
+            return []
+
+        scores = self.matriz[candidatos] @ vetor
+        limite = min(limite, len(candidatos))
+        melhores = np.argpartition(-scores, limite - 1)[:limite]
+        melhores = melhores[np.argsort(-scores[melhores])]
+        return [(int(candidatos[i]), float(scores[i])) for i in melhores]
+
+    def salvar(self, caminho: str, embedding: EmbeddingHashing | None = None) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        # Arquivo temporário com nome único: dois workers salvando ao mesmo tempo não escrevem no mesmo arquivo
+        descritor, caminho_temporario = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(caminho)), suffix=".tmp")
+        try:
+            with os.fdopen(descritor, "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=object),
+                    registros=np.array([json.dumps(r, default=str) for r in self.registros], dtype=object),
+                    matriz=self.matriz,
+                    atribuicoes=self.atribuicoes,
+                    centroides=self.centroides if self.centroides is not None else np.zeros((0, self.dimensao), dtype=np.float32),
+                    idf=embedding.idf if isinstance(embedding, EmbeddingHashing) else np.zeros(0, dtype=np.float32),
+                    versao_tokenizacao=np.array(indice_bm25.VERSAO_TOKENIZACAO),
+                )
+            # Troca atômica: outro worker nunca lê um arquivo pela metade
+            os.replace(caminho_temporario, caminho)
+        except BaseException:
+            if os.path.exists(caminho_temporario):
+                os.remove(caminho_temporario)
+            raise
+
+    @classmethod
+    def carregar(cls, caminho: str) -> tuple["IndiceVetorial", np.ndarray, int]:
+        """Carrega um índice salvo. Retorna (índice, idf do embedding por hashing, versão da tokenização)."""
+        with np.load(caminho, allow_pickle=True) as dados:
+            versao = int(dados["versao_tokenizacao"]) if "versao_tokenizacao" in dados.files else 1
+            matriz = dados["matriz"].astype(np.float32)
+            indice = cls(matriz.shape[1])
+            indice.definir(
+                [str(i) for i in dados["ids"]], [json.loads(r) for r in dados["registros"]], matriz, dados["atribuicoes"]
+            )
+            indice.centroides = dados["centroides"] if len(dados["centroides"]) else None
+            return indice, dados["idf"], versao
+
+
+def texto_do_registro(registro: dict) -> str:
+    """Texto usado para gerar o embedding de um registro da base de conhecimento."""
+    partes = [
+        registro.get("nome_arquivo_origem") or "",
+        registro.get("categoria") or "",
+        indice_bm25.palavras_chave_como_texto(registro.get("palavra_chave")),
+        registro.get("conteudo_processado") or "",
+    ]
+    return "\n".join(p for p in partes if p)
+
+
+# Índice global (compartilhado por todas as requisições do worker)
+_embedding_padrao = EmbeddingHashing(settings.IA_INDICE_VETORIAL_DIMENSAO)
+_funcao_embedding: FuncaoEmbedding = _embedding_padrao
+_indice = IndiceVetorial(settings.IA_INDICE_VETORIAL_DIMENSAO)
+_lock = threading.RLock()
+_lock_construcao = threading.Lock()  # Só uma primeira construção; a leitura do banco não bloqueia o _lock
+_construido_em: float | None = None
+_reconstrucao_em_andamento = False
+# Alterações recebidas enquanto uma reconstrução lê o banco (uma lista por reconstrução em andamento)
+_alteracoes_pendentes: list[list[tuple[str, dict]]] = []
+# Gravação em disco: as escritas na base só marcam o índice como alterado e a cópia em memória
+# é salva no máximo a cada IA_INDICE_VETORIAL_SALVAR_SEGUNDOS (e na reconstrução e no encerramento)
+_lock_disco = threading.Lock()  # Uma gravação do arquivo por vez
+_versao = 0  # Incrementada a cada alteração do índice em memória
+_versao_salva = 0
+_gravacao_agendada = False
+
+
+def definir_funcao_embedding(funcao: FuncaoEmbedding) -> None:
+    """
+    Troca a função de embedding (ex.: um modelo de embeddings externo).
+    O índice atual é descartado e será reconstruído com a nova função na próxima busca.
+    """
+    global _funcao_embedding, _indice, _construido_em
+    with _lock:
+        _funcao_embedding = funcao
+        _indice = IndiceVetorial(funcao([""]).shape[1])
+        _construido_em = None
+
+
+def salvar_alteracoes() -> None:
+    """
+    Salva em disco o índice em memória, se ele mudou desde a última gravação. A cópia é feita
+    sob o lock e escrita fora dele, para que as buscas não esperem pelo disco.
+    """
+    global _versao_salva, _gravacao_agendada
+    with _lock:
+        _gravacao_agendada = False
+        versao = _versao
+        if versao <= _versao_salva:
+            return
+        copia, funcao = _indice.copia(), _funcao_embedding
+    with _lock_disco:
+        # Outra gravação pode ter salvo uma versão mais nova enquanto esta esperava
+        if versao <= _versao_salva:
+            return
+        try:
+            copia.salvar(settings.IA_INDICE_VETORIAL_PATH, funcao)
+            _versao_salva = versao
+        except Exception as e:
+            print(f"   [Indice Vetorial] Não foi possível salvar o índice em disco: {e}")
+
+
+def _agendar_gravacao() -> None:
+    # Chamado com o _lock: marca o índice como alterado e agenda uma gravação, se não houver uma
+    global _versao, _gravacao_agendada
+    _versao += 1
+    if not _gravacao_agendada:
+        _gravacao_agendada = True
+        temporizador = threading.Timer(settings.IA_INDICE_VETORIAL_SALVAR_SEGUNDOS, salvar_alteracoes)
+        temporizador.daemon = True
+        temporizador.start()
+
+
+def _aplicar_alteracao(indice: IndiceVetorial, funcao: FuncaoEmbedding, acao: str, registro: dict) -> None:
+    id_reg = str(registro["id_conhecimento"])
+    if acao == eventos_base.ACAO_UPSERT and registro.get("status") == "publicado":
+        indice.adicionar(id_reg, funcao([texto_do_registro(registro)])[0], registro)
+    else:
+        indice.remover(id_reg)
+
+
+def reconstruir_indice() -> int:
+    """
+    Reconstrói o índice vetorial a partir do banco, salva em disco e substitui o índice atual.
+    As alterações notificadas durante a leitura do banco são aplicadas de novo no índice novo.
+    Retorna a quantidade de documentos indexados.
+    """
+    global _indice, _funcao_embedding, _construido_em, _versao
+    inicio = time.perf_counter()
+    alteracoes: list[tuple[str, dict]] = []
+    # O embedding (com o novo IDF) e o índice são trocados juntos; até lá as buscas usam o par antigo
+    with _lock:
+        funcao = _funcao_embedding
+        _alteracoes_pendentes.append(alteracoes)
+    try:
+        registros = [r for r in indice_bm25.carregar_registros_publicados() if r.get("id_conhecimento")]
+        textos = [texto_do_registro(r) for r in registros]
+        if isinstance(funcao, EmbeddingHashing):
+            funcao = funcao.ajustado(textos)
+        vetores = funcao(textos)
+
+        novo_indice = IndiceVetorial(vetores.shape[1])
+        novo_indice.definir([str(r["id_conhecimento"]) for r in registros], registros, vetores)
+        if settings.IA_INDICE_VETORIAL_IVF_LISTAS:
+            novo_indice.treinar_ivf(settings.IA_INDICE_VETORIAL_IVF_LISTAS)
+
+        with _lock:
+            # A leitura pode ter acontecido antes dessas escritas (reaplicar é idempotente)
+            for acao, registro in alteracoes:
+                _aplicar_alteracao(novo_indice, funcao, acao, registro)
+            _funcao_embedding = funcao
+            _indice = novo_indice
+            _construido_em = time.time()
+            _versao += 1
+    finally:
+        with _lock:
+            _alteracoes_pendentes.remove(alteracoes)
+    salvar_alteracoes()
+
+    print(f"   [Indice Vetorial] {len(novo_indice)} documentos indexados em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    return len(novo_indice)
+
+
+def carregar_do_disco() -> bool:
+    """Carrega o índice salvo em IA_INDICE_VETORIAL_PATH. Retorna False se não houver índice válido."""
+    global _indice, _funcao_embedding, _construido_em
+    caminho = settings.IA_INDICE_VETORIAL_PATH
+    if not os.path.exists(caminho):
+        return False
+    try:
+        indice, idf, versao = IndiceVetorial.carregar(caminho)
+        with _lock:
+            if isinstance(_funcao_embedding, EmbeddingHashing):
+                if versao != indice_bm25.VERSAO_TOKENIZACAO:
+                    print("   [Indice Vetorial] Índice em disco usa outra tokenização. Será reconstruído.")
+                    return False
+                if len(idf) != _funcao_embedding.dimensao:
+                    print("   [Indice Vetorial] Índice em disco tem outra dimensão. Será reconstruído.")
+                    return False
+                _funcao_embedding = EmbeddingHashing(_funcao_embedding.dimensao, idf)
+            _indice = indice
+            _construido_em = os.path.getmtime(caminho)
+        print(f"   [Indice Vetorial] {len(indice)} documentos carregados de '{caminho}'")
+        return True
+    except Exception as e:
+        print(f"   [Indice Vetorial] Falha ao carregar índice do disco: {e}")
+        return False
+
+
+def _reconstruir_em_segundo_plano() -> None:
+    global _reconstrucao_em_andamento
+    try:
+        reconstruir_indice()
+    except Exception as e:
+        print(f"   [Indice Vetorial] Falha ao reconstruir em segundo plano: {e}")
+    finally:
+        _reconstrucao_em_andamento = False
+
+
+def garantir_indice() -> bool:
+    """
+    Garante que o índice esteja carregado (do disco ou, se necessário, do banco). Depois de
+    IA_INDICE_TTL_SEGUNDOS (contados da construção, também para o índice lido do disco)
+    agenda uma reconstrução em segundo plano e continua respondendo com o índice atual.
+    Retorna False se o índice não puder ser construído.
+    """
+    global _reconstrucao_em_andamento
+    if _construido_em is None:
+        try:
+            with _lock_construcao:
+                if _construido_em is None and not carregar_do_disco():
+                    reconstruir_indice()
+        except Exception as e:
+            print(f"   [Indice Vetorial] Não foi possível construir o índice: {e}")
+            return False
+
+    construido_em = _construido_em
+    if (construido_em is not None and time.time() - construido_em > settings.IA_INDICE_TTL_SEGUNDOS
+            and not _reconstrucao_em_andamento):
+        _reconstrucao_em_andamento = True
+        threading.Thread(target=_reconstruir_em_segundo_plano, daemon=True).start()
+    return True
+
+
+def buscar(pergunta: str, limite: int = 10, disciplinas: frozenset[str] | None = None) -> list[tuple[dict, float]]:
+    """
+    Retorna os registros mais similares à pergunta, como (registro, similaridade).
+    Com 'disciplinas', só os registros gerais e os dessas disciplinas.
+    """
+    # A pergunta usa o embedding do mesmo par (embedding, índice) em que vai ser buscada
+    with _lock:
+        funcao, indice = _funcao_embedding, _indice
+    vetor = funcao([pergunta])[0]
+    n_sondas = settings.IA_INDICE_VETORIAL_IVF_SONDAS if settings.IA_INDICE_VETORIAL_IVF_LISTAS else None
+    with _lock:
+        permitidos = None
+        if disciplinas is not None:
+            permitidos = np.fromiter((no_escopo(r, disciplinas) for r in indice.registros), dtype=bool, count=len(indice))
+        resultados = indice.buscar(vetor, limite, n_sondas=n_sondas, permitidos=permitidos)
+        return [
+            (indice.registros[posicao], score)
+            for posicao, score in resultados
+            if score >= settings.IA_INDICE_VETORIAL_SCORE_MINIMO
+        ]
+
+
+def estatisticas() -> dict:
+    with _lock:
+        return {
+            "documentos_indexados": len(_indice),
+            "dimensao": _indice.dimensao,
+            "particoes_ivf": 0 if _indice.centroides is None else len(_indice.centroides),
+            "construido_em": _construido_em,
+        }
+
+
+@eventos_base.registrar_ouvinte
+def _ao_alterar_base(acao: str, registro: dict) -> None:
+    with _lock:
+        for alteracoes in _alteracoes_pendentes:
+            alteracoes.append((acao, registro))
+        if _construido_em is None:
+            return
+        _aplicar_alteracao(_indice, _funcao_embedding, acao, registro)
+        _agendar_gravacao()
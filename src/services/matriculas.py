@@ -0,0 +1,62 @@
+import threading
+import time
+from ..config import settings
+from ..supabase_client import supabase
+
+# --- DISCIPLINAS DO ALUNO (ESCOPO DA BUSCA DO /ia/gerar-resposta) ---
+# A pergunta de um aluno só precisa dos registros das disciplinas em que ele está matriculado
+# (tabela 'alunodisciplina') e dos registros gerais, sem disciplina. As matrículas de cada
+# aluno são lidas uma vez e ficam em memória por IA_ESCOPO_MATRICULAS_TTL_SEGUNDOS; as
+# rotas que alteram 'alunodisciplina' chamam invalidar().
+
+ESCOPO_GERAL: frozenset[str] = frozenset()  # Escopo só com os registros gerais (ex.: respostas frequentes)
+
+_matriculas: dict[str, tuple[frozenset[str], float]] = {}  # id_aluno -> (id_disciplina, lido_em)
+_lock = threading.Lock()
+acertos = 0
+falhas = 0
+
+
+def disciplinas_do_aluno(id_aluno: str) -> frozenset[str]:
+    """Ids das disciplinas em que o aluno está matriculado (vazio se não houver nenhuma)."""
+    global acertos, falhas
+    agora = time.monotonic()
+    with _lock:
+        entrada = _matriculas.get(id_aluno)
+        if entrada is not None and agora - entrada[1] < settings.IA_ESCOPO_MATRICULAS_TTL_SEGUNDOS:
+            acertos += 1
+            return entrada[0]
+        falhas += 1
+    response = supabase.table("alunodisciplina").select("id_disciplina").eq("id_aluno", id_aluno).execute()
+    disciplinas = frozenset(str(r["id_disciplina"]) for r in response.data or [] if r.get("id_disciplina"))
+    with _lock:
+        _matriculas[id_aluno] = (disciplinas, agora)
+    return disciplinas
+
+
+def invalidar(id_aluno: str | None = None) -> None:
+    """Esquece as matrículas de um aluno (ou de todos, quando a mudança afeta um curso ou disciplina)."""
+    with _lock:
+        if id_aluno is None:
+            _matriculas.clear()
+        else:
+            _matriculas.pop(str(id_aluno), None)
+
+
+def no_escopo(registro: dict, disciplinas: frozenset[str] | None) -> bool:
+    """Sem escopo tudo é visível; com escopo, só os registros gerais e os das disciplinas dadas."""
+    if disciplinas is None:
+        return True
+    id_disciplina = registro.get("id_disciplina")
+    return not id_disciplina or str(id_disciplina) in disciplinas
+
+
+def estatisticas() -> dict:
+    with _lock:
+        total = acertos + falhas
+        return {
+            "alunos": len(_matriculas),
+            "acertos": acertos,
+            "falhas": falhas,
+            "taxa_acerto": round(acertos / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+# --- MÉTRICAS DE LATÊNCIA POR ETAPA DO /ia/gerar-resposta ---
+# Cada etapa do pipeline (buscas no banco, índices locais, fallback por documentos, montagem
+# do prompt, geração) é medida com 'medir(etapa)'. As durações vão para um histograma por
+# etapa (lido em GET /ia/metricas) e também para as medições da requisição atual, que podem
+# ser devolvidas no cabeçalho Server-Timing para depuração. Etapas da busca que não chegaram a
+# rodar (parada antecipada ou orçamento de latência esgotado) são contadas em 'puladas'.
+
+LIMITES_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+TAMANHO_AMOSTRA = 1000  # Últimas medições guardadas por etapa para calcular os percentis
+
+
+@dataclass
+class Medicao:
+    """Dados opcionais preenchidos dentro do bloco 'with medir(...)'."""
+    linhas: int | None = None
+    contextos: int | None = None
+
+
+class Histograma:
+    def __init__(self):
+        self.contagem = 0
+        self.erros = 0
+        self.soma_ms = 0.0
+        self.buckets = [0] * (len(LIMITES_MS) + 1)
+        self.amostras: deque[float] = deque(maxlen=TAMANHO_AMOSTRA)
+        self.linhas = 0
+        self.contextos = 0
+        self.puladas: dict[str, int] = {}  # motivo -> vezes em que a etapa não foi executada
+
+    def observar(self, duracao_ms: float, medicao: Medicao, erro: bool) -> None:
+        self.contagem += 1
+        self.erros += int(erro)
+        self.soma_ms += duracao_ms
+        self.amostras.append(duracao_ms)
+        posicao = next((i for i, limite in enumerate(LIMITES_MS) if duracao_ms <= limite), len(LIMITES_MS))
+        self.buckets[posicao] += 1
+        self.linhas += medicao.linhas or 0
+        self.contextos += medicao.contextos or 0
+
+    def percentil(self, p: float) -> float:
+        ordenadas = sorted(self.amostras)
+        if not ordenadas:
+            return 0.0
+        return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+    def resumo(self) -> dict:
+        def _percentil(p: float) -> float:
+            return round(self.percentil(p), 1)
+
+        rotulos = [f"<={limite}ms" for limite in LIMITES_MS] + [f">{LIMITES_MS[-1]}ms"]
+        return {
+            "contagem": self.contagem,
+            "erros": self.erros,
+            "media_ms": round(self.soma_ms / self.contagem, 1) if self.contagem else 0.0,
+            "p50_ms": _percentil(0.50),
+            "p95_ms": _percentil(0.95),
+            "p99_ms": _percentil(0.99),
+            "linhas_por_chamada": round(self.linhas / self.contagem, 2) if self.contagem else 0.0,
+            "contextos_por_chamada": round(self.contextos / self.contagem, 2) if self.contagem else 0.0,
+            "puladas": dict(self.puladas),
+            "buckets": dict(zip(rotulos, self.buckets)),
+        }
+
+
+# Medições (etapa -> ms) da requisição atual, para o cabeçalho Server-Timing
+_medicoes_requisicao: ContextVar[dict | None] = ContextVar("medicoes_requisicao", default=None)
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._histogramas: dict[str, Histograma] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, etapa: str, duracao_ms: float, medicao: Medicao | None = None, erro: bool = False) -> None:
+        with self._lock:
+            self._histogramas.setdefault(etapa, Histograma()).observar(duracao_ms, medicao or Medicao(), erro)
+        medicoes = _medicoes_requisicao.get()
+        if medicoes is not None:
+            medicoes[etapa] = medicoes.get(etapa, 0.0) + duracao_ms
+
+    def pular(self, etapa: str, motivo: str) -> None:
+        """Registra que a etapa não foi executada nesta requisição (e por quê)."""
+        with self._lock:
+            puladas = self._histogramas.setdefault(etapa, Histograma()).puladas
+            puladas[motivo] = puladas.get(motivo, 0) + 1
+
+    @contextmanager
+    def medir(self, etapa: str):
+        """Mede a duração do bloco; linhas/contextos podem ser preenchidos no objeto retornado."""
+        medicao = Medicao()
+        inicio = time.perf_counter()
+        erro = False
+        try:
+            yield medicao
+        except BaseException:
+            erro = True
+            raise
+        finally:
+            self.observar(etapa, (time.perf_counter() - inicio) * 1000, medicao, erro)
+
+    def percentil(self, etapa: str, p: float, amostras_minimas: int = 1) -> float | None:
+        """Percentil p (0 a 1) da duração da etapa em ms; None com menos de 'amostras_minimas' medições."""
+        with self._lock:
+            histograma = self._histogramas.get(etapa)
+            if histograma is None or len(histograma.amostras) < max(amostras_minimas, 1):
+                return None
+            return histograma.percentil(p)
+
+    def resumo(self) -> dict:
+        with self._lock:
+            return {etapa: histograma.resumo() for etapa, histograma in sorted(self._histogramas.items())}
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._histogramas.clear()
+
+
+metricas = RegistroMetricas()
+
+
+def iniciar_requisicao() -> dict:
+    """Passa a acumular as medições da requisição atual (e das tarefas criadas por ela)."""
+    medicoes: dict[str, float] = {}
+    _medicoes_requisicao.set(medicoes)
+    return medicoes
+
+
+def cabecalho_server_timing(medicoes: dict) -> str:
+    return ", ".join(f"{etapa};dur={duracao:.1f}" for etapa, duracao in medicoes.items())
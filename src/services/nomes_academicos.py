@@ -0,0 +1,115 @@
+import re
+from typing import Optional
+
+# --- NOMES DE TIPOS DE TRABALHO E DE DISCIPLINAS ---
+# Variações aceitas nos tipos de trabalho ("tcc 1" -> "TC 1") e nos números das disciplinas
+# ("Cálculo 1" <-> "Cálculo I"). Usadas pelas rotas de trabalhos acadêmicos e pelo roteador
+# de intenções do /ia/gerar-resposta.
+
+
+def normalizar_tipo_trabalho(tipo: str) -> Optional[str]:
+    """
+    Normaliza diferentes variações de tipo de trabalho para o formato esperado no banco.
+    Retorna None se o tipo não for reconhecido.
+    """
+    if not tipo:
+        return None
+    
+    tipo_lower = tipo.lower().strip()
+    
+    # Mapeamento de variações para valores do banco
+    mapeamento = {
+        # TC 1
+        "tc1": "TC 1",
+        "tc 1": "TC 1",
+        "trabalho de conclusão 1": "TC 1",
+        "trabalho de conclusao 1": "TC 1",
+        "tcc 1": "TC 1",
+        "tcc1": "TC 1",
+        # TC 2
+        "tc2": "TC 2",
+        "tc 2": "TC 2",
+        "trabalho de conclusão 2": "TC 2",
+        "trabalho de conclusao 2": "TC 2",
+        "tcc 2": "TC 2",
+        "tcc2": "TC 2",
+        # APS
+        "aps": "APS",
+        "atividade prática": "APS",
+        "atividade pratica": "APS",
+        "atividade prática supervisionada": "APS",
+        "atividade pratica supervisionada": "APS",
+        # Estágio
+        "estagio": "estagio",
+        "estágio": "estagio",
+        # Horas complementares
+        "horas_complementares": "horas_complementares",
+        "horas complementares": "horas_complementares",
+        "hora complementar": "horas_complementares",
+        "horas_complementar": "horas_complementares",
+        "horas de complementação": "horas_complementares",
+        "horas de complementacao": "horas_complementares",
+        "hora de complementação": "horas_complementares",
+        "hora de complementacao": "horas_complementares",
+        "complementares": "horas_complementares",
+    }
+    
+    return mapeamento.get(tipo_lower)
+
+
+def converter_numero_para_romano(nome: str) -> str:
+    """
+    Converte números para algarismos romanos no nome da disciplina.
+    Exemplos:
+    - "Trabalho de Curso 1" → "Trabalho de Curso I"
+    - "Trabalho de Curso 2" → "Trabalho de Curso II"
+    """
+    if not nome:
+        return nome
+    
+    # Mapeamento de números para romanos (ordem decrescente para evitar conflitos)
+    numero_para_romano = {
+        "1": "I",
+        "2": "II",
+        "3": "III",
+        "4": "IV",
+        "5": "V",
+    }
+    
+    resultado = nome
+    # Tentar substituir números no final da string ou seguidos de espaço/fim
+    for num, romano in numero_para_romano.items():
+        # Padrão mais flexível: número seguido de espaço ou no final
+        # Ex: "Curso 2" ou "Curso 2 " ou "Curso 2."
+        padrao = r'(\s|^)' + re.escape(num) + r'(\s|$|[^\d])'
+        resultado = re.sub(padrao, r'\1' + romano + r'\2', resultado)
+    
+    return resultado.strip()
+
+
+def converter_romano_para_numero(nome: str) -> str:
+    """
+    Converte algarismos romanos para números no nome da disciplina.
+    Exemplos:
+    - "Trabalho de Curso I" → "Trabalho de Curso 1"
+    - "Trabalho de Curso II" → "Trabalho de Curso 2"
+    """
+    if not nome:
+        return nome
+    
+    # Mapeamento de romanos para números (ordem decrescente para evitar conflitos)
+    romano_para_numero = {
+        "III": "3",
+        "II": "2",
+        "IV": "4",
+        "I": "1",
+        "V": "5",
+    }
+    
+    resultado = nome
+    for romano, num in romano_para_numero.items():
+        # Padrão: romano no final ou seguido de espaço/pontuação
+        padrao = r'\b' + re.escape(romano) + r'(?=\s|$|[^\w])'
+        resultado = re.sub(padrao, num, resultado, flags=re.IGNORECASE)
+    
+    return resultado.strip()
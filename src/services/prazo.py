@@ -0,0 +1,49 @@
+import time
+from contextvars import ContextVar
+
+# --- PRAZO (DEADLINE) DA REQUISIÇÃO ---
+# O /ia/gerar-resposta define um prazo no início da requisição; a busca, o fallback por
+# documentos e o gateway do Gemini consultam o tempo restante e deixam de iniciar (ou deixam
+# de esperar por) trabalho que não terminaria a tempo. O prazo fica num ContextVar, então vale
+# também para as tarefas criadas pela requisição. Sem prazo definido, nada muda.
+
+
+class PrazoEsgotado(Exception):
+    """O prazo da requisição terminou antes de a etapa concluir."""
+
+
+# Instante limite (time.monotonic) e duração total do prazo da requisição atual
+_prazo: ContextVar[tuple[float, float] | None] = ContextVar("prazo_requisicao", default=None)
+
+
+def definir(segundos: float) -> None:
+    """Passa a valer um prazo de 'segundos' a partir de agora para a requisição atual."""
+    _prazo.set((time.monotonic() + segundos, segundos))
+
+
+def remover() -> None:
+    """Trabalho de segundo plano iniciado por uma requisição não herda o prazo dela."""
+    _prazo.set(None)
+
+
+def restante(reserva: float = 0.0) -> float | None:
+    """
+    Segundos até o prazo, descontada a 'reserva' (tempo guardado para as etapas seguintes). None sem prazo.
+    A reserva nunca passa da metade do prazo, para que um prazo curto ainda deixe tempo para a busca.
+    """
+    prazo = _prazo.get()
+    if prazo is None:
+        return None
+    limite, duracao = prazo
+    return limite - min(reserva, duracao / 2) - time.monotonic()
+
+
+def esgotado(reserva: float = 0.0) -> bool:
+    tempo = restante(reserva)
+    return tempo is not None and tempo <= 0
+
+
+def limitar(segundos: float, reserva: float = 0.0) -> float:
+    """O menor entre 'segundos' e o tempo restante (nunca negativo)."""
+    tempo = restante(reserva)
+    return segundos if tempo is None else max(0.0, min(segundos, tempo))
@@ -0,0 +1,210 @@
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from ..config import settings
+from ..supabase_client import supabase
+from . import eventos_base
+from .cache_respostas import normalizar_pergunta
+
+# --- RESPOSTAS PRÉ-GERADAS PARA AS DÚVIDAS FREQUENTES ---
+# As dúvidas mais frequentes dos alunos (os mesmos grupos do dashboard de /mensagens_aluno)
+# são respondidas em segundo plano pelo pipeline do /ia/gerar-resposta e salvas na tabela
+# 'respostafrequente', com os contextos usados. Uma pergunta parecida com um desses grupos
+# é respondida direto da memória, sem busca na base e sem chamada ao Gemini.
+# Como a mesma resposta vale para qualquer aluno, ela só é gerada com os registros gerais da
+# base (sem disciplina); dúvidas sem contexto nesses registros não recebem resposta pré-gerada.
+# Uma escrita na base de conhecimento torna as respostas antigas inválidas até a próxima geração.
+# O momento da última escrita fica no banco, na linha da reserva, para que todos os workers
+# (e não só o que recebeu a escrita) deixem de usar as respostas antigas e gerem as novas.
+
+TABELA = "respostafrequente"
+TAREFA_GERACAO = "respostas_frequentes"  # Nome da reserva em 'reservatarefa' (sql/respostafrequente.sql)
+_DONO = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"  # Este worker, como dono da reserva
+ATRASO_REGISTRO_ALTERACAO = 2  # Segundos para juntar as escritas seguidas na base numa só gravação no banco
+
+_entradas: dict[str, dict] = {}  # pergunta normalizada -> registro da tabela (com 'palavras' e 'gerado_em_ts')
+_lock = threading.Lock()
+_base_alterada_em = 0.0  # Respostas geradas antes disso não são usadas (a maior entre a local e a do banco)
+_registro_agendado = False
+acertos = 0
+falhas = 0
+
+
+def _timestamp(valor) -> float:
+    """Converte o 'gerado_em' devolvido pelo banco (ISO 8601) em segundos; 0 se não der."""
+    if not valor:
+        return 0.0
+    texto = str(valor).replace("Z", "+00:00")
+    # O Postgres omite zeros à direita dos microssegundos, o que o fromisoformat do Python 3.10 não aceita
+    texto = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), texto)
+    try:
+        data = datetime.fromisoformat(texto)
+    except ValueError:
+        return 0.0
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data.timestamp()
+
+
+def _palavras(pergunta: str) -> set[str]:
+    return set(normalizar_pergunta(pergunta).split())
+
+
+def _preparar_entrada(registro: dict) -> dict:
+    return {
+        **registro,
+        "palavras": _palavras(registro["pergunta"]),
+        "gerado_em_ts": _timestamp(registro.get("gerado_em")),
+    }
+
+
+def carregar() -> int:
+    """
+    Lê as respostas pré-geradas do banco (também as geradas por outros workers) e o momento da
+    última escrita na base registrado por qualquer worker.
+    """
+    global _entradas, _base_alterada_em
+    response = supabase.table(TABELA).select("*").execute()
+    entradas = {r["pergunta_normalizada"]: _preparar_entrada(r) for r in response.data or []}
+    reserva = supabase.table("reservatarefa").select("base_alterada_em").eq("tarefa", TAREFA_GERACAO).execute()
+    alterada_em = max((_timestamp(r.get("base_alterada_em")) for r in reserva.data or []), default=0.0)
+    with _lock:
+        _entradas = entradas
+        _base_alterada_em = max(_base_alterada_em, alterada_em)
+    return len(entradas)
+
+
+def esta_atualizada(entrada: dict | None, idade_maxima_segundos: float | None = None) -> bool:
+    if entrada is None or entrada["gerado_em_ts"] < _base_alterada_em:
+        return False
+    return idade_maxima_segundos is None or time.time() - entrada["gerado_em_ts"] < idade_maxima_segundos
+
+
+def obter(pergunta: str) -> dict | None:
+    with _lock:
+        return _entradas.get(normalizar_pergunta(pergunta))
+
+
+def buscar(pergunta: str) -> dict | None:
+    """
+    Resposta pré-gerada para a pergunta: a do grupo com a mesma pergunta normalizada ou, se não
+    houver, a do grupo mais parecido (Jaccard das palavras) acima de IA_FAQ_SIMILARIDADE_MINIMA.
+    """
+    global acertos, falhas
+    palavras = _palavras(pergunta)
+    melhor, melhor_similaridade = None, 0.0
+    with _lock:
+        exata = _entradas.get(normalizar_pergunta(pergunta))
+        if esta_atualizada(exata):
+            melhor, melhor_similaridade = exata, 1.0
+        elif palavras:
+            for entrada in _entradas.values():
+                if not esta_atualizada(entrada) or not entrada["palavras"]:
+                    continue
+                similaridade = len(palavras & entrada["palavras"]) / len(palavras | entrada["palavras"])
+                if similaridade > melhor_similaridade:
+                    melhor, melhor_similaridade = entrada, similaridade
+        if melhor is not None and melhor_similaridade >= settings.IA_FAQ_SIMILARIDADE_MINIMA:
+            acertos += 1
+            return melhor
+        falhas += 1
+        return None
+
+
+def salvar(grupo: dict, resposta: str, contextos: list[str], documentos: list[dict]) -> None:
+    registro = {
+        "pergunta": grupo["pergunta"],
+        "pergunta_normalizada": normalizar_pergunta(grupo["pergunta"]),
+        "topico": grupo.get("topico"),
+        "ocorrencias": grupo.get("count", 0),
+        "resposta": resposta,
+        "contextos": contextos,
+        "documentos": documentos,
+        "gerado_em": datetime.now(timezone.utc).isoformat(),
+    }
+    response = supabase.table(TABELA).upsert(registro, on_conflict="pergunta_normalizada").execute()
+    salvo = (response.data or [registro])[0]
+    with _lock:
+        _entradas[salvo["pergunta_normalizada"]] = _preparar_entrada(salvo)
+
+
+def remover_exceto(perguntas_normalizadas: set[str]) -> int:
+    """Remove as respostas dos grupos que não estão em 'perguntas_normalizadas' (os que continuam respondidos)."""
+    with _lock:
+        antigas = [p for p in _entradas if p not in perguntas_normalizadas]
+    for pergunta_normalizada in antigas:
+        supabase.table(TABELA).delete().eq("pergunta_normalizada", pergunta_normalizada).execute()
+        with _lock:
+            _entradas.pop(pergunta_normalizada, None)
+    return len(antigas)
+
+
+def adquirir_reserva(segundos: int) -> bool:
+    """
+    Reserva a geração das respostas para este worker por 'segundos' (lease no banco). Com vários
+    workers, só um gera as respostas de cada vez; retorna False se outro worker já a detém.
+    """
+    response = supabase.rpc(
+        "adquirir_reserva", {"p_tarefa": TAREFA_GERACAO, "p_dono": _DONO, "p_segundos": segundos}
+    ).execute()
+    return response.data is True
+
+
+def liberar_reserva() -> None:
+    supabase.rpc("liberar_reserva", {"p_tarefa": TAREFA_GERACAO, "p_dono": _DONO}).execute()
+
+
+def ha_desatualizadas() -> bool:
+    with _lock:
+        return any(not esta_atualizada(entrada) for entrada in _entradas.values())
+
+
+def base_estavel() -> bool:
+    """True se a base não é alterada há IA_FAQ_ESPERA_ALTERACOES_SEGUNDOS (uma carga de documentos já terminou)."""
+    return time.time() - _base_alterada_em >= settings.IA_FAQ_ESPERA_ALTERACOES_SEGUNDOS
+
+
+def _registrar_alteracao_no_banco() -> None:
+    global _registro_agendado
+    with _lock:
+        _registro_agendado = False
+        alterada_em = _base_alterada_em
+    try:
+        supabase.rpc(
+            "registrar_alteracao_base",
+            {"p_tarefa": TAREFA_GERACAO, "p_alterada_em": datetime.fromtimestamp(alterada_em, timezone.utc).isoformat()},
+        ).execute()
+    except Exception as e:
+        # Os outros workers só percebem a alteração na próxima escrita registrada
+        print(f"   [FAQ] Não foi possível registrar a alteração da base: {e}")
+
+
+def estatisticas() -> dict:
+    with _lock:
+        total = acertos + falhas
+        return {
+            "respostas": len(_entradas),
+            "atualizadas": sum(1 for entrada in _entradas.values() if esta_atualizada(entrada)),
+            "acertos": acertos,
+            "falhas": falhas,
+            "taxa_acerto": round(acertos / total, 4) if total else 0.0,
+        }
+
+
+@eventos_base.registrar_ouvinte
+def _ao_alterar_base(acao: str, registro: dict) -> None:
+    # As respostas podem ter sido geradas com o conteúdo antigo do registro. Escritas seguidas
+    # (a carga de um documento, por exemplo) viram uma única gravação no banco
+    global _base_alterada_em, _registro_agendado
+    with _lock:
+        _base_alterada_em = time.time()
+        if _registro_agendado:
+            return
+        _registro_agendado = True
+    temporizador = threading.Timer(ATRASO_REGISTRO_ALTERACAO, _registrar_alteracao_no_banco)
+    temporizador.daemon = True
+    temporizador.start()
@@ -0,0 +1,401 @@
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+from ..config import settings
+from ..supabase_client import supabase
+from .nomes_academicos import normalizar_tipo_trabalho, converter_numero_para_romano, converter_romano_para_numero
+from .texto import normalizar, radical, texto_de_busca
+
+# --- ROTEADOR DE INTENÇÕES DO /ia/gerar-resposta ---
+# Boa parte das perguntas dos alunos é uma consulta às tabelas que a própria API já serve:
+# horário e sala das aulas ('cronograma'), quem ministra a disciplina ('professordisciplina'),
+# datas das provas ('avaliacao') e prazos dos trabalhos ('trabalho_academico'). Essas perguntas
+# são reconhecidas por regras (palavras-chave + disciplina ou tipo de trabalho citados) e
+# respondidas por modelos de texto a partir de uma cópia em memória das tabelas, sem busca na
+# base nem chamada ao Gemini. A cópia vale por IA_INTENCOES_TTL_SEGUNDOS e as rotas que
+# escrevem nessas tabelas chamam invalidar(). Só entram as provas e os trabalhos do semestre
+# atual e, para alunos, os trabalhos das suas disciplinas e do seu curso. Na dúvida (nenhuma
+# disciplina reconhecida, nenhum dado cadastrado, resultados demais ou trabalhos de cursos
+# diferentes), a pergunta segue para o RAG normalmente.
+
+PAUSA_APOS_FALHA_SEGUNDOS = 30  # Tempo sem tentar recarregar as tabelas depois de um erro
+
+# dia_semana do cronograma (1 a 7), contado a partir de segunda-feira
+DIAS_SEMANA = {
+    1: "segunda-feira", 2: "terça-feira", 3: "quarta-feira", 4: "quinta-feira",
+    5: "sexta-feira", 6: "sábado", 7: "domingo",
+}
+
+# Palavras (já normalizadas e no singular, ver texto.radical) que indicam cada intenção
+PALAVRAS_PROFESSOR = {"professor", "professora", "docente", "ministra", "ministrada", "leciona", "lecionada"}
+PALAVRAS_QUEM = {"quem", "ministra", "ministrada", "leciona", "lecionada", "responsavel"}
+PALAVRAS_AVALIACAO = {"prova", "avaliacao", "np1", "np2", "sub", "substitutiva", "exame"}
+PALAVRAS_AULA = {"aula", "horario", "cronograma"}
+PALAVRAS_QUANDO_ONDE = {"quando", "dia", "data", "hora", "horario", "sala", "bloco", "andar", "onde", "cronograma", "marcada"}
+PALAVRAS_CONTEUDO = {"conteudo", "materia", "cai"}
+PALAVRAS_PRAZO = {"prazo", "entrega", "entregar", "data", "quando", "dia", "vence", "limite"}
+PALAVRAS_REGRAS = {"regra", "norma", "instrucao"}
+PALAVRAS_INTEGRANTES = {"integrante", "grupo", "dupla", "membro"}
+# Perguntas sobre o professor que não são "quem ministra" nem o horário das aulas (seguem para o RAG)
+PALAVRAS_ATENDIMENTO = {"atendimento", "plantao", "monitoria", "email", "contato", "telefone"}
+
+# Tipo de avaliação (TipoAvaliacaoEnum) citado na pergunta
+TIPOS_AVALIACAO = {"np1": "NP1", "np2": "NP2", "sub": "SUB", "substitutiva": "SUB", "exame": "EXAME"}
+
+# "TCC" ou "trabalho de conclusão" sem número valem para as duas etapas
+TIPOS_TCC_SEM_NUMERO = {"tcc", "trabalho de conclusao", "trabalho de conclusão"}
+
+NOMES_TIPOS_TRABALHO = {
+    "TC 1": "TC 1", "TC 2": "TC 2", "APS": "APS",
+    "estagio": "estágio", "horas_complementares": "horas complementares",
+}
+
+
+@dataclass
+class DadosEstruturados:
+    disciplinas: dict[str, str] = field(default_factory=dict)  # id_disciplina -> nome
+    apelidos: list[tuple[str, str]] = field(default_factory=list)  # (nome normalizado, id_disciplina), maiores primeiro
+    cronogramas: dict[str, list[dict]] = field(default_factory=dict)  # id_disciplina -> aulas
+    avaliacoes: dict[str, list[dict]] = field(default_factory=dict)  # id_disciplina -> avaliações
+    professores: dict[str, list[str]] = field(default_factory=dict)  # id_disciplina -> nomes dos professores
+    cursos: dict[str, set[str]] = field(default_factory=dict)  # id_disciplina -> cursos que a oferecem
+    trabalhos: list[dict] = field(default_factory=list)
+    carregado_em: float = 0.0
+
+
+_dados: DadosEstruturados | None = None
+_lock = threading.Lock()
+_falhou_em = 0.0
+respondidas: Counter = Counter()  # intenção -> perguntas respondidas sem o RAG
+encaminhadas = 0  # Perguntas que seguiram para o RAG
+carregamentos = 0
+
+
+# ---------- Cópia em memória das tabelas ----------
+
+def _ler_tabela(tabela: str, colunas: str) -> list[dict]:
+    return supabase.table(tabela).select(colunas).execute().data or []
+
+
+def _apelidos(nome: str) -> set[str]:
+    """Formas normalizadas do nome da disciplina, com e sem algarismos romanos ("Cálculo I" / "calculo 1")."""
+    variacoes = (
+        nome,
+        converter_numero_para_romano(nome),
+        converter_romano_para_numero(nome),
+    )
+    return {apelido for apelido in (texto_de_busca(v) for v in variacoes) if apelido}
+
+
+def _carregar() -> DadosEstruturados:
+    dados = DadosEstruturados(carregado_em=time.monotonic())
+    for disciplina in _ler_tabela("disciplina", "id_disciplina, nome_disciplina"):
+        id_disciplina, nome = str(disciplina["id_disciplina"]), disciplina.get("nome_disciplina") or ""
+        dados.disciplinas[id_disciplina] = nome
+        dados.apelidos.extend((apelido, id_disciplina) for apelido in _apelidos(nome))
+    dados.apelidos.sort(key=lambda a: -len(a[0]))
+
+    for aula in _ler_tabela("cronograma", "*"):
+        dados.cronogramas.setdefault(str(aula.get("id_disciplina")), []).append(aula)
+    for avaliacao in _ler_tabela("avaliacao", "*"):
+        dados.avaliacoes.setdefault(str(avaliacao.get("id_disciplina")), []).append(avaliacao)
+
+    nomes_professores = {
+        str(p["id"]): " ".join(filter(None, [p.get("nome_professor"), p.get("sobrenome_professor")]))
+        for p in _ler_tabela("professor", "id, nome_professor, sobrenome_professor")
+    }
+    for associacao in _ler_tabela("professordisciplina", "id_professor, id_disciplina"):
+        nome = nomes_professores.get(str(associacao.get("id_professor")))
+        nomes = dados.professores.setdefault(str(associacao.get("id_disciplina")), [])
+        if nome and nome not in nomes:
+            nomes.append(nome)
+
+    for associacao in _ler_tabela("cursodisciplina", "id_curso, id_disciplina"):
+        dados.cursos.setdefault(str(associacao.get("id_disciplina")), set()).add(str(associacao.get("id_curso")))
+
+    dados.trabalhos = _ler_tabela("trabalho_academico", "*")
+    return dados
+
+
+def precisa_carregar() -> bool:
+    """True se a cópia das tabelas não existe ou expirou (carregar() faz consultas ao banco)."""
+    dados = _dados
+    return dados is None or time.monotonic() - dados.carregado_em >= settings.IA_INTENCOES_TTL_SEGUNDOS
+
+
+def carregar() -> DadosEstruturados | None:
+    """Lê as tabelas, se necessário. None se o banco falhou há pouco (a pergunta segue para o RAG)."""
+    global _dados, _falhou_em, carregamentos
+    with _lock:
+        if not precisa_carregar():
+            return _dados
+        if time.monotonic() - _falhou_em < PAUSA_APOS_FALHA_SEGUNDOS:
+            return None
+        inicio = time.perf_counter()
+        try:
+            _dados = _carregar()
+        except Exception as e:
+            _falhou_em = time.monotonic()
+            print(f"   [Intenções] Não foi possível ler as tabelas: {e}")
+            return None
+        carregamentos += 1
+        print(f"   [Intenções] {len(_dados.disciplinas)} disciplinas e {len(_dados.trabalhos)} trabalhos "
+              f"carregados em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return _dados
+
+
+def invalidar() -> None:
+    """Descarta a cópia em memória; a próxima pergunta lê as tabelas de novo."""
+    global _dados
+    with _lock:
+        _dados = None
+
+
+# ---------- Entidades da pergunta ----------
+
+def _disciplinas_citadas(dados: DadosEstruturados, pergunta_busca: str) -> list[str]:
+    """Disciplinas cujo nome aparece na pergunta; nomes contidos em um nome maior já citado não contam."""
+    citadas: list[str] = []
+    trechos: list[str] = []
+    texto = f" {pergunta_busca} "
+    for apelido, id_disciplina in dados.apelidos:
+        if f" {apelido} " in texto and id_disciplina not in citadas and not any(apelido in t for t in trechos):
+            citadas.append(id_disciplina)
+            trechos.append(apelido)
+    return citadas
+
+
+def _tipos_trabalho_citados(pergunta: str) -> list[str]:
+    """Tipos de trabalho (valores do enum) citados, reconhecidos pelo mesmo mapa da rota de trabalhos."""
+    palavras = re.findall(r"\w+", pergunta.lower())
+    tipos: list[str] = []
+    for tamanho in range(5, 0, -1):
+        for inicio in range(len(palavras) - tamanho + 1):
+            trecho = " ".join(palavras[inicio:inicio + tamanho])
+            tipo = normalizar_tipo_trabalho(trecho)
+            if tipo and tipo not in tipos:
+                tipos.append(tipo)
+    if not {"TC 1", "TC 2"} & set(tipos):
+        texto = " ".join(palavras)
+        if any(re.search(rf"\b{t}\b", texto) for t in TIPOS_TCC_SEM_NUMERO):
+            tipos.extend(["TC 1", "TC 2"])
+    return tipos
+
+
+# ---------- Semestre atual ----------
+
+def _semestre(data: date) -> str:
+    """Semestre no formato dos trabalhos acadêmicos ('2025.1' até junho, '2025.2' depois)."""
+    return f"{data.year}.{1 if data.month <= 6 else 2}"
+
+
+def _do_semestre(valor, semestre: str) -> bool:
+    # Aceita variações como "2025/1" ou "2025-1"
+    encontrado = re.match(r"\s*(\d{4})\D*([12])\b", str(valor or ""))
+    return encontrado is not None and f"{encontrado.group(1)}.{encontrado.group(2)}" == semestre
+
+
+def _data_do_semestre(valor, semestre: str) -> bool:
+    try:
+        return _semestre(date.fromisoformat(str(valor)[:10])) == semestre
+    except ValueError:
+        return False
+
+
+# ---------- Respostas ----------
+
+def _data(valor) -> str:
+    try:
+        return date.fromisoformat(str(valor)[:10]).strftime("%d/%m/%Y")
+    except ValueError:
+        return str(valor)
+
+
+def _hora(valor) -> str:
+    return str(valor)[:5] if valor else ""
+
+
+def _local(registro: dict) -> str:
+    partes = []
+    if registro.get("sala"):
+        partes.append(f"sala {registro['sala']}")
+    if registro.get("bloco"):
+        partes.append(f"bloco {registro['bloco']}")
+    if registro.get("andar") not in (None, ""):
+        partes.append(f"{registro['andar']}º andar")
+    return ", ".join(partes)
+
+
+def _lista(titulo: str, linhas: list[str]) -> str | None:
+    """Resposta em lista; None sem itens ou com itens demais para uma resposta direta."""
+    if not linhas or len(linhas) > settings.IA_INTENCOES_MAX_ITENS:
+        return None
+    return f"{titulo}\n" + "\n".join(linhas)
+
+
+def _responder_aulas(dados: DadosEstruturados, disciplinas: list[str]) -> str | None:
+    linhas = []
+    for id_disciplina in disciplinas:
+        for aula in sorted(dados.cronogramas.get(id_disciplina, []), key=lambda a: (a.get("dia_semana") or 8, str(a.get("hora_inicio")))):
+            descricao = f"- {dados.disciplinas[id_disciplina]}"
+            if aula.get("tipo_aula"):
+                descricao += f" ({aula['tipo_aula']})"
+            if aula.get("dia_semana") in DIAS_SEMANA:
+                descricao += f": {DIAS_SEMANA[aula['dia_semana']]}"
+            descricao += f", das {_hora(aula.get('hora_inicio'))} às {_hora(aula.get('hora_fim'))}"
+            if _local(aula):
+                descricao += f", {_local(aula)}"
+            linhas.append(descricao)
+    return _lista("Horários das aulas:", linhas)
+
+
+def _responder_professores(dados: DadosEstruturados, disciplinas: list[str]) -> str | None:
+    linhas = [
+        f"- {dados.disciplinas[id_disciplina]}: {', '.join(dados.professores[id_disciplina])}"
+        for id_disciplina in disciplinas if dados.professores.get(id_disciplina)
+    ]
+    return _lista("Professores responsáveis:", linhas)
+
+
+def _responder_avaliacoes(dados: DadosEstruturados, disciplinas: list[str], tipos: set[str], pede_conteudo: bool) -> str | None:
+    # Provas de semestres anteriores não respondem "quando é a prova"
+    semestre = _semestre(date.today())
+    linhas = []
+    for id_disciplina in disciplinas:
+        avaliacoes = [
+            a for a in dados.avaliacoes.get(id_disciplina, [])
+            if (not tipos or a.get("tipo_avaliacao") in tipos) and _data_do_semestre(a.get("data_prova"), semestre)
+        ]
+        for avaliacao in sorted(avaliacoes, key=lambda a: str(a.get("data_prova"))):
+            descricao = f"- {avaliacao.get('tipo_avaliacao')} de {dados.disciplinas[id_disciplina]}: {_data(avaliacao.get('data_prova'))}"
+            if avaliacao.get("hora_inicio"):
+                descricao += f", das {_hora(avaliacao['hora_inicio'])}"
+                if avaliacao.get("hora_fim"):
+                    descricao += f" às {_hora(avaliacao['hora_fim'])}"
+            if avaliacao.get("sala"):
+                descricao += f", sala {avaliacao['sala']}"
+            if avaliacao.get("conteudo"):
+                descricao += f". Conteúdo: {avaliacao['conteudo']}"
+            elif pede_conteudo:
+                return None  # Conteúdo não cadastrado: o RAG pode encontrá-lo no plano de ensino
+            linhas.append(descricao)
+    return _lista("Avaliações:", linhas)
+
+
+def _responder_trabalhos(dados: DadosEstruturados, tipos: list[str], citadas: list[str], palavras: set[str],
+                        disciplinas_do_aluno: frozenset[str] | None) -> str | None:
+    semestre = _semestre(date.today())
+    trabalhos = [t for t in dados.trabalhos if t.get("tipo") in tipos and _do_semestre(t.get("semestre"), semestre)]
+    if citadas:
+        trabalhos = [t for t in trabalhos if str(t.get("id_disciplina")) in citadas]
+    if disciplinas_do_aluno is not None:
+        # Trabalhos de disciplina: só os das disciplinas do aluno; os do curso todo (TCC,
+        # estágio): só os dos cursos que oferecem essas disciplinas
+        cursos = {c for d in disciplinas_do_aluno for c in dados.cursos.get(d, ())}
+        trabalhos = [
+            t for t in trabalhos
+            if (str(t["id_disciplina"]) in disciplinas_do_aluno if t.get("id_disciplina") else str(t.get("id_curso")) in cursos)
+        ]
+    if not trabalhos or len(trabalhos) > settings.IA_INTENCOES_MAX_ITENS:
+        return None
+    # O mesmo tipo de trabalho em cursos diferentes: não dá para saber qual deles a pergunta quer
+    cursos_por_tipo: dict[str, set[str]] = {}
+    for trabalho in trabalhos:
+        cursos_por_tipo.setdefault(trabalho.get("tipo"), set()).add(str(trabalho.get("id_curso")))
+    if any(len(cursos) > 1 for cursos in cursos_por_tipo.values()):
+        return None
+
+    linhas = []
+    for trabalho in sorted(trabalhos, key=lambda t: (str(t.get("tipo")), str(t.get("data_entrega")))):
+        titulo = NOMES_TIPOS_TRABALHO.get(trabalho.get("tipo"), str(trabalho.get("tipo")))
+        disciplina = dados.disciplinas.get(str(trabalho.get("id_disciplina")))
+        contexto = " - ".join(filter(None, [disciplina, trabalho.get("tema"), trabalho.get("semestre")]))
+        descricao = f"- {titulo}" + (f" ({contexto})" if contexto else "")
+        if palavras & PALAVRAS_REGRAS:
+            if not trabalho.get("regras"):
+                return None
+            descricao += f": {trabalho['regras']}"
+        elif palavras & PALAVRAS_INTEGRANTES:
+            if not trabalho.get("maximo_integrantes"):
+                return None
+            descricao += f": até {trabalho['maximo_integrantes']} integrantes"
+        else:
+            if not trabalho.get("data_entrega"):
+                return None
+            descricao += f": entrega até {_data(trabalho['data_entrega'])}"
+        linhas.append(descricao)
+    return "\n".join(linhas)
+
+
+def responder(pergunta: str, disciplinas_do_aluno: frozenset[str] | None = None) -> dict | None:
+    """
+    Responde a pergunta direto das tabelas, se ela for uma das consultas reconhecidas.
+    Sem disciplina citada, usa as do aluno ('disciplinas_do_aluno'), quando houver.
+    Retorna {"resposta", "intencao"} ou None (a pergunta segue para o RAG).
+    Precisa da cópia das tabelas já carregada (ver carregar()).
+    """
+    global encaminhadas
+    dados = _dados
+    resposta = None
+    if dados is not None:
+        resposta = _identificar_e_responder(dados, pergunta, disciplinas_do_aluno)
+    if resposta is None:
+        encaminhadas += 1
+        return None
+    respondidas[resposta["intencao"]] += 1
+    return resposta
+
+
+def _identificar_e_responder(dados: DadosEstruturados, pergunta: str, disciplinas_do_aluno: frozenset[str] | None) -> dict | None:
+    normalizada = normalizar(pergunta)
+    palavras = {radical(p) for p in normalizada.split()}
+    # "NP 1" e "NP1" são a mesma prova
+    palavras |= {f"np{n}" for n in re.findall(r"\bnp ?([12])\b", normalizada)}
+
+    citadas = _disciplinas_citadas(dados, texto_de_busca(pergunta))
+    disciplinas = citadas or sorted(d for d in disciplinas_do_aluno or () if d in dados.disciplinas)
+
+    # 1) Prazo, regras ou tamanho do grupo de um trabalho (TCC, APS, estágio, horas complementares)
+    tipos_trabalho = _tipos_trabalho_citados(pergunta)
+    if tipos_trabalho and palavras & (PALAVRAS_PRAZO | PALAVRAS_REGRAS | PALAVRAS_INTEGRANTES):
+        texto = _responder_trabalhos(dados, tipos_trabalho, citadas, palavras, disciplinas_do_aluno)
+        return {"resposta": texto, "intencao": "trabalho_academico"} if texto else None
+    if tipos_trabalho or not disciplinas:
+        return None
+
+    # 2) Data, horário, sala e conteúdo das provas
+    if palavras & PALAVRAS_AVALIACAO and palavras & (PALAVRAS_QUANDO_ONDE | PALAVRAS_CONTEUDO):
+        tipos = {TIPOS_AVALIACAO[p] for p in palavras if p in TIPOS_AVALIACAO}
+        texto = _responder_avaliacoes(dados, disciplinas, tipos, bool(palavras & PALAVRAS_CONTEUDO))
+        return {"resposta": texto, "intencao": "avaliacao"} if texto else None
+
+    # Horário de atendimento, e-mail ou contato do professor não são "quem ministra" nem o horário das aulas
+    if palavras & PALAVRAS_ATENDIMENTO:
+        return None
+
+    # 3) Quem ministra a disciplina ("quem é o professor de ...", "quem dá aula de ...")
+    # ("quando a professora ministra a aula de ..." é sobre o horário: fica para a regra 4)
+    pergunta_quem = (palavras & PALAVRAS_PROFESSOR and palavras & PALAVRAS_QUEM) or {"quem", "aula"} <= palavras
+    if pergunta_quem and not palavras & PALAVRAS_QUANDO_ONDE:
+        texto = _responder_professores(dados, disciplinas)
+        return {"resposta": texto, "intencao": "professor_disciplina"} if texto else None
+
+    # 4) Dia, horário e sala das aulas
+    if palavras & PALAVRAS_AULA and palavras & PALAVRAS_QUANDO_ONDE:
+        texto = _responder_aulas(dados, disciplinas)
+        return {"resposta": texto, "intencao": "cronograma"} if texto else None
+    return None
+
+
+def estatisticas() -> dict:
+    dados = _dados
+    return {
+        "respondidas": dict(respondidas),
+        "encaminhadas_ao_rag": encaminhadas,
+        "carregamentos": carregamentos,
+        "disciplinas": len(dados.disciplinas) if dados else 0,
+        "idade_segundos": round(time.monotonic() - dados.carregado_em, 1) if dados else None,
+    }
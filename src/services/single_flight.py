@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable
+
+# --- AGRUPAMENTO DE REQUISIÇÕES IGUAIS EM ANDAMENTO (SINGLE-FLIGHT) ---
+# Quando sai um aviso, vários alunos fazem a mesma pergunta ao mesmo tempo. Em vez de cada
+# requisição executar a sua própria busca e a sua própria chamada ao Gemini, a primeira
+# executa o trabalho e as que chegarem enquanto ele não termina aguardam o mesmo resultado.
+
+
+class SingleFlight:
+    def __init__(self):
+        self._em_andamento: dict[str, asyncio.Task] = {}
+        self.execucoes = 0
+        self.agrupadas = 0
+
+    async def executar(self, chave: str, funcao: Callable[[], Awaitable]):
+        """
+        Executa funcao() uma única vez por chave enquanto houver uma execução em andamento;
+        chamadas concorrentes com a mesma chave recebem o mesmo resultado (ou a mesma exceção).
+        """
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            self.execucoes += 1
+            tarefa = asyncio.ensure_future(funcao())
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._remover(chave, t))
+        else:
+            self.agrupadas += 1
+        # shield: se o cliente que iniciou a execução desconectar, as demais continuam esperando
+        return await asyncio.shield(tarefa)
+
+    def _remover(self, chave: str, tarefa: asyncio.Task) -> None:
+        if self._em_andamento.get(chave) is tarefa:
+            del self._em_andamento[chave]
+        if not tarefa.cancelled():
+            tarefa.exception()  # Evita o aviso de exceção não recuperada se todos desistirem
+
+    def metricas(self) -> dict:
+        total = self.execucoes + self.agrupadas
+        return {
+            "em_andamento": len(self._em_andamento),
+            "execucoes": self.execucoes,
+            "agrupadas": self.agrupadas,
+            "taxa_agrupamento": round(self.agrupadas / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,99 @@
+import json
+import re
+import unicodedata
+
+# --- NORMALIZAÇÃO DE TEXTO EM PORTUGUÊS PARA BUSCA ---
+# 'ilike' no banco diferencia "avaliação" de "avaliacao" e "provas" de "prova", o que obrigava
+# cada busca a tentar variações ou varrer a tabela inteira. As colunas de busca (sufixo
+# '_busca') guardam o texto já normalizado (minúsculas, sem acentos, sem pontuação, sem
+# stopwords e com um radical simples); são preenchidas em toda escrita e a busca aplica a
+# mesma normalização ao termo, então uma única consulta 'ilike' basta.
+
+# Palavras muito comuns que não ajudam a diferenciar documentos
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "da", "do", "das", "dos",
+    "e", "em", "no", "na", "nos", "nas", "ao", "aos", "que", "qual", "quais", "como",
+    "onde", "quando", "por", "para", "com", "sem", "sobre", "este", "esta", "isso",
+    "isto", "ser", "se", "eu", "me", "meu", "minha", "voce", "sao", "tem", "ha",
+}
+
+# Terminações de plural (já sem acento) -> singular. A primeira que casar é aplicada.
+SUFIXOS_PLURAL = (
+    ("oes", "ao"), ("aes", "ao"), ("aos", "ao"),  # avaliações, pães, cidadãos
+    ("ais", "al"), ("eis", "el"), ("ois", "ol"),  # materiais, papéis, faróis
+    ("res", "r"), ("zes", "z"), ("ns", "m"),      # professores, vezes, itens
+)
+
+# Colunas de busca de cada tabela: coluna original -> coluna normalizada
+COLUNAS_BUSCA = {
+    "baseconhecimento": {
+        "conteudo_processado": "conteudo_busca",
+        "categoria": "categoria_busca",
+        "nome_arquivo_origem": "nome_arquivo_busca",
+        "palavra_chave": "palavra_chave_busca",
+    },
+    "disciplina": {"nome_disciplina": "nome_disciplina_busca"},
+    "professor": {"nome_professor": "nome_professor_busca"},
+    "coordenador": {"nome_coordenador": "nome_coordenador_busca"},
+}
+
+
+def remover_acentos(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação e com espaços simples ('_' também separa palavras)."""
+    return " ".join(re.findall(r"[^\W_]+", remover_acentos(str(texto or "").lower())))
+
+
+def radical(palavra: str) -> str:
+    """Radical simples: só remove o plural ("avaliacoes" -> "avaliacao", "provas" -> "prova")."""
+    if len(palavra) <= 3:
+        return palavra
+    for sufixo, substituto in SUFIXOS_PLURAL:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 2:
+            return palavra[:-len(sufixo)] + substituto
+    if palavra.endswith("s") and not palavra.endswith("ss"):
+        return palavra[:-1]
+    return palavra
+
+
+def termos(texto: str) -> list[str]:
+    """Termos de busca do texto, na ordem em que aparecem."""
+    return [radical(t) for t in normalizar(texto).split() if t not in STOPWORDS]
+
+
+def texto_de_busca(valor) -> str:
+    """Valor a ser gravado numa coluna de busca. Listas (ex.: palavra_chave em JSON) viram texto."""
+    if isinstance(valor, str) and valor.lstrip().startswith("["):
+        try:
+            valor = json.loads(valor)
+        except (json.JSONDecodeError, ValueError):
+            pass
+    if isinstance(valor, list):
+        valor = " ".join(str(v) for v in valor)
+    return " ".join(termos(valor))
+
+
+def padrao_ilike(termo: str) -> str | None:
+    """Padrão para 'ilike' numa coluna de busca. None se não sobrar nenhum termo após a normalização."""
+    normalizado = texto_de_busca(termo)
+    return f"%{normalizado}%" if normalizado else None
+
+
+def coluna_de_busca(tabela: str, coluna: str) -> str:
+    return COLUNAS_BUSCA[tabela][coluna]
+
+
+def colunas_de_busca(tabela: str, payload: dict) -> dict:
+    """
+    Valores das colunas de busca para um insert/update em 'tabela'. Só inclui as colunas
+    cuja coluna original está no payload (um update parcial não apaga as demais).
+    """
+    return {
+        coluna_busca: texto_de_busca(payload[coluna]) if payload[coluna] is not None else None
+        for coluna, coluna_busca in COLUNAS_BUSCA.get(tabela, {}).items()
+        if coluna in payload
+    }
@@ -0,0 +1,387 @@
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+from ..config import settings
+from ..supabase_client import supabase
+from . import eventos_base
+from .indice_bm25 import IndiceBM25, tokenizar, TAMANHO_PAGINA
+from .matriculas import no_escopo
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - dependência opcional
+    PdfReader = None
+
+# --- TRECHOS DOS DOCUMENTOS ENVIADOS ---
+# No upload, além do resumo gerado pelo Gemini, o texto do documento é extraído e dividido em
+# trechos sobrepostos (com a posição de cada um no texto original), salvos na tabela
+# 'trechoconhecimento'. Na hora da pergunta, o /ia/gerar-resposta busca só os parágrafos
+# relevantes num índice BM25 local, em vez de reenviar o arquivo inteiro ao Gemini.
+
+TABELA_TRECHOS = "trechoconhecimento"
+CAMPOS_TRECHOS = "id_trecho, id_conhecimento, ordem, inicio, fim, conteudo, baseconhecimento!inner(nome_arquivo_origem, status, id_disciplina)"
+_NS_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+# ---------- Extração de texto ----------
+
+def _extrair_texto_pdf(caminho_arquivo: str) -> str:
+    if PdfReader is None:
+        print("   [Trechos] Biblioteca 'pypdf' não instalada; texto de PDF não extraído.")
+        return ""
+    leitor = PdfReader(caminho_arquivo)
+    return "\n\n".join((pagina.extract_text() or "") for pagina in leitor.pages)
+
+
+def _extrair_texto_docx(caminho_arquivo: str) -> str:
+    with zipfile.ZipFile(caminho_arquivo) as arquivo:
+        xml = arquivo.read("word/document.xml")
+    paragrafos = []
+    for paragrafo in ET.fromstring(xml).iter(f"{_NS_WORD}p"):
+        texto = "".join(t.text or "" for t in paragrafo.iter(f"{_NS_WORD}t"))
+        if texto.strip():
+            paragrafos.append(texto)
+    return "\n\n".join(paragrafos)
+
+
+def _extrair_texto_txt(caminho_arquivo: str) -> str:
+    with open(caminho_arquivo, "rb") as f:
+        conteudo = f.read()
+    try:
+        return conteudo.decode("utf-8")
+    except UnicodeDecodeError:
+        return conteudo.decode("latin-1")
+
+
+def extrair_texto(caminho_arquivo: str, content_type: str) -> str:
+    """
+    Extrai o texto de um arquivo PDF, DOCX ou TXT.
+    Retorna "" para formatos não suportados (ex.: .doc) ou em caso de erro.
+    """
+    extratores = {
+        "application/pdf": _extrair_texto_pdf,
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document": _extrair_texto_docx,
+        "text/plain": _extrair_texto_txt,
+    }
+    extrator = extratores.get(content_type)
+    if extrator is None:
+        return ""
+    try:
+        return extrator(caminho_arquivo)
+    except Exception as e:
+        print(f"   [Trechos] Não foi possível extrair o texto do documento: {e}")
+        return ""
+
+
+# ---------- Divisão em trechos ----------
+
+def _ajustar_fim(texto: str, inicio: int, fim: int) -> int:
+    """Recua o fim do trecho até um fim de parágrafo, de frase ou um espaço, se houver um por perto."""
+    if fim >= len(texto):
+        return len(texto)
+    minimo = inicio + (fim - inicio) // 2
+    for separador in ("\n\n", ". ", "\n", " "):
+        posicao = texto.rfind(separador, minimo, fim)
+        if posicao != -1:
+            return posicao + len(separador)
+    return fim
+
+
+def dividir_em_trechos(texto: str, tamanho: int | None = None, sobreposicao: int | None = None) -> list[dict]:
+    """
+    Divide o texto em trechos de até 'tamanho' caracteres, com 'sobreposicao' caracteres
+    repetidos entre trechos vizinhos. Cada trecho guarda sua posição (inicio, fim) no texto.
+    """
+    tamanho = tamanho or settings.IA_TRECHOS_TAMANHO_CARACTERES
+    sobreposicao = min(sobreposicao if sobreposicao is not None else settings.IA_TRECHOS_SOBREPOSICAO_CARACTERES, tamanho // 2)
+
+    trechos: list[dict] = []
+    inicio = 0
+    while inicio < len(texto):
+        fim = _ajustar_fim(texto, inicio, inicio + tamanho)
+        conteudo = texto[inicio:fim].strip()
+        if conteudo:
+            trechos.append({"ordem": len(trechos), "inicio": inicio, "fim": fim, "conteudo": conteudo})
+        if fim >= len(texto):
+            break
+        proximo = fim - sobreposicao
+        # Começa o próximo trecho no início de uma palavra
+        espaco = texto.find(" ", proximo, fim)
+        inicio = espaco + 1 if espaco != -1 else proximo
+    return trechos
+
+
+# ---------- Persistência ----------
+
+def salvar_trechos(registro: dict, texto: str) -> int:
+    """
+    Divide o texto do documento em trechos, substitui os trechos anteriores do registro
+    na tabela 'trechoconhecimento' e atualiza o índice local. Retorna a quantidade de trechos.
+    """
+    id_conhecimento = str(registro["id_conhecimento"])
+    trechos = dividir_em_trechos(texto) if texto else []
+    # Uma recarga dos trechos deste registro (ver _recarregar_trechos) não lê a tabela no meio da troca
+    with _lock_do_documento(id_conhecimento):
+        supabase.table(TABELA_TRECHOS).delete().eq("id_conhecimento", id_conhecimento).execute()
+        salvos: list[dict] = []
+        if trechos:
+            linhas = [{"id_conhecimento": id_conhecimento, **trecho} for trecho in trechos]
+            salvos = supabase.table(TABELA_TRECHOS).insert(linhas).execute().data or []
+            print(f"   [Trechos] {len(trechos)} trechos salvos para id_conhecimento={id_conhecimento}")
+        for trecho in salvos:
+            # Mesmo formato das linhas lidas com CAMPOS_TRECHOS
+            trecho["baseconhecimento"] = _metadados_do_registro(registro)
+        with _lock:
+            for alteracoes in _alteracoes_pendentes:
+                alteracoes.append((ACAO_TRECHOS, {"id_conhecimento": id_conhecimento, "trechos": salvos}))
+            if _construido_em is not None:
+                _substituir_trechos(id_conhecimento, salvos)
+    return len(trechos)
+
+
+# ---------- Índice BM25 dos trechos ----------
+
+_indice = IndiceBM25()
+_trechos_por_documento: dict[str, list[str]] = {}
+_lock = threading.RLock()
+_lock_construcao = threading.Lock()  # Só uma primeira construção; a leitura do banco não bloqueia o _lock
+_construido_em: float | None = None
+_reconstrucao_em_andamento = False
+_versoes_documento: Counter = Counter()  # id_conhecimento -> alterações recebidas (descarta recargas antigas)
+# Alterações recebidas enquanto uma reconstrução lê o banco (uma lista por reconstrução em andamento):
+# eventos da base (ver eventos_base) e trechos salvos (ACAO_TRECHOS)
+_alteracoes_pendentes: list[list[tuple[str, dict]]] = []
+ACAO_TRECHOS = "trechos"
+# Gravação e recarga dos trechos de um mesmo registro não se intercalam (um lock por faixa de ids)
+_locks_documentos = [threading.Lock() for _ in range(64)]
+
+
+def _lock_do_documento(id_conhecimento: str) -> threading.Lock:
+    return _locks_documentos[hash(id_conhecimento) % len(_locks_documentos)]
+
+
+def _adicionar_ao_indice(trecho: dict, indice: IndiceBM25 | None = None, por_documento: dict | None = None) -> None:
+    indice = indice if indice is not None else _indice
+    por_documento = por_documento if por_documento is not None else _trechos_por_documento
+    id_trecho = str(trecho["id_trecho"])
+    indice.adicionar(id_trecho, Counter(tokenizar(trecho.get("conteudo") or "")), trecho)
+    por_documento.setdefault(str(trecho["id_conhecimento"]), []).append(id_trecho)
+
+
+def _remover_do_indice(id_conhecimento: str, indice: IndiceBM25 | None = None, por_documento: dict | None = None) -> None:
+    indice = indice if indice is not None else _indice
+    por_documento = por_documento if por_documento is not None else _trechos_por_documento
+    for id_trecho in por_documento.pop(id_conhecimento, []):
+        indice.remover(id_trecho)
+
+
+def _substituir_trechos(id_conhecimento: str, trechos: list[dict], indice: IndiceBM25 | None = None,
+                        por_documento: dict | None = None) -> None:
+    """Troca os trechos do registro no índice (só entram os de registros publicados)."""
+    _remover_do_indice(id_conhecimento, indice, por_documento)
+    for trecho in trechos:
+        if (trecho.get("baseconhecimento") or {}).get("status") == "publicado":
+            _adicionar_ao_indice(trecho, indice, por_documento)
+
+
+def _aplicar_alteracao(acao: str, registro: dict, indice: IndiceBM25 | None = None,
+                       por_documento: dict | None = None) -> bool:
+    """
+    Aplica um evento da base (ou trechos salvos) no índice. Retorna True se o registro foi
+    (re)publicado e os trechos dele não estão no índice: é preciso lê-los do banco.
+    """
+    indice = indice if indice is not None else _indice
+    por_documento = por_documento if por_documento is not None else _trechos_por_documento
+    id_conhecimento = str(registro["id_conhecimento"])
+    if acao == ACAO_TRECHOS:
+        _substituir_trechos(id_conhecimento, registro["trechos"], indice, por_documento)
+        return False
+    # Trechos de registros removidos ou despublicados deixam de ser retornados; os de um registro
+    # publicado passam a ter o nome, o status e a disciplina atuais dele
+    if acao == eventos_base.ACAO_REMOCAO or registro.get("status") != "publicado":
+        _remover_do_indice(id_conhecimento, indice, por_documento)
+        return False
+    ids_trechos = por_documento.get(id_conhecimento)
+    if not ids_trechos:
+        return True
+    for id_trecho in ids_trechos:
+        indice.documentos[id_trecho]["baseconhecimento"] = _metadados_do_registro(registro)
+    return False
+
+
+def carregar_trechos_publicados() -> list[dict]:
+    """Busca, página por página, os trechos dos registros publicados da base de conhecimento."""
+    trechos: list[dict] = []
+    inicio = 0
+    while True:
+        response = (
+            supabase.table(TABELA_TRECHOS)
+            .select(CAMPOS_TRECHOS)
+            .eq("baseconhecimento.status", "publicado")
+            .range(inicio, inicio + TAMANHO_PAGINA - 1)
+            .execute()
+        )
+        pagina = response.data or []
+        trechos.extend(pagina)
+        if len(pagina) < TAMANHO_PAGINA:
+            return trechos
+        inicio += TAMANHO_PAGINA
+
+
+def reconstruir_indice() -> int:
+    """
+    Reconstrói o índice de trechos a partir do banco. As alterações notificadas durante a
+    leitura do banco são aplicadas de novo no índice novo.
+    Retorna a quantidade de trechos indexados.
+    """
+    global _indice, _trechos_por_documento, _construido_em
+    inicio = time.perf_counter()
+    alteracoes: list[tuple[str, dict]] = []
+    recarregar: dict[str, tuple[dict, int]] = {}
+    with _lock:
+        _alteracoes_pendentes.append(alteracoes)
+    try:
+        novo_indice = IndiceBM25()
+        por_documento: dict[str, list[str]] = {}
+        for trecho in carregar_trechos_publicados():
+            _adicionar_ao_indice(trecho, novo_indice, por_documento)
+
+        with _lock:
+            # A leitura pode ter acontecido antes dessas escritas (reaplicar é idempotente)
+            for acao, registro in alteracoes:
+                id_conhecimento = str(registro["id_conhecimento"])
+                if _aplicar_alteracao(acao, registro, novo_indice, por_documento):
+                    recarregar[id_conhecimento] = (registro, _versoes_documento[id_conhecimento])
+                else:
+                    recarregar.pop(id_conhecimento, None)
+            _indice = novo_indice
+            _trechos_por_documento = por_documento
+            _construido_em = time.time()
+    finally:
+        with _lock:
+            _alteracoes_pendentes.remove(alteracoes)
+    for registro, versao in recarregar.values():
+        threading.Thread(target=_recarregar_trechos, args=(registro, versao), daemon=True).start()
+
+    print(f"   [Trechos] {len(novo_indice)} trechos indexados em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    return len(novo_indice)
+
+
+def _reconstruir_em_segundo_plano() -> None:
+    global _reconstrucao_em_andamento
+    try:
+        reconstruir_indice()
+    except Exception as e:
+        print(f"   [Trechos] Falha ao reconstruir em segundo plano: {e}")
+    finally:
+        _reconstrucao_em_andamento = False
+
+
+def garantir_indice() -> bool:
+    """Mesma política do índice BM25 da base: constrói na primeira vez e renova após o TTL."""
+    global _reconstrucao_em_andamento
+    if _construido_em is None:
+        try:
+            with _lock_construcao:
+                if _construido_em is None:
+                    reconstruir_indice()
+        except Exception as e:
+            print(f"   [Trechos] Não foi possível construir o índice: {e}")
+            return False
+        return True
+
+    if time.time() - _construido_em > settings.IA_INDICE_TTL_SEGUNDOS and not _reconstrucao_em_andamento:
+        _reconstrucao_em_andamento = True
+        threading.Thread(target=_reconstruir_em_segundo_plano, daemon=True).start()
+    return True
+
+
+def buscar(pergunta: str, limite: int | None = None, disciplinas: frozenset[str] | None = None) -> list[tuple[dict, float]]:
+    """
+    Retorna os trechos mais relevantes para a pergunta, como (trecho, score).
+    Com 'disciplinas', só os trechos de registros gerais ou dessas disciplinas.
+    """
+    termos = tokenizar(pergunta)
+    with _lock:
+        indice = _indice
+
+        def _permitido(id_trecho: str) -> bool:
+            return no_escopo(indice.documentos[id_trecho].get("baseconhecimento") or {}, disciplinas)
+
+        resultados = indice.buscar(
+            termos, limite or settings.IA_TRECHOS_MAX_RESULTADOS, _permitido if disciplinas is not None else None
+        )
+        return [(_indice.documentos[id_trecho], score) for id_trecho, score in resultados]
+
+
+def score_referencia(pergunta: str) -> float:
+    """Score que corresponde à relevância 1.0 para a pergunta (ver IndiceBM25.score_referencia)."""
+    with _lock:
+        return _indice.score_referencia(tokenizar(pergunta))
+
+
+def formatar_trecho(trecho: dict) -> str:
+    """Texto do trecho como contexto do prompt, identificando o documento de origem."""
+    origem = (trecho.get("baseconhecimento") or {}).get("nome_arquivo_origem")
+    return f"[{origem}] {trecho['conteudo']}" if origem else trecho["conteudo"]
+
+
+def estatisticas() -> dict:
+    with _lock:
+        return {
+            "trechos_indexados": len(_indice),
+            "documentos_com_trechos": len(_trechos_por_documento),
+            "construido_em": _construido_em,
+        }
+
+
+def _metadados_do_registro(registro: dict) -> dict:
+    # Mesmo formato do recurso embutido 'baseconhecimento' das linhas lidas com CAMPOS_TRECHOS
+    return {
+        "nome_arquivo_origem": registro.get("nome_arquivo_origem"),
+        "status": registro.get("status"),
+        "id_disciplina": registro.get("id_disciplina"),
+    }
+
+
+def _recarregar_trechos(registro: dict, versao: int) -> None:
+    """Lê do banco os trechos de um registro (re)publicado e os coloca no índice."""
+    id_conhecimento = str(registro["id_conhecimento"])
+    # Não lê a tabela enquanto salvar_trechos troca os trechos do registro: ou lê antes (e a
+    # gravação substitui o que foi carregado) ou depois, já com os trechos novos
+    with _lock_do_documento(id_conhecimento):
+        try:
+            response = supabase.table(TABELA_TRECHOS).select(CAMPOS_TRECHOS).eq("id_conhecimento", id_conhecimento).execute()
+        except Exception as e:
+            print(f"   [Trechos] Não foi possível ler os trechos de id_conhecimento={id_conhecimento}: {e}")
+            return
+        with _lock:
+            # Uma alteração mais nova do registro (ex.: despublicado de novo) já foi aplicada
+            if _versoes_documento[id_conhecimento] != versao:
+                return
+            for trecho in response.data or []:
+                trecho["baseconhecimento"] = _metadados_do_registro(registro)
+            _substituir_trechos(id_conhecimento, response.data or [])
+    if response.data:
+        print(f"   [Trechos] {len(response.data)} trechos de id_conhecimento={id_conhecimento} de volta ao índice")
+
+
+@eventos_base.registrar_ouvinte
+def _ao_alterar_base(acao: str, registro: dict) -> None:
+    id_conhecimento = str(registro["id_conhecimento"])
+    with _lock:
+        # Uma reconstrução em andamento pode ter lido o banco antes desta escrita
+        for alteracoes in _alteracoes_pendentes:
+            alteracoes.append((acao, registro))
+        # Enquanto o índice não foi construído não há o que atualizar: a primeira busca já lê o banco
+        if _construido_em is None:
+            return
+        _versoes_documento[id_conhecimento] += 1
+        versao = _versoes_documento[id_conhecimento]
+        if not _aplicar_alteracao(acao, registro):
+            return
+    # Registro (re)publicado sem trechos no índice: os trechos continuam na tabela e são lidos
+    # fora da requisição que fez a escrita
+    threading.Thread(target=_recarregar_trechos, args=(registro, versao), daemon=True).start()